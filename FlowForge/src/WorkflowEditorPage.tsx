@@ -30,6 +30,8 @@ export default function WorkflowEditorPage() {
   const [socketInstance, setSocketInstance] =
     useState<WorkflowWebSocket | null>(null);
   const [isDebugModel, setIsDebugModel] = useState(false);
+  // 增量执行默认关闭：开启后配置和输入都没变的节点复用上次运行的结果
+  const [isIncremental, setIsIncremental] = useState(false);
   const [workflowName, setWorkflowName] = useState<string>(
     workflowId === "new" ? "Untitled Workflow" : `Workflow ${workflowId}`
   );
@@ -179,7 +181,30 @@ export default function WorkflowEditorPage() {
     output: any;
     error?: any;
     input?: any;
+    event?: string;
+    delta?: string;
   }) => {
+    // 流式输出的增量文本，追加到节点当前的输出上
+    if (message.event === "token") {
+      const runtime = useWorkflowStore
+        .getState()
+        .nodes.find((node) => node.id === message.nodeId)?.data?.runtime;
+      const previous = runtime?.streaming ? runtime.output : "";
+      updateNode(message.nodeId, {
+        runtime: {
+          nodeId: message.nodeId,
+          isSuccess: true,
+          streaming: true,
+          output: previous + (message.delta ?? ""),
+        },
+      });
+      return;
+    }
+    // 其他运行事件不对应节点执行结果
+    if (message.event) {
+      return;
+    }
+
     if (message.isSuccess) {
       updateNodeStyle(message.nodeId, { border: "2px solid #10B981" });
     } else {
@@ -216,7 +241,9 @@ export default function WorkflowEditorPage() {
       },
       () => {
         setIsSocketConnected(false);
-      }
+      },
+      // 增量执行：配置和输入都没变的节点直接复用上次运行的结果（runtime.fingerprint）
+      isIncremental ? { incremental: "1" } : undefined
     );
     ws.connect(handleRuntimeMessage);
     setSocketInstance(ws);
@@ -401,6 +428,21 @@ export default function WorkflowEditorPage() {
               </button>
             )}
 
+            {isDebugModel && (
+              <label
+                className="flex items-center px-2 text-sm text-gray-700 select-none"
+                title="配置和输入都没变的节点复用上次运行的结果"
+              >
+                <input
+                  type="checkbox"
+                  checked={isIncremental}
+                  onChange={(e) => setIsIncremental(e.target.checked)}
+                  className="mr-1"
+                />
+                增量执行
+              </label>
+            )}
+
             {isDebugModel && (
               <button
                 onClick={handleRunWorkflow}
@@ -7,11 +7,13 @@ export class WorkflowWebSocket {
   constructor(
     workflowId: string,
     private onOpenCallback?: () => void,
-    private onCloseCallback?: () => void
+    private onCloseCallback?: () => void,
+    params?: Record<string, string>
   ) {
     const ip = import.meta.env.VITE_WORKFLOW_IP;
     const port = import.meta.env.VITE_WORKFLOW_PORT;
-    this.url = `ws://${ip}:${port}/workflow/runtime/${workflowId}`;
+    const query = params ? `?${new URLSearchParams(params).toString()}` : "";
+    this.url = `ws://${ip}:${port}/workflow/runtime/${workflowId}${query}`;
     this.messageHandler = () => {};
   }
 
@@ -0,0 +1 @@
+"""工作流引擎基准测试：本地桩服务、合成工作流生成器和压测脚本"""
@@ -0,0 +1,194 @@
+"""
+JSON 编解码微基准：标准库 json 与 workflow_codec 在各个热点路径上的对比
+
+输入是仓库中的 workflow.json（编辑器导出的真实工作流）、放大后的同结构工作流，以及 API 节点的节点事件。
+在 workflow_server 目录下运行：
+    python -m bench.codec_bench
+    python -m bench.codec_bench --scale 20 --output codec_results.json
+
+每一项报告单次操作的耗时（微秒，多轮取最好）和相对标准库的加速比。
+WORKFLOW_JSON_BACKEND=json 时 workflow_codec 也使用标准库，可以用来确认回退路径的开销。
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import time
+from typing import Dict, Any, List, Callable
+
+from workflow_codec import JSON_BACKEND, dumpb, dumps, loads
+
+
+def _std_dumps(value: Any) -> str:
+    # starlette send_json 使用的参数
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+def best_of(fn: Callable[[], Any], repeat: int, min_time: float) -> float:
+    """每轮至少运行 min_time 秒，返回最好一轮的单次耗时（秒）"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - started >= min_time:
+            break
+        number *= 2
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+def scaled_workflow(workflow: Dict[str, Any], scale: int) -> Dict[str, Any]:
+    """把工作流的节点和连线复制 scale 份（ID 加后缀），模拟大型工作流"""
+    nodes, edges = [], []
+    for copy_index in range(scale):
+        suffix = f"-{copy_index}"
+        for node in workflow['nodes']:
+            node = copy.deepcopy(node)
+            node['id'] += suffix
+            nodes.append(node)
+        for edge in workflow['edges']:
+            edge = dict(edge, source=edge['source'] + suffix, target=edge['target'] + suffix)
+            edge['id'] = edge.get('id', '') + suffix
+            edges.append(edge)
+    return dict(workflow, nodes=nodes, edges=edges)
+
+
+def api_event(items: int) -> Dict[str, Any]:
+    """API 节点完成时推送的消息，响应体为 items 条记录"""
+    return {
+        'input': {'seed': 1},
+        'isSuccess': True,
+        'nodeId': 'node-api',
+        'output': {
+            'status_code': 200,
+            'headers': {'Content-Type': 'application/json; charset=utf-8', 'Content-Length': '1024'},
+            'data': {'items': [{'id': i, 'name': f"记录-{i}", 'price': i * 1.5, 'ok': i % 2 == 0}
+                               for i in range(items)]},
+            'request': {'method': 'GET', 'url': 'http://127.0.0.1:18080/items', 'headers': {}, 'body': {}},
+        },
+    }
+
+
+def build_cases(workflow: Dict[str, Any], scale: int, items: int) -> List[Dict[str, Any]]:
+    """每一项包含名称、数据大小、标准库实现和 workflow_codec 实现"""
+    big = scaled_workflow(workflow, scale)
+    event = api_event(items)
+    api_body = {'query': '${input.query}', 'filters': {'ids': list(range(50)), 'name': '${global.name}'}}
+    strings = ['{"name": "Alice", "scores": [90, 85, 95]}', '[1, 2, 3, "four"]', '42', '3.14', 'hello world']
+    cases = []
+    for label, data in (('workflow', workflow), (f"workflow x{scale}", big)):
+        # 前端发送的是再编码一次的工作流 JSON
+        frame = json.dumps(json.dumps(data, ensure_ascii=False), ensure_ascii=False)
+        frame_bytes = frame.encode('utf-8')
+        config_json = json.dumps(data)
+        cases += [
+            {'name': f"receive {label}", 'bytes': len(frame_bytes),
+             'std': lambda f=frame: json.loads(json.loads(f)),
+             'codec': lambda f=frame: loads(loads(f))},
+            {'name': f"db save {label}", 'bytes': len(config_json),
+             'std': lambda d=data: json.dumps(d),
+             'codec': lambda d=data: dumps(d)},
+            {'name': f"db load {label}", 'bytes': len(config_json),
+             'std': lambda c=config_json: json.loads(c),
+             'codec': lambda c=config_json: loads(c)},
+        ]
+    event_json = _std_dumps(event)
+    response_body = json.dumps(event['output']['data']).encode('utf-8')
+    cases += [
+        {'name': f"send event ({items} items) str", 'bytes': len(event_json.encode('utf-8')),
+         'std': lambda: _std_dumps(event), 'codec': lambda: dumps(event)},
+        {'name': f"send event ({items} items) bytes", 'bytes': len(event_json.encode('utf-8')),
+         'std': lambda: _std_dumps(event).encode('utf-8'), 'codec': lambda: dumpb(event)},
+        {'name': f"decode response ({items} items)", 'bytes': len(response_body),
+         'std': lambda: json.loads(response_body), 'codec': lambda: loads(response_body)},
+        {'name': 'api body template', 'bytes': len(json.dumps(api_body)),
+         'std': lambda: json.loads(json.dumps(api_body)),
+         'codec': lambda: loads(dumps(api_body))},
+        {'name': 'parse_string_2_multi x5', 'bytes': sum(map(len, strings)),
+         'std': lambda: [_std_parse(s) for s in strings],
+         'codec': lambda: [_codec_parse(s) for s in strings]},
+    ]
+    return cases
+
+
+def _std_parse(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+def _codec_parse(text: str) -> Any:
+    try:
+        return loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+def _normalized(value: Any) -> Any:
+    return json.loads(value) if isinstance(value, (str, bytes)) else value
+
+
+def run_case(case: Dict[str, Any], repeat: int, min_time: float) -> Dict[str, Any]:
+    std = best_of(case['std'], repeat, min_time)
+    codec = best_of(case['codec'], repeat, min_time)
+    return {
+        'case': case['name'],
+        'bytes': case['bytes'],
+        'std_us': round(std * 1e6, 2),
+        'codec_us': round(codec * 1e6, 2),
+        'speedup': round(std / codec, 2) if codec else 0.0,
+    }
+
+
+def print_table(results: List[Dict[str, Any]]):
+    header = f"{'case':<34} {'bytes':>9} {'json us':>10} {'codec us':>10} {'speedup':>8}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['case']:<34} {r['bytes']:>9} {r['std_us']:>10.2f} {r['codec_us']:>10.2f} {r['speedup']:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON codec micro benchmark')
+    parser.add_argument('--workflow', default=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'workflow.json'))
+    parser.add_argument('--scale', type=int, default=20, help='copies of the workflow in the large case')
+    parser.add_argument('--items', type=int, default=1000, help='records in the API node event')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.05, help='seconds per round')
+    parser.add_argument('--output', help='save results as JSON')
+    args, _ = parser.parse_known_args()
+
+    with open(args.workflow, 'r', encoding='utf-8') as f:
+        workflow = json.load(f)
+
+    results = []
+    for case in build_cases(workflow, args.scale, args.items):
+        # 两种实现的结果必须等价（编码结果比较解析后的值），否则对比没有意义
+        assert _normalized(case['std']()) == _normalized(case['codec']()), case['name']
+        results.append(run_case(case, args.repeat, args.min_time))
+
+    print(f"backend: {JSON_BACKEND}")
+    print_table(results)
+    if args.output:
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'backend': JSON_BACKEND,
+            'config': {key: value for key, value in vars(args).items() if key != 'output'},
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nresults saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
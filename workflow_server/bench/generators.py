@@ -0,0 +1,128 @@
+"""
+合成工作流生成器，生成与编辑器导出相同结构的 JSON（nodes/edges），可直接交给 Workflow
+
+每个生成器都是确定性的（随机图使用固定种子），同样的参数总是得到同样的工作流。
+"""
+import random
+from typing import Dict, Any, List, Optional
+
+
+def _node(node_id: str, node_type: str, **data) -> Dict[str, Any]:
+    return {'id': node_id, 'type': node_type,
+            'data': {'type': node_type, 'label': node_id, 'description': '', **data}}
+
+
+def _edge(source: str, target: str, handle: Optional[str] = None) -> Dict[str, Any]:
+    return {'id': f"e-{source}-{target}", 'source': source, 'target': target, 'sourceHandle': handle}
+
+
+def _input() -> Dict[str, Any]:
+    return _node('input', 'input', action='{"seed": 1}')
+
+
+def _local_node(node_id: str, index: int) -> Dict[str, Any]:
+    """
+    不访问网络的节点，转换、条件、输出交替出现。
+    TransformNode 会把输入的 repr 拼进输出，连续的转换节点会让数据量指数增长，
+    条件节点（输出布尔值）把它截断。
+    """
+    kind = index % 3
+    if kind == 0:
+        return _node(node_id, 'transform', action='转换')
+    if kind == 1:
+        return _node(node_id, 'conditional', condition='1 == 1')
+    return _node(node_id, 'output', action='输出')
+
+
+def _link(nodes: Dict[str, Dict[str, Any]], source: str, target: str) -> Dict[str, Any]:
+    # 条件节点只有 true/false 分支，普通连线用 true
+    handle = 'true' if nodes[source]['data']['type'] == 'conditional' else None
+    return _edge(source, target, handle)
+
+
+def long_chain(length: int = 1000) -> Dict[str, Any]:
+    """input -> n1 -> n2 -> ... -> n<length>"""
+    nodes = {'input': _input()}
+    edges = []
+    previous = 'input'
+    for index in range(length):
+        node_id = f"n{index}"
+        nodes[node_id] = _local_node(node_id, index)
+        edges.append(_link(nodes, previous, node_id))
+        previous = node_id
+    return {'name': f"chain-{length}", 'nodes': list(nodes.values()), 'edges': edges}
+
+
+def wide_fan(branches: int = 500, join_policy: str = 'all') -> Dict[str, Any]:
+    """input -> fanIn -> branches 个并行分支 -> fanOut -> output"""
+    nodes = [_input(), _node('fan_in', 'fanIn'),
+             _node('fan_out', 'fanOut', parallelPaths=branches, joinPolicy=join_policy),
+             _node('output', 'output', action='输出')]
+    edges = [_edge('input', 'fan_in')]
+    for index in range(branches):
+        node_id = f"b{index}"
+        nodes.append(_node(node_id, 'transform', action='转换'))
+        edges.append(_edge('fan_in', node_id))
+        edges.append(_edge(node_id, 'fan_out'))
+    edges.append(_edge('fan_out', 'output'))
+    return {'name': f"fan-{branches}", 'nodes': nodes, 'edges': edges}
+
+
+def conditional_tree(depth: int = 10) -> Dict[str, Any]:
+    """
+    深度为 depth 的二叉条件树，每层的条件真假交替，
+    只有一条路径会执行，其余分支全部被跳过（测试跳过传播的开销）
+    """
+    nodes = [_input()]
+    edges = []
+    level = ['input']
+    for layer in range(depth):
+        next_level = []
+        for position, parent in enumerate(level):
+            node_id = f"c{layer}_{position}"
+            condition = '1 == 1' if (layer + position) % 2 == 0 else '1 == 2'
+            nodes.append(_node(node_id, 'conditional', condition=condition))
+            if parent == 'input':
+                edges.append(_edge(parent, node_id))
+            else:
+                edges.append(_edge(parent, node_id, 'true' if position % 2 == 0 else 'false'))
+            next_level.append(node_id)
+        # 每个条件节点有 true/false 两个子节点
+        level = [node_id for node_id in next_level for _ in (0, 1)]
+    for position, parent in enumerate(level):
+        node_id = f"leaf{position}"
+        nodes.append(_node(node_id, 'output', action='输出'))
+        edges.append(_edge(parent, node_id, 'true' if position % 2 == 0 else 'false'))
+    return {'name': f"tree-{depth}", 'nodes': nodes, 'edges': edges}
+
+
+def mixed_graph(base_url: str, layers: int = 6, width: int = 8, seed: int = 42,
+                llm_ratio: float = 0.5) -> Dict[str, Any]:
+    """
+    分层随机 DAG，节点为 LLM（桩服务的 /v1/chat/completions）或 API（桩服务的 REST 接口），
+    每个节点连向上一层的 1~2 个节点。LLM 节点关闭缓存，每个节点的消息不同，避免被合并。
+    """
+    rng = random.Random(seed)
+    host, _, port = base_url.split('://', 1)[-1].partition(':')
+    nodes = [_input()]
+    edges = []
+    previous = ['input']
+    for layer in range(layers):
+        current = []
+        for position in range(width):
+            node_id = f"m{layer}_{position}"
+            if rng.random() < llm_ratio:
+                nodes.append(_node(node_id, 'llm', ip=host, port=int(port), model='stub', temperature=0,
+                                   maxTokens=64, cache=False,
+                                   messages=[{'role': 'user', 'content': f"node {node_id}: ${{input}}"}]))
+            else:
+                nodes.append(_node(node_id, 'api', method='GET', url=f"{base_url}/api/{node_id}?size=3",
+                                   headers={}, body='{}', timeout=30, incremental=False))
+            for parent in rng.sample(previous, min(len(previous), rng.randint(1, 2))):
+                edges.append(_edge(parent, node_id))
+            current.append(node_id)
+        previous = current
+    nodes.append(_node('output', 'output', action='输出'))
+    for parent in previous:
+        edges.append(_edge(parent, 'output'))
+    return {'name': f"mixed-{layers}x{width}", 'nodes': nodes, 'edges': edges}
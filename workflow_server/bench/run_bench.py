@@ -0,0 +1,194 @@
+"""
+工作流引擎基准测试
+
+在 workflow_server 目录下运行：
+    python -m bench.run_bench --runs 20 --output bench_results.json
+    python -m bench.run_bench --scenarios mixed --latency 50 --jitter 20 --engine async --concurrency 8
+    python -m bench.run_bench --compare bench_results.json
+
+报告每个场景的吞吐（次/秒、执行的节点/秒）、单次运行延迟的 p50/p99、每个节点的平均开销
+（桩服务延迟为 0 时即引擎本身的开销）以及进程的峰值 RSS，结果保存为 JSON 便于长期对比。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable, Tuple
+
+# 压测时只保留警告以上的日志，必须在导入引擎之前设置
+os.environ.setdefault("WORKFLOW_LOG_LEVEL", "WARNING")
+
+from bench.generators import long_chain, wide_fan, conditional_tree, mixed_graph  # noqa: E402
+from bench.stats import percentile  # noqa: E402
+from bench.stub_backends import StubConfig, StubServer  # noqa: E402
+from workflow import Workflow  # noqa: E402
+
+
+def peak_rss_mb() -> float:
+    """进程峰值常驻内存（Linux 上 ru_maxrss 单位为 KB，macOS 上为字节）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def build_scenarios(base_url: str, args) -> Dict[str, Callable[[], Dict[str, Any]]]:
+    return {
+        'chain': lambda: long_chain(args.chain_length),
+        'fan': lambda: wide_fan(args.fan_branches),
+        'tree': lambda: conditional_tree(args.tree_depth),
+        'mixed': lambda: mixed_graph(base_url, args.mixed_layers, args.mixed_width, args.seed),
+    }
+
+
+def _run_once(workflow_json: Dict[str, Any], engine: str) -> Tuple[float, int]:
+    workflow = Workflow(workflow_json)
+    started = time.perf_counter()
+    if engine == 'async':
+        asyncio.run(workflow.aexecute())
+    else:
+        workflow.execute()
+    return time.perf_counter() - started, len(workflow.context.execution_history)
+
+
+async def _run_batch_async(workflow_json: Dict[str, Any], runs: int, concurrency: int) -> List[Tuple[float, int]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            workflow = Workflow(workflow_json)
+            started = time.perf_counter()
+            await workflow.aexecute()
+            return time.perf_counter() - started, len(workflow.context.execution_history)
+
+    return await asyncio.gather(*(one() for _ in range(runs)))
+
+
+def run_scenario(name: str, workflow_json: Dict[str, Any], args) -> Dict[str, Any]:
+    """预热后执行 runs 次，concurrency > 1 时同时执行多次运行"""
+    for _ in range(args.warmup):
+        _run_once(workflow_json, args.engine)
+
+    started = time.perf_counter()
+    if args.concurrency <= 1:
+        results = [_run_once(workflow_json, args.engine) for _ in range(args.runs)]
+    elif args.engine == 'async':
+        results = asyncio.run(_run_batch_async(workflow_json, args.runs, args.concurrency))
+    else:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda _: _run_once(workflow_json, 'thread'), range(args.runs)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, _ in results]
+    executed = [count for _, count in results]
+    nodes_per_run = statistics.mean(executed) if executed else 0
+    return {
+        'scenario': name,
+        'workflow': workflow_json['name'],
+        'nodes': len(workflow_json['nodes']),
+        'executed_nodes': nodes_per_run,
+        'runs': len(results),
+        'elapsed_s': round(elapsed, 4),
+        'throughput_runs_s': round(len(results) / elapsed, 3) if elapsed else 0.0,
+        'throughput_nodes_s': round(sum(executed) / elapsed, 1) if elapsed else 0.0,
+        'latency_p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'latency_p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'latency_mean_ms': round(statistics.mean(latencies) * 1000, 3) if latencies else 0.0,
+        # 按工作流的全部节点平均，被跳过的节点也需要调度
+        'per_node_us': round(percentile(latencies, 50) / len(workflow_json['nodes']) * 1e6, 2),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+def compare(previous_path: str, current: Dict[str, Any]):
+    """与之前保存的结果逐场景对比 p50 延迟和吞吐"""
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = {result['scenario']: result for result in json.load(f)['results']}
+    print(f"\ncompared with {previous_path}:")
+    for result in current['results']:
+        before = previous.get(result['scenario'])
+        if before is None:
+            continue
+        p50 = (result['latency_p50_ms'] / before['latency_p50_ms'] - 1) * 100 if before['latency_p50_ms'] else 0
+        tput = (result['throughput_nodes_s'] / before['throughput_nodes_s'] - 1) * 100 \
+            if before['throughput_nodes_s'] else 0
+        print(f"  {result['scenario']:<8} p50 {before['latency_p50_ms']:>10.2f} -> {result['latency_p50_ms']:>10.2f} ms"
+              f" ({p50:+.1f}%)   nodes/s {before['throughput_nodes_s']:>10.1f} -> "
+              f"{result['throughput_nodes_s']:>10.1f} ({tput:+.1f}%)")
+
+
+def print_table(results: List[Dict[str, Any]]):
+    header = f"{'scenario':<8} {'nodes':>6} {'runs':>5} {'runs/s':>9} {'nodes/s':>10} " \
+             f"{'p50 ms':>10} {'p99 ms':>10} {'us/node':>9} {'rss MB':>8}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['scenario']:<8} {r['nodes']:>6} {r['runs']:>5} {r['throughput_runs_s']:>9.2f} "
+              f"{r['throughput_nodes_s']:>10.1f} {r['latency_p50_ms']:>10.2f} {r['latency_p99_ms']:>10.2f} "
+              f"{r['per_node_us']:>9.1f} {r['peak_rss_mb']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Workflow engine benchmark')
+    parser.add_argument('--scenarios', default='chain,fan,tree,mixed',
+                        help='comma separated: chain,fan,tree,mixed')
+    parser.add_argument('--engine', choices=('thread', 'async'), default='thread')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=1, help='runs executing at the same time')
+    parser.add_argument('--latency', type=float, default=0.0, help='stub backend latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='stub backend jitter in ms')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chain-length', type=int, default=1000)
+    parser.add_argument('--fan-branches', type=int, default=500)
+    parser.add_argument('--tree-depth', type=int, default=10)
+    parser.add_argument('--mixed-layers', type=int, default=6)
+    parser.add_argument('--mixed-width', type=int, default=8)
+    parser.add_argument('--output', help='save results as JSON')
+    parser.add_argument('--compare', help='previous results JSON to compare against')
+    args, _ = parser.parse_known_args()
+
+    stub = StubServer(config=StubConfig(args.latency, args.jitter, args.seed)).start()
+    try:
+        scenarios = build_scenarios(stub.base_url, args)
+        results = []
+        for name in [name.strip() for name in args.scenarios.split(',') if name.strip()]:
+            if name not in scenarios:
+                parser.error(f"unknown scenario: {name}")
+            results.append(run_scenario(name, scenarios[name](), args))
+    finally:
+        stub.stop()
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'stub_requests': stub.config.requests,
+        'results': results,
+    }
+    print_table(results)
+    if args.compare:
+        compare(args.compare, report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nresults saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+from typing import List
+
+
+def percentile(values: List[float], q: float) -> float:
+    """线性插值的分位数，q 取 0~100"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
@@ -0,0 +1,173 @@
+"""
+本地桩服务：OpenAI 兼容的 /v1/chat/completions 和通用 REST 接口
+
+延迟 = latency ± jitter（毫秒，均匀分布），使用固定种子，便于多次压测结果对比。
+单独运行：python -m bench.stub_backends --port 18080 --latency 50 --jitter 10
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit, parse_qs
+
+
+class StubConfig:
+    """桩服务的延迟配置，运行中可以修改"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 0,
+                 stream_chunks: int = 8):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.stream_chunks = stream_chunks
+        self._random = random.Random(seed)
+        self._lock = Lock()
+        self.requests = 0
+
+    def delay(self, override_ms: Optional[float] = None) -> float:
+        """本次请求需要等待的秒数"""
+        with self._lock:
+            self.requests += 1
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms > 0 else 0.0
+        latency = self.latency_ms if override_ms is None else override_ms
+        return max(0.0, latency + jitter) / 1000
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，不关闭 Nagle 时长连接上每个请求会多出约 40ms 的延迟确认
+    disable_nagle_algorithm = True
+    config: StubConfig = StubConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._rest()
+
+    def do_DELETE(self):
+        self._rest()
+
+    def do_PUT(self):
+        self._rest()
+
+    def do_POST(self):
+        if urlsplit(self.path).path == '/v1/chat/completions':
+            self._chat()
+        else:
+            self._rest()
+
+    def _query(self) -> Dict[str, str]:
+        return {key: values[-1] for key, values in parse_qs(urlsplit(self.path).query).items()}
+
+    def _read_body(self) -> Any:
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            return json.loads(raw) if raw else None
+        except ValueError:
+            return raw.decode('utf-8', 'replace')
+
+    def _send_json(self, obj: Any, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _rest(self):
+        """
+        通用 REST 接口：?latency=毫秒 覆盖默认延迟，?size=条数 控制响应大小，
+        ?setCookie=名称=值 在响应中设置 Cookie；响应体的 cookie 为请求携带的 Cookie 头
+        """
+        query = self._query()
+        body = self._read_body() if self.command in ('POST', 'PUT') else None
+        latency = float(query['latency']) if 'latency' in query else None
+        time.sleep(self.config.delay(latency))
+        size = int(query.get('size', 5))
+        self._send_json({
+            'path': urlsplit(self.path).path,
+            'method': self.command,
+            'items': [{'id': i, 'value': f"item-{i}"} for i in range(size)],
+            'echo': body,
+            'cookie': self.headers.get('Cookie'),
+        }, headers={'Set-Cookie': f"{query['setCookie']}; Path=/"} if 'setCookie' in query else None)
+
+    def _chat(self):
+        request = self._read_body() or {}
+        messages = request.get('messages') or [{}]
+        content = f"stub reply to: {str(messages[-1].get('content', ''))[:200]}"
+        time.sleep(self.config.delay())
+        if request.get('stream'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            step = max(1, len(content) // max(1, self.config.stream_chunks))
+            for start in range(0, len(content), step):
+                chunk = {'choices': [{'delta': {'content': content[start:start + step]}}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self._send_json({
+            'id': 'stub',
+            'object': 'chat.completion',
+            'model': request.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                         'finish_reason': 'stop'}],
+        })
+
+
+class StubServer:
+    """在后台线程中运行的桩服务，port=0 时自动分配端口"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, config: Optional[StubConfig] = None):
+        self.config = config or StubConfig()
+        handler = type('BoundStubHandler', (StubHandler,), {'config': self.config})
+        ThreadingHTTPServer.request_queue_size = 1024
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address[:2]
+        self._thread: Optional[Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> 'StubServer':
+        self._thread = Thread(target=self.server.serve_forever, name="bench-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub LLM/REST backend for workflow benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--latency', type=float, default=0.0, help='mean latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='uniform jitter in ms')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    server = StubServer(args.host, args.port, StubConfig(args.latency, args.jitter, args.seed)).start()
+    print(f"stub backend listening on {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
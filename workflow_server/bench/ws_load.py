@@ -0,0 +1,304 @@
+"""
+/workflow/runtime/{id} websocket 压测
+
+模拟多个编辑器会话同时运行工作流：每个客户端建立连接、发送工作流、接收全部节点结果直到服务端关闭连接，
+记录建连时间、首个事件时间、事件间隔和完成时间。默认在本机以子进程启动桩服务和 workflow_server，
+也可以用 --target 指向已经运行的服务。
+
+在 workflow_server 目录下运行：
+    python -m bench.ws_load --clients 50 --ramp linear:10 --iterations 5 --latency 50 --jitter 20
+    python -m bench.ws_load --clients 200 --ramp step:20x2 --duration 60 --output ws_load.json
+    python -m bench.ws_load --target ws://127.0.0.1:8000 --clients 20 --ramp burst
+
+爬坡方式（--ramp）：
+    burst         所有客户端同时开始
+    linear:S      S 秒内均匀启动全部客户端
+    step:NxS      每 S 秒启动 N 个客户端
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+import websockets
+
+from bench.generators import long_chain, wide_fan, conditional_tree, mixed_graph
+from bench.stats import percentile
+
+_SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"port {port} did not open within {timeout}s")
+
+
+class LocalStack:
+    """以子进程启动桩服务和 workflow_server，避免与压测客户端争抢同一个 GIL"""
+
+    def __init__(self, latency: float, jitter: float, seed: int, server_env: Dict[str, str]):
+        self.stub_port = _free_port()
+        self.server_port = _free_port()
+        env = dict(os.environ, WORKFLOW_LOG_LEVEL=os.environ.get("WORKFLOW_LOG_LEVEL", "WARNING"), **server_env)
+        self.processes = [
+            subprocess.Popen([sys.executable, '-m', 'bench.stub_backends', '--port', str(self.stub_port),
+                              '--latency', str(latency), '--jitter', str(jitter), '--seed', str(seed)],
+                             cwd=_SERVER_DIR, env=env, stdout=subprocess.DEVNULL),
+            subprocess.Popen([sys.executable, '-m', 'uvicorn', 'workflow_server:app', '--host', '127.0.0.1',
+                              '--port', str(self.server_port), '--log-level', 'warning'],
+                             cwd=_SERVER_DIR, env=env),
+        ]
+
+    def start(self) -> 'LocalStack':
+        _wait_port(self.stub_port)
+        _wait_port(self.server_port)
+        return self
+
+    @property
+    def stub_url(self) -> str:
+        return f"http://127.0.0.1:{self.stub_port}"
+
+    @property
+    def target(self) -> str:
+        return f"ws://127.0.0.1:{self.server_port}"
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def ramp_delays(clients: int, profile: str) -> List[float]:
+    """每个客户端相对开始时间的启动延迟（秒）"""
+    kind, _, arg = profile.partition(':')
+    if kind == 'burst':
+        return [0.0] * clients
+    if kind == 'linear':
+        seconds = float(arg or 10)
+        return [seconds * index / clients for index in range(clients)]
+    if kind == 'step':
+        size, _, interval = arg.partition('x')
+        size, interval = max(1, int(size or 10)), float(interval or 5)
+        return [(index // size) * interval for index in range(clients)]
+    raise ValueError(f"unknown ramp profile: {profile}")
+
+
+class RunSample:
+    """一次运行（一个连接）的测量结果"""
+
+    __slots__ = ('client', 'started', 'connect', 'first_event', 'completion', 'gaps', 'events',
+                 'failed_nodes', 'error')
+
+    def __init__(self, client: int, started: float):
+        self.client = client
+        self.started = started
+        self.connect: Optional[float] = None
+        self.first_event: Optional[float] = None
+        self.completion: Optional[float] = None
+        self.gaps: List[float] = []
+        self.events = 0
+        self.failed_nodes = 0
+        self.error: Optional[str] = None
+
+
+async def run_client(client: int, url: str, payload: str, start_delay: float, origin: float,
+                     iterations: int, stop_at: Optional[float], timeout: float) -> List[RunSample]:
+    await asyncio.sleep(max(0.0, origin + start_delay - time.monotonic()))
+    samples = []
+    iteration = 0
+    while (stop_at is None and iteration < iterations) or (stop_at is not None and time.monotonic() < stop_at):
+        iteration += 1
+        sample = RunSample(client, time.monotonic())
+        samples.append(sample)
+        try:
+            await asyncio.wait_for(_one_run(url, payload, sample), timeout)
+        except asyncio.TimeoutError:
+            sample.error = "timeout"
+        except (OSError, websockets.WebSocketException) as e:
+            sample.error = f"{type(e).__name__}: {e}"
+    return samples
+
+
+async def _one_run(url: str, payload: str, sample: RunSample):
+    async with websockets.connect(url, max_size=None, open_timeout=30) as ws:
+        sample.connect = time.monotonic() - sample.started
+        await ws.send(payload)
+        sent = last = time.monotonic()
+        async for message in ws:
+            now = time.monotonic()
+            if sample.first_event is None:
+                sample.first_event = now - sent
+            else:
+                sample.gaps.append(now - last)
+            last = now
+            sample.events += 1
+            event = json.loads(message)
+            if 'nodeId' in event and 'event' not in event and not event.get('isSuccess'):
+                sample.failed_nodes += 1
+        # 服务端在工作流结束后关闭连接
+        sample.completion = time.monotonic() - sent
+
+
+def _distribution(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3),
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p90_ms': round(percentile(values, 90) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+        'max_ms': round(max(values) * 1000, 3),
+    }
+
+
+def summarize(samples: List[RunSample], elapsed: float, origin: float) -> Dict[str, Any]:
+    completed = [s for s in samples if s.error is None and s.completion is not None]
+    errors: Dict[str, int] = {}
+    for sample in samples:
+        if sample.error:
+            key = sample.error.split(':')[0]
+            errors[key] = errors.get(key, 0) + 1
+
+    # 同时进行中的运行数：峰值按开始/结束事件扫描，时间线为每整秒时刻的快照
+    spans = [(sample.started - origin, sample.started - origin + (sample.connect or 0) + (sample.completion or 0))
+             for sample in samples]
+    changes = sorted([(start, 1) for start, _ in spans] + [(end, -1) for _, end in spans],
+                     key=lambda change: (change[0], change[1]))
+    running = peak = 0
+    for _, delta in changes:
+        running += delta
+        peak = max(peak, running)
+    timeline = [sum(1 for start, end in spans if start <= second < end)
+                for second in range(int(elapsed) + 1)]
+
+    return {
+        'runs': len(samples),
+        'completed': len(completed),
+        'errors': errors,
+        'failed_nodes': sum(s.failed_nodes for s in samples),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_runs_s': round(len(completed) / elapsed, 3) if elapsed else 0.0,
+        'events': sum(s.events for s in samples),
+        'connect': _distribution([s.connect for s in samples if s.connect is not None]),
+        'first_event': _distribution([s.first_event for s in completed if s.first_event is not None]),
+        'event_gap': _distribution([gap for s in completed for gap in s.gaps]),
+        'completion': _distribution([s.completion for s in completed]),
+        'peak_concurrent_runs': peak,
+        'concurrency_timeline': timeline,
+    }
+
+
+def build_workflow(args, stub_url: str) -> Dict[str, Any]:
+    if args.scenario == 'chain':
+        return long_chain(args.chain_length)
+    if args.scenario == 'fan':
+        return wide_fan(args.fan_branches)
+    if args.scenario == 'tree':
+        return conditional_tree(args.tree_depth)
+    return mixed_graph(stub_url, args.mixed_layers, args.mixed_width, args.seed)
+
+
+def print_summary(summary: Dict[str, Any]):
+    print(f"runs {summary['runs']}  completed {summary['completed']}  errors {summary['errors'] or 0}  "
+          f"failed nodes {summary['failed_nodes']}")
+    print(f"elapsed {summary['elapsed_s']}s  throughput {summary['throughput_runs_s']} runs/s  "
+          f"peak concurrent runs {summary['peak_concurrent_runs']}")
+    print(f"{'metric':<12} {'count':>7} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for name in ('connect', 'first_event', 'event_gap', 'completion'):
+        dist = summary[name]
+        if not dist['count']:
+            continue
+        print(f"{name:<12} {dist['count']:>7} {dist['p50_ms']:>10.2f} {dist['p90_ms']:>10.2f} "
+              f"{dist['p99_ms']:>10.2f} {dist['max_ms']:>10.2f}")
+
+
+async def main_async(args, target: str, stub_url: str) -> Dict[str, Any]:
+    workflow_json = build_workflow(args, stub_url)
+    # 服务端先 receive_json 再 json.loads，与编辑器一样发送 JSON 编码后的字符串
+    payload = json.dumps(json.dumps(workflow_json, ensure_ascii=False))
+    query = f"?{args.query}" if args.query else ""
+    url = f"{target}/workflow/runtime/{args.workflow_id}{query}"
+
+    delays = ramp_delays(args.clients, args.ramp)
+    origin = time.monotonic()
+    stop_at = origin + delays[-1] + args.duration if args.duration else None
+    results = await asyncio.gather(*(
+        run_client(index, url, payload, delays[index], origin, args.iterations, stop_at, args.timeout)
+        for index in range(args.clients)))
+    elapsed = time.monotonic() - origin
+    samples = [sample for client_samples in results for sample in client_samples]
+    summary = summarize(samples, elapsed, origin)
+    summary.update(workflow=workflow_json['name'], nodes=len(workflow_json['nodes']), url=url)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Websocket load generator for /workflow/runtime/{id}')
+    parser.add_argument('--target', help='ws://host:port of a running server; default starts a local stack')
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--ramp', default='burst', help='burst | linear:SECONDS | step:NxSECONDS')
+    parser.add_argument('--iterations', type=int, default=3, help='runs per client')
+    parser.add_argument('--duration', type=float, default=0.0,
+                        help='keep running for SECONDS after the ramp instead of a fixed iteration count')
+    parser.add_argument('--timeout', type=float, default=300.0, help='per-run timeout in seconds')
+    parser.add_argument('--workflow-id', default='load-test')
+    parser.add_argument('--query', default='', help='extra query string, e.g. incremental=1&trace=1')
+    parser.add_argument('--scenario', choices=('chain', 'fan', 'tree', 'mixed'), default='mixed')
+    parser.add_argument('--chain-length', type=int, default=200)
+    parser.add_argument('--fan-branches', type=int, default=100)
+    parser.add_argument('--tree-depth', type=int, default=8)
+    parser.add_argument('--mixed-layers', type=int, default=4)
+    parser.add_argument('--mixed-width', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=50.0, help='stub backend latency in ms')
+    parser.add_argument('--jitter', type=float, default=10.0, help='stub backend jitter in ms')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--stub-url', default='http://127.0.0.1:18080',
+                        help='stub backend used by generated workflows when --target is given')
+    parser.add_argument('--output', help='save the summary as JSON')
+    args, _ = parser.parse_known_args()
+
+    stack = None
+    if args.target:
+        target, stub_url = args.target.rstrip('/'), args.stub_url
+    else:
+        stack = LocalStack(args.latency, args.jitter, args.seed, {"LLM_CACHE_ENABLED": "0"}).start()
+        target, stub_url = stack.target, stack.stub_url
+    try:
+        summary = asyncio.run(main_async(args, target, stub_url))
+    finally:
+        if stack is not None:
+            stack.stop()
+
+    summary['config'] = {key: value for key, value in vars(args).items() if key != 'output'}
+    summary['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    print_summary(summary)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"\nsummary saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
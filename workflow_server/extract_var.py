@@ -1,12 +1,193 @@
 import re
 import json
-from typing import Any, Dict, Union, Optional
-from functools import reduce
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Union, Optional, Mapping, Callable, List, Tuple
+
+from multienv import multienv
+
+
+# ${...} 占位符
+TEMPLATE_PATTERN = re.compile(r'\$\{(.*?)\}')
+
+# 路径片段中的数组下标，如 b[0][1]
+_INDEX_PATTERN = re.compile(r'\[(\d+)\]')
+
+# 已编译模板的缓存条目数
+TEMPLATE_CACHE_SIZE = int(multienv.get("TEMPLATE_CACHE_SIZE", "4096"))
+
+# 引用的数据来源在 (context, input, global) 中的位置
+_ROOTS = (('input.', 1), ('context.', 0), ('global.', 2))
+
+Accessor = Callable[[Tuple[Any, Any, Any]], Any]
+
+
+def split_path(path: str) -> List[Union[str, int]]:
+    """
+    将路径字符串分割为访问步骤列表
+    例如: "a.b[0].c" -> ['a', 'b', 0, 'c']
+    """
+    parts = []
+    for part in path.split('.'):
+        if '[' in part and ']' in part:
+            # 处理数组索引
+            key = part[:part.index('[')]
+            if key:
+                parts.append(key)
+            # 提取所有索引
+            parts.extend(int(index) for index in _INDEX_PATTERN.findall(part))
+        elif part:
+            parts.append(part)
+    return parts
+
+
+def _get_item(obj: Any, part: Union[str, int]) -> Any:
+    """根据部分路径获取对象属性/元素"""
+    if isinstance(part, int):
+        if isinstance(obj, (list, tuple)) and part < len(obj):
+            return obj[part]
+        return None
+    elif isinstance(obj, Mapping):
+        return obj.get(part)
+    elif hasattr(obj, part):
+        return getattr(obj, part)
+    return None
+
+
+def compile_reference(ref: str) -> Accessor:
+    """
+    把去掉 ${} 的引用路径编译为访问函数，参数为 (context, input, global)
+    路径在编译时拆分好，求值时只按步骤取值
+    """
+    if not ref:
+        return lambda roots: None
+    ref = ref.strip()
+    if ref == 'input':
+        return lambda roots: roots[1]
+
+    # 默认尝试从context中解析
+    index, path = 0, ref
+    for prefix, root in _ROOTS:
+        if ref.startswith(prefix):
+            index, path = root, ref[len(prefix):]
+            break
+    walk = compile_path(path)
+    return lambda roots: walk(roots[index])
+
+
+def compile_path(path: str) -> Callable[[Any], Any]:
+    """把对象路径如 a.b[0].c 编译为取值函数，路径不存在时返回 None"""
+    steps = tuple(split_path(path))
+
+    def walk(data: Any) -> Any:
+        if data is None:
+            return None
+        try:
+            for step in steps:
+                # 最常见的普通字典单独处理，省去抽象基类的类型检查
+                data = data.get(step) if type(data) is dict and type(step) is str else _get_item(data, step)
+        except (KeyError, IndexError, AttributeError, TypeError):
+            return None
+        return data
+
+    return walk
+
+
+class CompiledTemplate:
+    """
+    编译后的模板：字面量片段与引用访问函数交替排列
+    找不到值的引用保留原文 ${...}；整个模板只有一个引用时 value() 返回原始类型
+    """
+
+    __slots__ = ('source', 'parts', 'tail', 'single')
+
+    def __init__(self, source: str):
+        self.source = source
+        text = source.strip()
+        parts: List[Tuple[str, Accessor, str]] = []
+        position = 0
+        for match in TEMPLATE_PATTERN.finditer(text):
+            parts.append((text[position:match.start()], compile_reference(match.group(1)), match.group(0)))
+            position = match.end()
+        self.parts = tuple(parts)
+        self.tail = text[position:]
+        self.single = len(parts) == 1 and not parts[0][0] and not self.tail
+
+    def render(self, context_data: Any, input_data: Any, global_data: Optional[Dict[str, Any]] = None) -> str:
+        """替换所有 ${} 引用，返回字符串"""
+        if not self.parts:
+            return self.tail
+        roots = (context_data, input_data, global_data or {})
+        chunks = []
+        for literal, access, raw in self.parts:
+            chunks.append(literal)
+            value = access(roots)
+            # 如果找不到变量，返回原匹配
+            chunks.append(str(value) if value is not None else raw)
+        chunks.append(self.tail)
+        return ''.join(chunks)
+
+    def value(self, context_data: Any, input_data: Any, global_data: Optional[Dict[str, Any]] = None) -> Any:
+        """整个模板是单个引用时返回引用的原始值（找不到时为 None），否则同 render"""
+        if self.single:
+            return self.parts[0][1]((context_data, input_data, global_data or {}))
+        return self.render(context_data, input_data, global_data)
+
+    def __repr__(self) -> str:
+        return f"CompiledTemplate({self.source!r})"
+
+
+class TemplateCache:
+    """按模板文本缓存编译结果，LRU 淘汰"""
+
+    def __init__(self, maxsize: int = TEMPLATE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._templates: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, source: str) -> CompiledTemplate:
+        with self._lock:
+            template = self._templates.get(source)
+            if template is not None:
+                self._templates.move_to_end(source)
+                self.hits += 1
+                return template
+            self.misses += 1
+
+        template = CompiledTemplate(source)
+        with self._lock:
+            template = self._templates.setdefault(source, template)
+            self._templates.move_to_end(source)
+            while len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': len(self._templates), 'maxsize': self.maxsize,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+# 全局实例
+template_cache = TemplateCache()
+
+
+def compile_template(source: str) -> CompiledTemplate:
+    """编译模板（带缓存），节点可以在初始化时编译好，执行时直接 render"""
+    return template_cache.get(source)
 
 
 class ExpressionEvaluateVariablor:
     """JSON 表达式解析器，支持 ${context.} 和 ${input.} 和 ${global.} 语法"""
 
+    pattern = TEMPLATE_PATTERN
+
     def __init__(self, context_data: Dict[str, Any], input_data: Any, global_data: Optional[Dict[str, Any]] = None):
         """
         初始化解析器
@@ -16,7 +197,6 @@ class ExpressionEvaluateVariablor:
         self.context_data = context_data
         self.input_data = input_data
         self.global_data = global_data or {}
-        self.pattern = re.compile(r'\$\{(.*?)\}')
 
     def evaluate(self, expression: str) -> Any:
         """
@@ -26,22 +206,7 @@ class ExpressionEvaluateVariablor:
         """
         if not isinstance(expression, str):
             return expression
-
-        expression = expression.strip()
-
-        # # 如果整个表达式就是一个${}引用，直接返回解析值
-        # if expression.startswith('${') and expression.endswith('}'):
-        #     ref = expression[2:-1]
-        #     return self._resolve_reference(ref)
-
-        # 否则替换所有${}引用
-        def replace_match(match):
-            ref = match.group(1)
-            value = self._resolve_reference(ref)
-            # 如果找不到变量，返回原匹配
-            return str(value) if value is not None else match.group(0)
-
-        return self.pattern.sub(replace_match, expression)
+        return compile_template(expression).render(self.context_data, self.input_data, self.global_data)
 
     def _resolve_reference(self, ref: str) -> Any:
         """
@@ -51,73 +216,7 @@ class ExpressionEvaluateVariablor:
         """
         if not ref:
             return None
-        
-        ref = ref.strip()
-
-        # 判断引用类型
-        if ref == 'input':
-            return self.input_data
-        elif ref.startswith('input.'):
-            return self._resolve_path(ref[6:], self.input_data)
-        elif ref.startswith('context.'):
-            return self._resolve_path(ref[8:], self.context_data)
-        elif ref.startswith('global.'):
-            return self._resolve_path(ref[7:], self.global_data)
-        else:
-            # 默认尝试从context中解析
-            return self._resolve_path(ref, self.context_data)
-
-    def _resolve_path(self, path: str, data: Any) -> Any:
-        """
-        解析对象路径如 a.b.c[0].d
-        :param path: 点分隔的路径字符串
-        :param data: 要解析的数据对象
-        :return: 解析后的值
-        """
-        if not path or data is None:
-            return data
-
-        try:
-            # 分割路径为各个部分
-            parts = self._split_path(path)
-            return reduce(self._get_item, parts, data)
-        except (KeyError, IndexError, AttributeError, TypeError):
-            return None
-
-    def _split_path(self, path: str) -> list:
-        """
-        将路径字符串分割为访问步骤列表
-        例如: "a.b[0].c" -> ['a', 'b', 0, 'c']
-        """
-        parts = []
-        for part in path.split('.'):
-            if '[' in part and ']' in part:
-                # 处理数组索引
-                key = part[:part.index('[')]
-                if key:
-                    parts.append(key)
-                # 提取所有索引
-                indices = re.findall(r'\[(\d+)\]', part)
-                for index in indices:
-                    parts.append(int(index))
-            else:
-                if part:
-                    parts.append(part)
-        return parts
-
-    def _get_item(self, obj: Any, part: Union[str, int]) -> Any:
-        """
-        根据部分路径获取对象属性/元素
-        """
-        if isinstance(part, int):
-            if isinstance(obj, (list, tuple)) and part < len(obj):
-                return obj[part]
-            return None
-        elif isinstance(obj, dict):
-            return obj.get(part)
-        elif hasattr(obj, part):
-            return getattr(obj, part)
-        return None
+        return compile_reference(ref)((self.context_data, self.input_data, self.global_data))
 
 
 if __name__ == '__main__':
@@ -118,7 +118,9 @@ def parse_args():
                         help='Environment to use (e.g. dev, prod, test)')
     parser.add_argument('--env-file', '-f', type=str, default=None,
                         help='Custom env file path (overrides default .env.{env} pattern)')
-    return parser.parse_args()
+    # 只取自己的参数，其余留给导入本模块的脚本（如 bench）解析
+    args, _ = parser.parse_known_args()
+    return args
 
 
 def init_multienv() -> MultiEnv:
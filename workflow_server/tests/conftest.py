@@ -0,0 +1,60 @@
+"""
+测试公共设施
+
+在 workflow_server 目录下运行：python -m pytest tests
+模块按 workflow_server 目录下的平铺方式导入；需要网络的测试使用 bench/stub_backends.py 的本地桩服务。
+"""
+import os
+import sys
+import tempfile
+
+# 必须在导入引擎之前设置：只保留警告以上的日志，检查点等落盘的文件放到临时目录
+os.environ.setdefault("WORKFLOW_LOG_LEVEL", "WARNING")
+os.environ.setdefault("WORKFLOW_DATA_DIR", tempfile.mkdtemp(prefix="workflow-tests-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from typing import Dict, Any, List, Optional, Tuple  # noqa: E402
+
+import pytest  # noqa: E402
+
+from bench.stub_backends import StubConfig, StubServer  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def stub():
+    """本地 LLM/REST 桩服务，零延迟"""
+    server = StubServer(config=StubConfig()).start()
+    yield server
+    server.stop()
+
+
+def workflow_json(nodes: List[Tuple[str, str, Dict[str, Any]]],
+                  edges: List[Tuple[str, str, Optional[str]]]) -> Dict[str, Any]:
+    """按编辑器导出的结构生成工作流：nodes 为 (ID, 类型, data)，edges 为 (源, 目标, sourceHandle)"""
+    return {
+        'name': 'test',
+        'nodes': [{'id': node_id, 'type': 'customNode', 'data': {'type': node_type, 'label': node_id, **data}}
+                  for node_id, node_type, data in nodes],
+        'edges': [{'id': f"e-{source}-{target}", 'source': source, 'target': target, 'sourceHandle': handle}
+                  for source, target, handle in edges],
+    }
+
+
+def chain(*nodes: Tuple[str, str, Dict[str, Any]]) -> Dict[str, Any]:
+    """把节点依次连成一条链"""
+    return workflow_json(list(nodes), [(a[0], b[0], None) for a, b in zip(nodes, nodes[1:])])
+
+
+@pytest.fixture(params=['thread', 'async'])
+def engine(request):
+    """分别用线程池调度器和异步调度器运行，返回 run(workflow, on_node_complete=None)"""
+    import asyncio
+
+    def run(workflow, on_node_complete=None):
+        if request.param == 'async':
+            asyncio.run(workflow.aexecute(on_node_complete))
+        else:
+            workflow.execute(on_node_complete)
+        return workflow
+    run.mode = request.param
+    return run
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from workflow_cache import LLMResponseCache
+
+
+@pytest.mark.parametrize('value', [None, 42, {'content': 'x'}, ['a']])
+def test_non_string_values_not_cached(tmp_path, value):
+    cache = LLMResponseCache(db_path=str(tmp_path / "cache.db"))
+    cache.set('k', value)
+    asyncio.run(cache.aset('k2', value))
+    assert cache.get('k') is None and cache.get('k2') is None
+    assert cache.stats()['stores'] == 0
+
+
+def test_byte_budget_evicts_oldest():
+    cache = LLMResponseCache(max_entries=10, max_bytes=10)
+    cache.set('a', 'x' * 6)
+    cache.set('b', 'y' * 6)
+    assert cache.get('a') is None
+    assert cache.get('b') == 'y' * 6
+    # 超过总容量的单条内容不进入内存层
+    cache.set('c', 'z' * 11)
+    assert cache.get('c') is None
+
+
+def test_budget_counts_utf8_bytes():
+    cache = LLMResponseCache(max_entries=10, max_bytes=12)
+    cache.set('a', '中文')  # 2 个字符，6 字节
+    assert cache.stats()['bytes'] == 6
+    cache.set('b', '回复')
+    assert cache.stats()['bytes'] == 12 and cache.get('a') == '中文'
+    # 按字符数只有 6 个，按字节数超出容量，最久未用的 b 被淘汰
+    cache.set('c', 'ok')
+    assert cache.get('b') is None
+    assert cache.stats()['bytes'] == 8
+    # 5 个字符、15 字节的单条内容超过总容量
+    cache.set('d', '五个中文字')
+    assert cache.get('d') is None
+
+
+def test_replacing_and_expiring_release_bytes():
+    cache = LLMResponseCache(max_entries=10, max_bytes=100, ttl=-1)
+    cache.set('a', '中文')
+    cache.set('a', '中文回复')
+    assert cache.stats()['bytes'] == 12
+    # ttl 为负时读取即过期
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 0
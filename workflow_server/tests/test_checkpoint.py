@@ -0,0 +1,75 @@
+import os
+
+import pytest
+from starlette.testclient import TestClient
+
+import workflow_checkpoint
+import workflow_server
+from conftest import chain
+from workflow_checkpoint import CheckpointStore
+from workflow_codec import dumps
+from workflow_response import LazyResponse
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(str(tmp_path / "nested" / "checkpoints.db"))
+
+
+def test_default_path_in_data_dir():
+    assert os.path.dirname(workflow_checkpoint.CHECKPOINT_DB) == os.environ["WORKFLOW_DATA_DIR"]
+
+
+def test_round_trip_serialized_on_writer(store):
+    run_id = store.start_run({'nodes': [], 'edges': []}, 'fp')
+    global_data = {'step': 1}
+    response = LazyResponse(200, {'Content-Type': 'application/json'}, b'{"items": [1, 2]}')
+    store.record_node(run_id, 0, 'api', 'completed', True, {'q': '中文'}, response, None, ['next'])
+    store.update_run(run_id, frontier=['next'], global_data=global_data)
+    # 入队之后全局数据的修改不影响检查点
+    global_data['step'] = 2
+
+    run = store.load_run(run_id)
+    assert run['global_data'] == {'step': 1}
+    assert run['frontier'] == ['next']
+    node, = store.load_nodes(run_id)
+    assert node['input'] == {'q': '中文'}
+    # 恢复运行需要完整的 API 响应
+    assert node['output']['data'] == {'items': [1, 2]}
+    assert node['next_ids'] == ['next']
+
+
+def test_non_json_values_do_not_fail_batch(store):
+    run_id = store.start_run({'nodes': [], 'edges': []})
+    store.record_node(run_id, 0, 'bad', 'completed', True, None, {1, 2}, None, [])
+    store.record_node(run_id, 1, 'good', 'completed', True, None, 'ok', None, [])
+    nodes = store.load_nodes(run_id)
+    # set 按 str() 编码，不会让整批写入失败
+    assert [node['node_id'] for node in nodes] == ['bad', 'good']
+
+
+def test_resume_after_disconnect(stub):
+    data = chain(('in', 'input', {'action': 'hello'}),
+                 ('first', 'transform', {}),
+                 ('slow', 'api', {'url': f"{stub.base_url}/items?latency=500&size=2"}),
+                 ('after', 'transform', {}))
+    client = TestClient(workflow_server.app)
+    with client.websocket_connect("/workflow/runtime/resume-test?checkpoint=1") as ws:
+        ws.send_text(dumps(dumps(data)))
+        run_id = ws.receive_json()['runId']
+        seen = [ws.receive_json()['nodeId'], ws.receive_json()['nodeId']]
+    # 慢节点完成之前断开
+    assert seen == ['in', 'first']
+
+    with client.websocket_connect(f"/workflow/runtime/resume-test/resume/{run_id}") as ws:
+        messages = []
+        while True:
+            message = ws.receive_json()
+            messages.append(message)
+            if message.get('nodeId') == 'after' or message.get('event') == 'error':
+                break
+    results = {message['nodeId']: message for message in messages if 'nodeId' in message}
+    assert messages[0] == {'event': 'checkpoint', 'runId': run_id, 'resumed': True}
+    assert set(results) == {'in', 'first', 'slow', 'after'}
+    assert all(message['isSuccess'] for message in results.values())
+    assert results['slow']['output']['data']['items'] == [{'id': 0, 'value': 'item-0'}, {'id': 1, 'value': 'item-1'}]
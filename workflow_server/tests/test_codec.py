@@ -0,0 +1,84 @@
+import datetime
+import json
+
+import pytest
+
+import workflow_codec
+from workflow_codec import dumpb, dumps, loads
+
+pytestmark = pytest.mark.skipif(workflow_codec.JSON_BACKEND != 'orjson', reason="需要 orjson 才能比较两种实现")
+
+VALUES = [
+    {'name': '中文', 'items': [1, 2.5, None, True], 'nested': {'empty': []}},
+    {1: 'int key', 2.5: 'float key', True: 'bool key', None: 'null key'},
+    2 ** 70,  # 超过 64 位，orjson 交给标准库
+    {'big': [-(2 ** 64)]},
+    '\ud800',  # 单独的代理字符，字符串输出与标准库相同
+    'line\nbreak "quoted" \\  ',
+]
+
+
+@pytest.fixture
+def stdlib(monkeypatch):
+    """临时切换到标准库实现"""
+    def run(fn, *args, **kwargs):
+        with monkeypatch.context() as patch:
+            patch.setattr(workflow_codec, '_orjson', None)
+            return fn(*args, **kwargs)
+    return run
+
+
+@pytest.mark.parametrize('value', VALUES)
+def test_dumps_parity(stdlib, value):
+    assert dumps(value) == stdlib(dumps, value)
+    assert dumpb(value) == stdlib(dumpb, value)
+    assert loads(dumpb(value)) == stdlib(loads, stdlib(dumps, value))
+
+
+def test_default_parity(stdlib):
+    value = {'when': datetime.date(2024, 1, 2), 'tags': {'a'}}
+
+    def default(obj):
+        return str(obj) if isinstance(obj, datetime.date) else sorted(obj)
+
+    assert dumps(value, default=default) == stdlib(dumps, value, default=default) == '{"when":"2024-01-02","tags":["a"]}'
+
+
+@pytest.mark.parametrize('text', [
+    '{"name":"中文","items":[1,2.5,null,true]}',
+    '[1e3, -0.0, "\\u00e9"]',
+    '[NaN, Infinity, -Infinity]',  # orjson 不接受，交给标准库
+])
+def test_loads_parity(stdlib, text):
+    expected = stdlib(loads, text)
+    assert json.dumps(loads(text)) == json.dumps(expected)
+    assert json.dumps(loads(text.encode('utf-8'))) == json.dumps(expected)
+
+
+@pytest.mark.parametrize('text', ['{"a": 1', '', '[1,]', "{'a': 1}"])
+def test_decode_error_is_stdlib(stdlib, text):
+    with pytest.raises(json.JSONDecodeError) as fast:
+        loads(text)
+    with pytest.raises(json.JSONDecodeError) as slow:
+        stdlib(loads, text)
+    assert str(fast.value) == str(slow.value)
+
+
+def test_documented_differences(stdlib):
+    # NaN 编码为 null；超过 64 位的整数解析为浮点数
+    assert dumps([float('nan')]) == '[null]'
+    assert stdlib(dumps, [float('nan')]) == '[NaN]'
+    assert loads(str(2 ** 70)) == float(2 ** 70)
+    assert stdlib(loads, str(2 ** 70)) == 2 ** 70
+
+
+def test_unencodable_raises(stdlib):
+    with pytest.raises(TypeError):
+        dumps({'value': object()})
+    with pytest.raises(TypeError):
+        stdlib(dumps, {'value': object()})
+
+
+def test_lone_surrogate_bytes_are_escaped(stdlib):
+    assert dumpb(['\ud800', '中文']) == stdlib(dumpb, ['\ud800', '中文']) == b'["\\ud800","\\u4e2d\\u6587"]'
+    assert loads(dumpb(['\ud800'])) == ['\ud800']
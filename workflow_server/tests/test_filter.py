@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import chain
+from workflow import Workflow
+from workflow_filter import BatchCondition, np
+
+RECORDS = [
+    {'id': 0, 'price': 5, 'state': 'ok', 'flag': True, 'meta': {'rank': 3}},
+    {'id': 1, 'price': 12.5, 'state': 'ok', 'flag': False, 'meta': {'rank': 1}},
+    {'id': 2, 'price': 30, 'state': 'sold', 'flag': True},
+    {'id': 3, 'state': 'ok', 'flag': None, 'meta': {'rank': 7}},  # 缺少 price
+    {'id': 4, 'price': '18', 'state': 'true', 'flag': 'false', 'meta': {'rank': 2}},  # 字符串形式的数字和布尔值
+    {'id': 5, 'price': 10, 'state': 'ok', 'flag': 1, 'meta': None},
+]
+
+CONDITIONS = [
+    '${item.price} > 10',
+    '${item.price} >= 10 && ${item.state} == "ok"',
+    '${item.state} != "ok" || ${item.price} < 6',
+    '${item.flag}',
+    '${item.flag} == true',
+    '${item.meta.rank} <= 3',
+    '(${item.price} > 10 || ${item.meta.rank} > 5) && ${item.id} != 2',
+    '${item.price} > ${global.threshold}',
+    '${item.state} == "${global.state}"',
+    '${item.missing} == 1',
+    '${item.id} == "${item.id}"',  # 字符串中引用记录字段，只能逐条求值
+]
+
+
+def _both(source, records):
+    vectorized = BatchCondition(source)
+    rows = BatchCondition(source, vectorize=False)
+    roots = ({}, None, {'threshold': 10, 'state': 'ok'})
+    return vectorized, vectorized.mask(records, *roots), rows.mask(records, *roots)
+
+
+@pytest.mark.parametrize('source', CONDITIONS)
+def test_vectorized_matches_rows(source):
+    _, vectorized, rows = _both(source, RECORDS)
+    assert vectorized == rows
+
+
+@pytest.mark.parametrize('source', CONDITIONS)
+@pytest.mark.parametrize('records', [
+    [{'n': i, 'price': i * 1.5, 'state': 'ok' if i % 3 else 'sold', 'flag': bool(i % 2), 'id': i,
+      'meta': {'rank': i % 4}} for i in range(200)],
+    [{'id': 2 ** 60 + i, 'price': 2 ** 60} for i in range(3)],  # 超过 2^53 的整数逐条求值
+    [],
+])
+def test_vectorized_matches_rows_on_columns(source, records):
+    _, vectorized, rows = _both(source, records)
+    assert vectorized == rows
+
+
+@pytest.mark.skipif(np is None, reason="需要 NumPy")
+def test_homogeneous_columns_are_vectorized():
+    condition, _, _ = _both('${item.price} >= 10 && ${item.state} == "ok"', [
+        {'price': i, 'state': 'ok'} for i in range(20)])
+    assert condition.vectorized_runs == 1 and condition.row_runs == 0
+
+
+def test_filter_preserves_order():
+    condition = BatchCondition('${item.price} >= 10')
+    assert [record['id'] for record in condition.filter(RECORDS)] == [1, 2, 4, 5]
+
+
+def test_syntax_error_raised_on_evaluation():
+    condition = BatchCondition('${item.price} >')
+    with pytest.raises(ValueError):
+        condition.mask(RECORDS)
+
+
+@pytest.mark.parametrize('output, expected', [
+    ('records', [RECORDS[1], RECORDS[2], RECORDS[4], RECORDS[5]]),
+    ('mask', [False, True, True, False, True, True]),
+])
+def test_filter_node(engine, output, expected):
+    workflow = Workflow(chain(('in', 'input', {'action': 'go'}),
+                              ('filter', 'filter', {'items': '${global.records}', 'output': output,
+                                                    'condition': '${item.price} >= 10'})))
+    workflow.context.global_data['records'] = RECORDS
+    engine(workflow)
+    assert workflow.context.execution_history['filter']['output'] == expected
+
+
+def test_missing_numpy_warns_once_and_falls_back():
+    script = ("import sys; sys.modules['numpy'] = None\n"
+              "import workflow_filter\n"
+              "print(workflow_filter.BatchCondition('${item.a} > 1').mask([{'a': 2}, {'a': 0}]))")
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=30,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip().endswith('[True, False]')
+    output = result.stdout + result.stderr
+    assert output.count('filter.numpy_missing') == 1
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import workflow_metrics
+from workflow_http import SessionRegistry
+
+
+def test_sync_session_does_not_share_cookies(stub):
+    registry = SessionRegistry()
+    first = registry.request('GET', f"{stub.base_url}/login?setCookie=sid=user-a").json()
+    second = registry.request('GET', f"{stub.base_url}/items").json()
+    assert first['cookie'] is None
+    # 另一个用户的请求不能带上前一个响应设置的 Cookie
+    assert second['cookie'] is None
+    # 请求中显式携带的 Cookie 照常发送
+    explicit = registry.request('GET', f"{stub.base_url}/items", cookies={'sid': 'mine'}).json()
+    assert explicit['cookie'] == 'sid=mine'
+
+
+def test_async_client_does_not_share_cookies(stub):
+    registry = SessionRegistry()
+
+    async def run():
+        await registry.arequest('GET', f"{stub.base_url}/login?setCookie=sid=user-a")
+        response = await registry.arequest('GET', f"{stub.base_url}/items")
+        return response.json()
+
+    assert asyncio.run(run())['cookie'] is None
+
+
+def test_replaced_async_client_is_closed(stub):
+    registry = SessionRegistry()
+
+    async def use():
+        await registry.arequest('GET', f"{stub.base_url}/items")
+        return registry.async_client()
+
+    first = asyncio.run(use())
+
+    async def replace():
+        registry.async_client()
+        # 让关闭旧客户端的任务执行完
+        await asyncio.gather(*registry._closing)
+
+    asyncio.run(replace())
+    assert first.is_closed
+
+
+def test_stream_duration_covers_body_read(stub):
+    registry = SessionRegistry()
+    key = (workflow_metrics.endpoint_label(stub.base_url), 'ok')
+
+    def total():
+        series = workflow_metrics.endpoint_duration._series.get(key)
+        return series[-2] if series else 0.0
+
+    before = total()
+    with registry.stream('GET', f"{stub.base_url}/items") as response:
+        time.sleep(0.1)  # 读取响应体期间的耗时
+        assert response.json()['path'] == '/items'
+    assert total() - before >= 0.1
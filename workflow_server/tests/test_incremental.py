@@ -0,0 +1,109 @@
+import time
+
+import pytest
+
+from conftest import chain
+from workflow import Workflow
+from workflow_incremental import IncrementalRun, ResultStore
+from workflow_response import LazyResponse
+from workflow_scheduler import DagScheduler
+
+
+def _run(data, store):
+    """增量执行一次，返回被复用的节点"""
+    workflow = Workflow(data)
+    incremental = IncrementalRun(workflow.plan, store=store)
+    DagScheduler(workflow, incremental=incremental).run()
+    return incremental.reused, incremental.fingerprints
+
+
+def _llm(stub, **data):
+    return dict({'ip': stub.host, 'port': stub.port, 'singleFlight': False, 'cache': False,
+                 'messages': [{'role': 'user', 'content': '${input}'}]}, **data)
+
+
+def test_deterministic_nodes_reused():
+    store = ResultStore()
+    data = chain(('in', 'input', {'action': 'hello'}), ('t1', 'transform', {}), ('t2', 'transform', {}))
+    assert _run(data, store)[0] == set()
+    assert _run(data, store)[0] == {'in', 't1', 't2'}
+
+
+def test_changed_input_invalidates_downstream():
+    store = ResultStore()
+    _run(chain(('in', 'input', {'action': 'a'}), ('t1', 'transform', {})), store)
+    reused, _ = _run(chain(('in', 'input', {'action': 'b'}), ('t1', 'transform', {})), store)
+    assert reused == set()
+
+
+@pytest.mark.parametrize('node, expected', [
+    (('llm', 'llm', {'temperature': 0.7}), False),
+    (('llm', 'llm', {'temperature': 0}), True),
+    (('llm', 'llm', {'temperature': 0.7, 'cacheable': True}), True),
+    (('llm', 'api', {'method': 'GET', 'url': '/items'}), False),
+    (('llm', 'api', {'method': 'GET', 'url': '/items', 'incremental': True}), True),
+])
+def test_non_deterministic_nodes_not_reused(stub, node, expected):
+    node_id, node_type, data = node
+    if node_type == 'llm':
+        data = _llm(stub, **data)
+    else:
+        data = dict(data, url=stub.base_url + data['url'])
+    store = ResultStore()
+    workflow_data = chain(('in', 'input', {'action': 'hi'}), (node_id, node_type, data), ('after', 'transform', {}))
+    _run(workflow_data, store)
+    reused, _ = _run(workflow_data, store)
+    assert ('llm' in reused) is expected
+    # 不复用的节点执行后输出相同，下游照常复用
+    assert 'after' in reused
+
+
+def test_non_deterministic_output_folded_into_fingerprint(stub):
+    store = ResultStore()
+    workflow = Workflow(chain(('in', 'input', {'action': 'hi'}), ('llm', 'llm', _llm(stub, temperature=0.7))))
+    incremental = IncrementalRun(workflow.plan, store=store)
+    incremental.fingerprint('llm', ('in',), 'hi', {})
+    incremental.remember('llm', 'completed', 'hi', 'reply one')
+    first = incremental.fingerprints['llm']
+    incremental.fingerprint('llm', ('in',), 'hi', {})
+    incremental.remember('llm', 'completed', 'hi', 'reply two')
+    assert incremental.fingerprints['llm'] != first
+    assert store.stats()['size'] == 0
+
+
+def test_result_store_ttl():
+    store = ResultStore(ttl=0.01)
+    store.put('fp', 'completed', None, 1)
+    assert store.get('fp') == ('completed', None, 1)
+    time.sleep(0.02)
+    assert store.get('fp') is None
+    assert store.stats()['expired'] == 1
+
+
+def test_result_store_lru():
+    store = ResultStore(maxsize=2, ttl=0)
+    for key in 'abc':
+        store.put(key, 'completed', None, key)
+    assert store.get('a') is None
+    assert store.get('c') == ('completed', None, 'c')
+
+
+def test_previewed_runtime_not_reused():
+    data = chain(('in', 'input', {'action': 'hi'}), ('api', 'api', {'url': 'http://example.invalid/', 'incremental': True}))
+    workflow = Workflow(data)
+    preview = LazyResponse(200, {}, b'x' * 100).preview(limit=10)
+    full = LazyResponse(200, {}, b'"ok"').to_dict()
+    runtime = {'api': {'isSuccess': True, 'fingerprint': 'fp-preview', 'output': preview},
+               'in': {'isSuccess': True, 'fingerprint': 'fp-full', 'output': full}}
+    incremental = IncrementalRun(workflow.plan, runtime, store=ResultStore())
+    assert 'fp-preview' not in incremental.previous
+    assert incremental.previous['fp-full'][2] == full
+
+
+def test_store_preferred_over_runtime():
+    store = ResultStore()
+    store.put('fp', 'completed', None, 'full body')
+    workflow = Workflow(chain(('in', 'input', {'action': 'hi'})))
+    incremental = IncrementalRun(workflow.plan, {'in': {'isSuccess': True, 'fingerprint': 'fp', 'output': 'stale'}},
+                                 store=store)
+    assert incremental.lookup(workflow.nodes['in'], 'fp') == ('completed', None, 'full body')
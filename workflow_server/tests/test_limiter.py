@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from conftest import chain
+from workflow import Workflow
+from workflow_limiter import EndpointLimiter, endpoint_limiters
+from workflow_singleflight import RunCancelled
+
+
+def _request(limiter, status=None, error=None, seconds=0.0):
+    try:
+        with limiter.limit() as permit:
+            time.sleep(seconds)
+            if status is not None:
+                permit.observe(status)
+            if error is not None:
+                raise error
+    except Exception:
+        pass
+
+
+@pytest.mark.parametrize('status, error, congested', [
+    (200, None, False),
+    (429, None, True),
+    (503, None, True),
+    (None, ConnectionError("refused"), True),
+    # 请求本身的错误不是拥塞
+    (500, None, False),
+    (400, RuntimeError("bad request"), False),
+])
+def test_congestion_signals(status, error, congested):
+    limiter = EndpointLimiter('test', initial_window=8)
+    _request(limiter, status, error)
+    assert (limiter.stats()['window'] < 8) is congested
+
+
+def test_errors_do_not_grow_window():
+    limiter = EndpointLimiter('test', initial_window=1, min_window=1)
+    _request(limiter, 500)
+    assert limiter.stats()['window'] == 1
+    _request(limiter, 200)
+    assert limiter.stats()['window'] == 2
+
+
+def test_latency_signal_is_opt_in():
+    default = EndpointLimiter('test', initial_window=8)
+    opted_in = EndpointLimiter('test', initial_window=8, latency_tolerance=3)
+    for limiter in (default, opted_in):
+        _request(limiter, 200)
+        _request(limiter, 200, seconds=0.05)
+    assert default.stats()['window'] >= 8
+    assert opted_in.stats()['window'] < 8
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_llm_permit_released_on_both_paths(engine, stub, stream):
+    data = chain(('in', 'input', {'action': 'hi'}),
+                 ('llm', 'llm', {'ip': stub.host, 'port': stub.port, 'stream': stream, 'cache': False,
+                                 'messages': [{'role': 'user', 'content': 'hi'}]}))
+    workflow = engine(Workflow(data))
+    assert workflow.context.execution_history['llm']['output'].startswith('stub reply to:')
+    stats = endpoint_limiters.get(stub.host, stub.port).stats()
+    assert stats['in_flight'] == 0 and stats['errors'] == 0
+
+
+def _cancel_while_waiting(limiter):
+    """占满名额后另一个线程排队，停止运行后应当很快放弃排队"""
+    stop = threading.Event()
+    errors = []
+
+    def queued():
+        try:
+            with limiter.limit(stop.is_set):
+                pass
+        except RunCancelled as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=queued)
+    thread.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    stop.set()
+    thread.join(2)
+    assert not thread.is_alive() and len(errors) == 1
+    assert time.monotonic() - started < 0.5
+
+
+def test_sync_wait_for_slot_cancelled():
+    limiter = EndpointLimiter('test', initial_window=1, min_window=1, max_window=1)
+    with limiter.limit():
+        _cancel_while_waiting(limiter)
+        assert limiter.stats()['in_flight'] == 1
+    # 放弃排队后名额照常分配给后来的请求
+    _request(limiter, 200)
+    assert limiter.stats()['in_flight'] == 0
+
+
+def test_sync_wait_for_token_cancelled():
+    limiter = EndpointLimiter('test', rate=0.5, burst=1)
+    _request(limiter, 200)
+    _cancel_while_waiting(limiter)
+    assert limiter.stats()['in_flight'] == 0
@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+from starlette.testclient import TestClient
+
+import workflow_server
+from conftest import chain
+from workflow import LLMNode, Workflow, WorkflowContext
+from workflow_cache import llm_cache
+from workflow_codec import dumps
+
+
+def _llm(stub, content, **data):
+    return dict({'ip': stub.host, 'port': stub.port, 'stream': True, 'cache': False, 'singleFlight': False,
+                 'messages': [{'role': 'user', 'content': content}]}, **data)
+
+
+def _collect(workflow):
+    events, lock = [], threading.Lock()
+
+    def sink(event):
+        with lock:
+            events.append(event)
+    workflow.context.event_sink = sink
+    return events
+
+
+def test_sse_lines():
+    node = LLMNode('llm', 'llm', {'messages': []})
+    context = WorkflowContext()
+    events = []
+    context.event_sink = events.append
+    chunks = []
+    lines = [
+        ': keep-alive',
+        '',
+        'event: message',
+        'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+        'data: {"choices": [{"delta": {"content": "你"}}]}',
+        'data:{"choices": [{"delta": {"content": "好"}}]}',
+        'data: {"choices": []}',
+        'data: {"choices": [{"delta": {"content": ""}, "finish_reason": "stop"}]}',
+    ]
+    assert all(node._consume_sse_line(context, line, chunks) for line in lines)
+    assert node._consume_sse_line(context, 'data: [DONE]', chunks) is False
+    assert chunks == ['你', '好']
+    assert events == [{'event': 'token', 'nodeId': 'llm', 'delta': '你'},
+                      {'event': 'token', 'nodeId': 'llm', 'delta': '好'}]
+
+
+def test_malformed_sse_payload_raises():
+    node = LLMNode('llm', 'llm', {'messages': []})
+    with pytest.raises(ValueError):
+        node._consume_sse_line(WorkflowContext(), 'data: {not json', [])
+
+
+@pytest.mark.parametrize('stream', [True, False])
+def test_tokens_concatenate_to_output(engine, stub, stream):
+    workflow = Workflow(chain(('in', 'input', {'action': 'go'}),
+                              ('llm', 'llm', _llm(stub, f'tokens {engine.mode} {stream}', stream=stream))))
+    events = _collect(workflow)
+    engine(workflow)
+    output = workflow.context.execution_history['llm']['output']
+    assert output == f'stub reply to: tokens {engine.mode} {stream}'
+    tokens = [event for event in events if event.get('event') == 'token']
+    if stream:
+        assert len(tokens) > 1
+        assert all(event['nodeId'] == 'llm' for event in tokens)
+        assert ''.join(event['delta'] for event in tokens) == output
+    else:
+        assert tokens == []
+
+
+def test_cached_stream_replays_full_text(engine, stub):
+    data = chain(('in', 'input', {'action': 'go'}),
+                 ('llm', 'llm', _llm(stub, f'cached {engine.mode}', cache=True)))
+    llm_cache.clear()
+    engine(Workflow(data))
+    workflow = Workflow(data)
+    events = _collect(workflow)
+    engine(workflow)
+    assert events == [{'event': 'token', 'nodeId': 'llm', 'delta': f'stub reply to: cached {engine.mode}'}]
+
+
+def test_tokens_sent_over_websocket(stub):
+    data = chain(('in', 'input', {'action': 'go'}), ('llm', 'llm', _llm(stub, 'over websocket')))
+    client = TestClient(workflow_server.app)
+    with client.websocket_connect("/workflow/runtime/stream-test") as ws:
+        ws.send_text(dumps(dumps(data)))
+        messages = []
+        while True:
+            message = ws.receive_json()
+            messages.append(message)
+            if message.get('nodeId') == 'llm' and 'isSuccess' in message:
+                break
+    tokens = [message['delta'] for message in messages if message.get('event') == 'token']
+    assert len(tokens) > 1
+    assert ''.join(tokens) == messages[-1]['output'] == 'stub reply to: over websocket'
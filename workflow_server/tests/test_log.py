@@ -0,0 +1,121 @@
+import io
+import json
+import logging
+import threading
+
+from workflow_log import BatchLogSink, EventFormatter, EventLogger, truncate
+
+
+class _Stream(io.StringIO):
+    """记录每次 flush 时已写入的内容，gate 未打开时第一次写入阻塞"""
+
+    def __init__(self, fail=False, gate=None):
+        super().__init__()
+        self.fail = fail
+        self.gate = gate
+        self.writing = threading.Event()
+        self.flushed = []
+
+    def write(self, text):
+        self.writing.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail:
+            raise OSError("disk full")
+        return super().write(text)
+
+    def flush(self):
+        self.flushed.append(self.getvalue())
+
+
+class _Broken:
+    def __repr__(self):
+        raise RuntimeError("unprintable")
+
+
+def _logger(sink, name):
+    logger = logging.getLogger(f"workflow-test.{name}")
+    logger.handlers[:] = [sink.handler]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+
+def _records(count, name='batch'):
+    return [logging.LogRecord(f"workflow-test.{name}", logging.INFO, __file__, 0, "node.execute", None, None)
+            for _ in range(count)]
+
+
+def _write_while_blocked(batch_size, count):
+    """第一条日志写入阻塞期间再产生 count 条，返回每次 flush 写入的行数"""
+    gate = threading.Event()
+    stream = _Stream(gate=gate)
+    sink = BatchLogSink(stream, EventFormatter('text'), batch_size=batch_size)
+    first, *rest = _records(count + 1)
+    sink.records.put(first)
+    stream.writing.wait(5)
+    for record in rest:
+        sink.records.put(record)
+    gate.set()
+    sink.stop()
+    assert sink.dropped == 0
+    sizes, previous = [], 0
+    for text in stream.flushed:
+        sizes.append(text.count('\n') - previous)
+        previous = text.count('\n')
+    return sizes
+
+
+def test_queued_records_written_in_one_batch():
+    # 每批只有一次写入和 flush
+    assert _write_while_blocked(batch_size=100, count=5) == [1, 5]
+
+
+def test_batch_size_limits_one_write():
+    assert _write_while_blocked(batch_size=2, count=5) == [1, 2, 2, 1]
+
+
+def test_unformattable_record_dropped_alone():
+    stream = _Stream()
+    sink = BatchLogSink(stream, EventFormatter('text'))
+    good, bad = _records(2)
+    bad.msg, bad.args = "%d", ("not a number",)  # 格式化时抛出 TypeError
+    for record in (good, bad):
+        sink.records.put(record)
+    sink.stop()
+    assert sink.dropped == 1
+    assert stream.getvalue().count('node.execute') == 1
+
+
+def test_write_failure_counts_dropped_lines():
+    sink = BatchLogSink(_Stream(fail=True), EventFormatter('text'))
+    for record in _records(3):
+        sink.records.put(record)
+    sink.stop()
+    assert sink.dropped == 3
+    assert not sink._thread.is_alive()
+
+
+def test_event_logger_fields():
+    stream = _Stream()
+    sink = BatchLogSink(stream, EventFormatter('json'))
+    log = EventLogger('x')
+    log.logger = _logger(sink, 'fields')
+    log.debug("llm.failed", node='n1', error=ValueError('boom'), output='x' * 1000)
+    sink.stop()
+    line = json.loads(stream.getvalue())
+    assert line['event'] == 'llm.failed' and line['level'] == 'DEBUG'
+    assert line['node'] == 'n1' and line['error'] == "ValueError('boom')"
+    assert line['output'] == truncate('x' * 1000) and len(line['output']) < 300
+
+
+def test_disabled_level_skips_formatting():
+    stream = _Stream()
+    sink = BatchLogSink(stream, EventFormatter('text'))
+    log = EventLogger('x')
+    log.logger = _logger(sink, 'disabled')
+    log.logger.setLevel(logging.INFO)
+    # 级别未开启时字段不会被 repr
+    log.debug("node.execute", value=_Broken())
+    sink.stop()
+    assert stream.getvalue() == ''
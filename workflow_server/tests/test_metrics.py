@@ -0,0 +1,65 @@
+import workflow_metrics
+from conftest import chain, workflow_json
+from workflow import Workflow
+from workflow_metrics import BoundedLabels, OTHER_LABEL, RunMetrics, endpoint_label, node_type_label, payload_size
+from workflow_response import LazyResponse
+
+
+def _gauge(gauge) -> float:
+    return gauge._values.get((), 0)
+
+
+def test_payload_size_uses_cheap_sources_only(monkeypatch):
+    monkeypatch.setattr(workflow_metrics, 'METRICS_SIZE_SAMPLE', 0)
+    assert payload_size(None) == 0
+    assert payload_size('abc') == 3
+    assert payload_size(b'abcd') == 4
+    assert payload_size(LazyResponse(200, {}, b'x' * 100)) == 100
+    # 列表、字典没有现成的大小，默认不遍历
+    assert payload_size([{'id': i} for i in range(1000)]) is None
+
+
+def test_payload_size_sampling(monkeypatch):
+    monkeypatch.setattr(workflow_metrics, 'METRICS_SIZE_SAMPLE', 1)
+    assert payload_size([{'id': i} for i in range(10)]) > 0
+
+
+def test_bounded_labels():
+    labels = BoundedLabels(2)
+    assert [labels('a'), labels('b'), labels('c'), labels('a')] == ['a', 'b', OTHER_LABEL, 'a']
+
+
+def test_endpoint_and_node_type_labels():
+    assert endpoint_label('http://user:pw@api.example.com:8080/v1/items?id=42') == 'api.example.com'
+    assert endpoint_label('not a url') == OTHER_LABEL
+    assert node_type_label('llm') == 'llm'
+    assert node_type_label('something-made-up') == OTHER_LABEL
+
+
+def test_sub_run_not_counted_as_run():
+    before = _gauge(workflow_metrics.runs_in_flight)
+    parent = RunMetrics('metrics-test')
+    sub = parent.sub_run()
+    assert _gauge(workflow_metrics.runs_in_flight) == before + 1
+    assert sub.workflow == parent.workflow
+    sub.finish('completed')
+    assert _gauge(workflow_metrics.runs_in_flight) == before + 1
+    parent.finish('completed')
+    assert _gauge(workflow_metrics.runs_in_flight) == before
+
+
+def test_map_node_runs_counted_once(engine):
+    body = chain(('double', 'transform', {}))
+    data = workflow_json([
+        ('in', 'input', {'action': '[1, 2, 3]'}),
+        ('map', 'map', {'body': body}),
+    ], [('in', 'map', None)])
+    workflow = Workflow(data)
+    workflow.metrics_label = f"map-runs-{engine.mode}"
+    engine(workflow)
+    label = workflow_metrics.workflow_label(workflow.metrics_label)
+    counts = {labels: values[-1] for labels, values in workflow_metrics.run_duration._series.items()
+              if labels[0] == label}
+    assert sum(counts.values()) == 1
+    # 子运行中的节点仍然记在外层运行的标签下
+    assert workflow_metrics.nodes_total._values[('transform', label, 'completed')] == 3
@@ -0,0 +1,95 @@
+import copy
+
+import pytest
+
+from conftest import chain, workflow_json
+from workflow import Workflow, compile_workflow
+from workflow_plan import PlanCache, plan_cache, workflow_fingerprint
+
+
+def _data(action='hello'):
+    return chain(('in', 'input', {'action': action}), ('t', 'transform', {}), ('out', 'output', {}))
+
+
+def test_fingerprint_ignores_editor_fields():
+    data = _data()
+    edited = copy.deepcopy(data)
+    edited['nodes'][0]['data']['runtime'] = {'isSuccess': True, 'output': 'last run'}
+    edited['nodes'][0]['position'] = {'x': 10, 'y': 20}
+    edited['nodes'][0]['selected'] = True
+    edited['edges'][0]['animated'] = True
+    edited['name'] = 'renamed'
+    assert workflow_fingerprint(edited) == workflow_fingerprint(data)
+
+
+@pytest.mark.parametrize('edit', [
+    lambda data: data['nodes'][0]['data'].update(action='changed'),
+    lambda data: data['edges'][0].update(target='out'),
+    lambda data: data['edges'][0].update(sourceHandle='true'),
+    lambda data: data['nodes'].append({'id': 'extra', 'data': {'type': 'transform'}}),
+])
+def test_fingerprint_changes_with_config(edit):
+    data = _data()
+    edited = copy.deepcopy(data)
+    edit(edited)
+    assert workflow_fingerprint(edited) != workflow_fingerprint(data)
+
+
+def test_cache_hit_shares_plan():
+    cache = PlanCache(maxsize=4)
+    first = cache.get_or_compile(_data(), compile_workflow)
+    # 编辑器回传的运行结果不影响命中
+    again = _data()
+    again['nodes'][1]['data']['runtime'] = {'output': 'x'}
+    assert cache.get_or_compile(again, compile_workflow) is first
+    assert cache.get_or_compile(_data('other'), compile_workflow) is not first
+    assert cache.stats() == {'size': 2, 'maxsize': 4, 'hits': 1, 'misses': 2}
+
+
+def test_cache_lru_eviction():
+    cache = PlanCache(maxsize=2)
+    plans = {action: cache.get_or_compile(_data(action), compile_workflow) for action in 'abc'}
+    assert cache.stats()['size'] == 2
+    # a 最早写入，已被淘汰；b、c 仍命中
+    assert cache.get_or_compile(_data('b'), compile_workflow) is plans['b']
+    assert cache.get_or_compile(_data('a'), compile_workflow) is not plans['a']
+    # 访问 b 后 c 成为最久未用的
+    assert cache.get_or_compile(_data('b'), compile_workflow) is plans['b']
+    assert cache.get_or_compile(_data('c'), compile_workflow) is not plans['c']
+
+
+def test_workflows_share_global_plan():
+    data = _data('shared-plan')
+    first, second = Workflow(data), Workflow(copy.deepcopy(data))
+    assert first.plan is second.plan
+    assert first.nodes is second.nodes
+    assert first.context is not second.context
+    assert first.metrics_label == first.plan.fingerprint[:12]
+    assert plan_cache.stats()['hits'] >= 1
+
+
+def test_plan_structure():
+    plan = compile_workflow(workflow_json(
+        [('in', 'input', {'action': 'go'}),
+         ('a', 'transform', {'template': '${context.in.output} ${global.x}'}),
+         ('b', 'transform', {'template': '${a.output} ${input}'}),
+         ('loop', 'transform', {})],
+        [('in', 'a', None), ('a', 'b', None), ('b', 'loop', None), ('loop', 'b', None)]))
+    assert plan.order[:2] == ('in', 'a')
+    assert plan.cyclic == frozenset({'b', 'loop'})
+    assert plan.successors['a'] == ('b',) and plan.predecessors['b'] == ('a', 'loop')
+    assert plan.in_degree['b'] == 2
+    assert plan.references == {'a': ('in',), 'b': ('a',)}
+    assert plan.consumers == {'in': ('a',), 'a': ('b',)}
+    with pytest.raises(TypeError):
+        plan.nodes['x'] = None  # 计划只读
+
+
+def test_from_plan_runs_are_independent(engine):
+    plan = compile_workflow(_data('from-plan'))
+    first, second = Workflow.from_plan(plan), Workflow.from_plan(plan)
+    engine(first)
+    assert first.context.execution_history['out']['status'] == 'completed'
+    assert 'out' not in second.context.execution_history
+    engine(second)
+    assert second.context.execution_history['in']['output'] == first.context.execution_history['in']['output']
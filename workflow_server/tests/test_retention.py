@@ -0,0 +1,167 @@
+import gc
+import weakref
+
+import pytest
+
+from conftest import chain, workflow_json
+from workflow import NODE_TYPE_MAP, Node, Workflow
+import workflow_history
+from workflow_history import ExecutionRecord, HistoryRetention, PayloadHandle, approx_size, flush_spills
+
+
+class Rows(list):
+    """可以被弱引用的列表，用来确认大对象确实被释放"""
+
+
+class RowsNode(Node):
+    """输出 data.rows 行记录"""
+
+    def __init__(self, node_id, node_type, data):
+        super().__init__(node_id, node_type, data)
+        self.rows = int(data.get('rows', 20000))
+
+    def execute(self, context, input_data=None):
+        output = Rows({'id': i, 'value': f"row-{i}"} for i in range(self.rows))
+        context.record_execution(self.id, "completed", input_data, output)
+        return self.next_nodes
+
+
+class CountNode(Node):
+    """只输出输入的长度，不持有输入"""
+
+    def execute(self, context, input_data=None):
+        context.record_execution(self.id, "completed", None, len(input_data) if isinstance(input_data, list) else 0)
+        return self.next_nodes
+
+
+@pytest.fixture(autouse=True)
+def test_nodes(monkeypatch):
+    monkeypatch.setitem(NODE_TYPE_MAP, 'test_rows', RowsNode)
+    monkeypatch.setitem(NODE_TYPE_MAP, 'test_count', CountNode)
+
+
+def _run_live(run, workflow_data, check_node):
+    """live 保留策略下运行，check_node 完成时记录大对象是否已经被回收"""
+    workflow = Workflow(workflow_data)
+    workflow.context.retention = HistoryRetention('live', workflow.plan)
+    refs = []
+    alive_at_check = []
+
+    def on_node_complete(node_id, is_success, input, output, error):
+        if node_id == 'rows':
+            refs.append(weakref.ref(output))
+        elif node_id == check_node:
+            gc.collect()
+            alive_at_check.append(refs[0]() is not None)
+
+    run(workflow, on_node_complete)
+    return workflow, alive_at_check
+
+
+def test_unreferenced_output_freed_while_run_continues(engine):
+    workflow, alive = _run_live(engine, chain(
+        ('in', 'input', {}),
+        ('rows', 'test_rows', {'rows': 20000}),
+        ('count', 'test_count', {}),
+        ('tail1', 'test_count', {}),
+        ('tail2', 'test_count', {}),
+    ), 'tail2')
+    assert workflow.context.execution_history['rows'].released
+    # 下游已经读取完输入，执行记录和调度器都不再持有这 20000 行
+    assert alive == [False]
+    assert workflow.context.execution_history['count']['output'] is None  # 也已释放
+
+
+def test_referenced_output_kept_until_last_reader(engine):
+    data = workflow_json([
+        ('in', 'input', {}),
+        ('rows', 'test_rows', {'rows': 100}),
+        ('count', 'test_count', {}),
+        ('reader', 'conditional', {'condition': '${context.rows.output[0].id} == 0'}),
+        ('done', 'test_count', {}),
+    ], [('in', 'rows', None), ('rows', 'count', None), ('count', 'reader', None), ('reader', 'done', 'true')])
+    workflow = Workflow(data)
+    workflow.context.retention = HistoryRetention('live', workflow.plan)
+    seen = {}
+
+    def on_node_complete(node_id, is_success, input, output, error):
+        seen[node_id] = (is_success, output)
+
+    engine(workflow, on_node_complete)
+    # 引用者执行时记录仍在，读取成功
+    assert seen['reader'] == (True, True)
+    assert 'done' in seen
+    assert workflow.context.execution_history['rows'].released
+
+
+def test_join_releases_branch_outputs(engine):
+    data = workflow_json([
+        ('in', 'input', {}),
+        ('fan', 'fanIn', {}),
+        ('rows', 'test_rows', {'rows': 1000}),
+        ('other', 'test_count', {}),
+        ('join', 'fanOut', {}),
+        ('tail1', 'test_count', {}),
+        ('tail2', 'test_count', {}),
+    ], [('in', 'fan', None), ('fan', 'rows', None), ('fan', 'other', None),
+        ('rows', 'join', None), ('other', 'join', None), ('join', 'tail1', None), ('tail1', 'tail2', None)])
+    workflow, alive = _run_live(engine, data, 'tail2')
+    assert alive == [False]
+
+
+def test_last_n_retention():
+    history = {}
+    retention = HistoryRetention('last:2')
+    for node_id in 'abcd':
+        history[node_id] = ExecutionRecord('completed', None, node_id * 10)
+        retention.settle(history, node_id)
+    assert [history[node_id].released for node_id in 'abcd'] == [True, True, False, False]
+    assert history['d']['output'] == 'dddddddddd'
+
+
+def test_spill_round_trip():
+    history = {'a': ExecutionRecord('completed', None, {'rows': list(range(5000))})}
+    retention = HistoryRetention('live:spill')
+    retention.settle(history, 'a')
+    flush_spills()
+    record = history['a']
+    assert isinstance(record.raw_output, PayloadHandle)
+    assert record['output'] == {'rows': list(range(5000))}
+
+
+def test_large_output_spilled_after_results_delivered(engine, monkeypatch):
+    monkeypatch.setattr(workflow_history, 'PAYLOAD_MAX_BYTES', 64 * 1024)
+    workflow = Workflow(chain(
+        ('in', 'input', {}),
+        ('rows', 'test_rows', {'rows': 20000}),
+        ('count', 'test_count', {}),
+    ))
+    delivered = {}
+
+    def on_node_complete(node_id, is_success, input, output, error):
+        delivered[node_id] = output
+        if node_id == 'rows':
+            # 回调拿到的是节点产生的对象本身，不是从磁盘加载的副本
+            delivered['raw'] = workflow.context.execution_history['rows'].raw_output
+
+    engine(workflow, on_node_complete)
+    flush_spills()
+    assert delivered['rows'] is delivered['raw']
+    assert delivered['count'] == 20000
+    record = workflow.context.execution_history['rows']
+    assert isinstance(record.raw_output, PayloadHandle)
+    assert record['output'] == delivered['rows']
+
+
+def test_approx_size_is_bounded():
+    rows = [{'id': i, 'value': f"row-{i}"} for i in range(100000)]
+    size = approx_size(rows)
+    # 与实际大小同一数量级即可
+    assert 2_000_000 < size < 20_000_000
+    assert approx_size('x' * 10) == 10
+    assert approx_size(None) == 0
+
+
+def test_unknown_retention_rejected():
+    with pytest.raises(ValueError):
+        HistoryRetention('forever')
@@ -0,0 +1,154 @@
+import threading
+import time
+
+import pytest
+
+from conftest import workflow_json
+from workflow import Workflow
+from workflow_scheduler import DagScheduler
+
+
+def _branching(condition):
+    return workflow_json(
+        [('in', 'input', {'action': 'hi'}),
+         ('cond', 'conditional', {'condition': condition}),
+         ('yes', 'transform', {}),
+         ('no', 'transform', {})],
+        [('in', 'cond', None), ('cond', 'yes', 'true'), ('cond', 'no', 'false')])
+
+
+@pytest.mark.parametrize('condition, taken, skipped', [
+    (True, 'yes', 'no'),
+    (False, 'no', 'yes'),
+    (1, 'yes', 'no'),
+    ('${input} == "hi"', 'yes', 'no'),
+    ('${input} == "bye"', 'no', 'yes'),
+])
+def test_conditional_branches(engine, condition, taken, skipped):
+    workflow = engine(Workflow(_branching(condition)))
+    history = workflow.context.execution_history
+    assert history['cond']['status'] == 'completed'
+    assert taken in history
+    assert skipped not in history
+
+
+@pytest.mark.parametrize('condition', [None, ['x'], {'op': '=='}])
+def test_invalid_condition_rejected_at_load(condition):
+    with pytest.raises(ValueError, match='cond'):
+        Workflow(_branching(condition))
+
+
+def _fan(stub, latencies, **join):
+    """扇入后按给定延迟（毫秒，None 为连接失败）并行请求，再由扇出节点汇聚"""
+    branches = [(name, 'api', {'url': f"{stub.base_url}/items?size=1&branch={name}&latency={latency}"
+                               if latency is not None else 'http://127.0.0.1:1/'})
+                for name, latency in latencies.items()]
+    nodes = [('in', 'input', {'action': 'go'}), ('fork', 'fanIn', {})] + branches + [
+        ('join', 'fanOut', join), ('after', 'transform', {})]
+    edges = [('in', 'fork', None)] + [('fork', name, None) for name in latencies] + [
+        (name, 'join', None) for name in latencies] + [('join', 'after', None)]
+    return workflow_json(nodes, edges)
+
+
+@pytest.mark.parametrize('join, latencies, arrived, cancelled', [
+    ({}, {'fast': 0, 'mid': 150, 'slow': 300}, {'fast', 'mid', 'slow'}, set()),
+    ({'joinPolicy': 'all'}, {'fast': 0, 'broken': None, 'mid': 150}, {'fast', 'mid'}, set()),
+    ({'joinPolicy': 'firstK'}, {'fast': 0, 'mid': 600, 'slow': 1500}, {'fast'}, {'mid', 'slow'}),
+    ({'joinPolicy': 'firstK', 'k': 2}, {'fast': 0, 'mid': 150, 'slow': 1500}, {'fast', 'mid'}, {'slow'}),
+    ({'joinPolicy': 'quorum'}, {'fast': 0, 'mid': 150, 'slow': 1500}, {'fast', 'mid'}, {'slow'}),
+    ({'joinPolicy': 'quorum'}, {'broken': None, 'fast': 0, 'mid': 150}, {'fast', 'mid'}, set()),
+    ({'joinPolicy': 'deadline', 'deadline': 0.4}, {'fast': 0, 'mid': 100, 'slow': 1500}, {'fast', 'mid'}, {'slow'}),
+])
+def test_join_policies(engine, stub, join, latencies, arrived, cancelled):
+    workflow = engine(Workflow(_fan(stub, latencies, **join)))
+    history = workflow.context.execution_history
+    assert set(history['join']['output']['branches']) == arrived
+    assert {name for name in latencies if history[name]['status'] == 'cancelled'} == cancelled
+    assert history['after']['status'] == 'completed'
+
+
+@pytest.mark.parametrize('join', [
+    {'joinPolicy': 'any'},
+    {'joinPolicy': 'deadline'},
+    {'joinPolicy': 'deadline', 'deadline': 0},
+    {'joinPolicy': 'deadline', 'deadline': -1},
+    {'joinPolicy': 'deadline', 'deadline': 'soon'},
+])
+def test_invalid_join_policy_rejected(join):
+    with pytest.raises(ValueError, match='[Jj]oin policy'):
+        Workflow(workflow_json([('join', 'fanOut', join)], []))
+
+
+def _map(items, body, concurrency):
+    return workflow_json([('in', 'input', {'action': 'go'}),
+                          ('map', 'map', {'items': items, 'body': body, 'concurrency': concurrency})],
+                         [('in', 'map', None)])
+
+
+def _sampled_threads(run):
+    """执行 run 期间采样，返回出现过的线程名"""
+    names, done = set(), threading.Event()
+
+    def sample():
+        while not done.is_set():
+            names.update(thread.name for thread in threading.enumerate())
+            time.sleep(0.005)
+
+    sampler = threading.Thread(target=sample, name='sampler')
+    sampler.start()
+    try:
+        run()
+    finally:
+        done.set()
+        sampler.join()
+    return names
+
+
+def test_map_items_run_in_parallel_and_keep_order(engine, stub):
+    body = workflow_json([('post', 'api', {'method': 'POST', 'url': f"{stub.base_url}/items?latency=200&size=1",
+                                           'body': '{"item": "${global.item}"}'})], [])
+    workflow = Workflow(_map('${global.values}', body, 4))
+    workflow.context.global_data['values'] = list('abcd')
+    started = time.monotonic()
+    engine(workflow)
+    assert time.monotonic() - started < 0.6
+    results = workflow.context.execution_history['map']['output']['results']
+    assert [result['data']['echo']['item'] for result in results] == list('abcd')
+
+
+def test_nested_maps_share_bounded_pool(stub):
+    leaf = workflow_json([('get', 'api', {'url': f"{stub.base_url}/items?latency=30&size=1"})], [])
+    inner = workflow_json([('inner', 'map', {'items': '${global.values}', 'body': leaf, 'concurrency': 8})], [])
+    workflow = Workflow(_map('${global.values}', inner, 8))
+    workflow.context.global_data['values'] = list(range(8))
+    before = {thread.name for thread in threading.enumerate()}
+    names = _sampled_threads(workflow.execute)
+    # 桩服务处理请求的线程不计入
+    extra = {name for name in names - before if not name.startswith('workflow-sync-node')
+             and 'process_request' not in name} - {'sampler'}
+    # 调度器、映射节点和子运行都不再各开线程池
+    assert extra == set()
+    outer = workflow.context.execution_history['map']['output']
+    assert outer['errors'] == [] and len(outer['results']) == 8
+    assert all(len(result['results']) == 8 for result in outer['results'])
+
+
+def test_run_concurrency_limited_on_shared_pool(stub):
+    workflow = Workflow(_fan(stub, {f"b{i}": 200 for i in range(4)}))
+    started = time.monotonic()
+    DagScheduler(workflow, max_workers=2).run()
+    elapsed = time.monotonic() - started
+    # 四个分支每次最多执行两个
+    assert 0.4 <= elapsed < 0.8
+    assert set(workflow.context.execution_history['join']['output']['branches']) == {'b0', 'b1', 'b2', 'b3'}
+
+
+def test_ready_nodes_wait_for_slots_held_by_timed_out_node(stub):
+    data = _fan(stub, {'stuck': 400, 'next': 0})
+    data['nodes'][2]['data']['nodeTimeout'] = 0.1
+    workflow = Workflow(data)
+    DagScheduler(workflow, max_workers=1).run()
+    history = workflow.context.execution_history
+    assert history['stuck']['status'] == 'failed'
+    assert history['next']['status'] == 'completed'
+    assert set(history['join']['output']['branches']) == {'next'}
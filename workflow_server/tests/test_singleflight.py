@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from workflow_limiter import EndpointLimiter
+from workflow_singleflight import RunCancelled, SingleFlight
+
+
+def _follow(flight, key, fn, results):
+    results.append(flight.do(key, fn))
+
+
+def test_followers_share_leader_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return 'reply'
+
+    results = []
+    leader = threading.Thread(target=_follow, args=(flight, 'k', fetch, results))
+    leader.start()
+    while not flight.stats()['in_flight']:
+        pass
+    follower = threading.Thread(target=_follow, args=(flight, 'k', fetch, results))
+    follower.start()
+    while flight.shared == 0:
+        pass
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert sorted(results) == [('reply', False), ('reply', True)]
+    assert len(calls) == 1
+
+
+def test_leader_cancellation_not_shared_with_followers():
+    flight = SingleFlight()
+    leader_waiting = threading.Event()
+    stop_leader = threading.Event()
+
+    def cancelled_fetch():
+        leader_waiting.set()
+        stop_leader.wait(5)
+        raise RunCancelled("工作流已停止")
+
+    errors, results = [], []
+
+    def leader():
+        try:
+            flight.do('k', cancelled_fetch)
+        except RunCancelled as e:
+            errors.append(e)
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    leader_waiting.wait(5)
+    follower = threading.Thread(target=_follow, args=(flight, 'k', lambda: 'fresh', results))
+    follower.start()
+    while flight.shared == 0:
+        pass
+    stop_leader.set()
+    leader_thread.join(5)
+    follower.join(5)
+    assert len(errors) == 1
+    # 等待者自己重新发起请求，拿到的是正常结果
+    assert results == [('fresh', False)]
+
+
+def test_run_cancelled_is_not_congestion():
+    limiter = EndpointLimiter('test', initial_window=8, latency_tolerance=0)
+    with pytest.raises(RunCancelled):
+        with limiter.limit():
+            raise RunCancelled("工作流已停止")
+    stats = limiter.stats()
+    assert stats['window'] == 8
+    assert stats['errors'] == 0 and stats['in_flight'] == 0
+
+    with pytest.raises(ConnectionError):
+        with limiter.limit():
+            raise ConnectionError("refused")
+    assert limiter.stats()['window'] == 4
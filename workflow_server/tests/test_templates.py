@@ -0,0 +1,145 @@
+import re
+from functools import reduce
+
+import pytest
+
+from extract_var import ExpressionEvaluateVariablor, TemplateCache, compile_template
+
+_PATTERN = re.compile(r'\$\{(.*?)\}')
+
+
+def _legacy_evaluate(expression, context_data, input_data, global_data=None):
+    """改为编译模板之前的 ExpressionEvaluateVariablor.evaluate，作为对照"""
+    global_data = global_data or {}
+
+    def get_item(obj, part):
+        if isinstance(part, int):
+            return obj[part] if isinstance(obj, (list, tuple)) and part < len(obj) else None
+        if isinstance(obj, dict):
+            return obj.get(part)
+        return getattr(obj, part) if hasattr(obj, part) else None
+
+    def split(path):
+        parts = []
+        for part in path.split('.'):
+            if '[' in part and ']' in part:
+                key = part[:part.index('[')]
+                if key:
+                    parts.append(key)
+                parts.extend(int(index) for index in re.findall(r'\[(\d+)\]', part))
+            elif part:
+                parts.append(part)
+        return parts
+
+    def resolve_path(path, data):
+        if not path or data is None:
+            return data
+        try:
+            return reduce(get_item, split(path), data)
+        except (KeyError, IndexError, AttributeError, TypeError):
+            return None
+
+    def resolve(ref):
+        if not ref:
+            return None
+        ref = ref.strip()
+        if ref == 'input':
+            return input_data
+        for prefix, data in (('input.', input_data), ('context.', context_data), ('global.', global_data)):
+            if ref.startswith(prefix):
+                return resolve_path(ref[len(prefix):], data)
+        return resolve_path(ref, context_data)
+
+    if not isinstance(expression, str):
+        return expression
+
+    def replace(match):
+        value = resolve(match.group(1))
+        return str(value) if value is not None else match.group(0)
+    return _PATTERN.sub(replace, expression.strip())
+
+
+class _Point:
+    def __init__(self):
+        self.x = 3
+        self.tags = ['a', 'b']
+
+
+CONTEXT = {
+    'user': {'name': 'admin', 'permissions': ['read', 'write'], 'active': True, 'score': 0, 'none': None},
+    'settings': {'timeout': 30, '1': [1, 2, [3, 4]], 'ratio': 0.5, 'empty': ''},
+    '123': {'input': 123, 'output': {'text': '中文', 'items': [{'id': 7}]}},
+    'context': {'shadow': 'nested context key'},
+    'point': _Point(),
+}
+INPUT = {'request': {'params': {'id': 12345, 'filters': [{'type': 'date'}]}}, 'flag': False}
+GLOBAL = {'item': {'name': 'g'}, 'index': 0, 'list': [10, 20]}
+
+EXPRESSIONS = [
+    'plain text',
+    '',
+    '   padded   ',
+    '${context.user.name}',
+    '${user.name}',  # 省略 context.
+    '${context.user.permissions[1]}',
+    '${context.user.permissions[5]}',  # 下标越界
+    '${context.user.permissions}',  # 列表转为文本
+    '${context.user.active} ${context.user.score} ${context.user.none}',  # 布尔、0 和 null
+    '${context.settings.1[2][1]}',
+    '${context.settings.1.x}',
+    '${context.settings.ratio}',
+    '[${context.settings.empty}]',
+    '${context.123.output.items[0].id}',
+    '${context.123.output.text}',
+    '${context.context.shadow}',
+    '${context}',
+    '${context.point.x} ${context.point.tags[1]}',
+    '${input}',
+    '${input.request.params.filters[0].type}',
+    '${input.flag}',
+    '${input.request.missing.deep}',
+    '${global.item.name} #${global.index} ${global.list[1]}',
+    '${ input.request.params.id }',
+    '${}',
+    '${not.exist} and ${context.user.name}',
+    '${context.user.name}${context.settings.timeout}',
+    '${context.settings.1[1]} > ${context.settings.1[0]} should be ${result}',
+    'unterminated ${context.user.name',
+]
+
+
+@pytest.mark.parametrize('expression', EXPRESSIONS)
+def test_render_matches_legacy(expression):
+    expected = _legacy_evaluate(expression, CONTEXT, INPUT, GLOBAL)
+    assert compile_template(expression).render(CONTEXT, INPUT, GLOBAL) == expected
+    assert ExpressionEvaluateVariablor(CONTEXT, INPUT, GLOBAL).evaluate(expression) == expected
+
+
+@pytest.mark.parametrize('input_data', [None, 'text', 42, [1, 2], {'a': {'b': None}}])
+def test_non_dict_roots_match_legacy(input_data):
+    for expression in ('${input}', '${input.a}', '${input.a.b}', '${input[0]}', 'x ${global.missing}'):
+        expected = _legacy_evaluate(expression, {}, input_data, None)
+        assert compile_template(expression).render({}, input_data, None) == expected
+
+
+@pytest.mark.parametrize('value', [None, 'text', 42, 2.5, True])
+def test_non_string_expression_passed_through(value):
+    assert ExpressionEvaluateVariablor(CONTEXT, INPUT).evaluate(value) == value
+
+
+def test_single_reference_keeps_type():
+    assert compile_template('${context.user.permissions}').value(CONTEXT, INPUT, GLOBAL) == ['read', 'write']
+    assert compile_template('${input.flag}').value(CONTEXT, INPUT, GLOBAL) is False
+    assert compile_template('${context.not.exist}').value(CONTEXT, INPUT, GLOBAL) is None
+    # 不是单个引用时与 render 相同
+    assert compile_template('n=${global.index}').value(CONTEXT, INPUT, GLOBAL) == 'n=0'
+
+
+def test_template_cache():
+    cache = TemplateCache(maxsize=2)
+    first = cache.get('${a}')
+    assert cache.get('${a}') is first
+    cache.get('${b}')
+    cache.get('${c}')
+    assert cache.get('${a}') is not first
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 4}
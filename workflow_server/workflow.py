@@ -1,40 +1,71 @@
 import os
+import logging
 from dotenv import load_dotenv
-import datetime
 import json
-import requests
+import asyncio
+import contextvars
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List, Set
-from collections import deque
-from extract_var import ExpressionEvaluateVariablor
+from typing import Dict, Any, Optional, List, Set, Mapping, Callable
+from collections import ChainMap
+from threading import Event, Lock
+from extract_var import CompiledTemplate, compile_template
 from workflow_utils import parse_string_2_multi
 from multienv import multienv
+from workflow_scheduler import DagScheduler, AsyncDagScheduler, sync_node_executor
+from workflow_plan import WorkflowPlan, context_references, node_config_hash, plan_cache, workflow_fingerprint
+from workflow_history import ExecutionRecord, HistoryRetention
+from workflow_cache import LLM_CACHE_ENABLED, llm_cache, llm_cache_key
+from workflow_http import http_sessions, httpx
+from workflow_limiter import endpoint_limiters
+from workflow_singleflight import SINGLE_FLIGHT_ENABLED, IDEMPOTENT_METHODS, RunCancelled, flight_key, single_flight
+from workflow_log import get_logger
+from workflow_metrics import KNOWN_NODE_TYPES, RunMetrics
 
 
-from workflow_bool_eval import evaluate_ast, evaluate_expression, parse_expression
+from workflow_bool_eval import compile_condition
+from workflow_filter import BatchCondition
+from workflow_response import LazyResponse
+from workflow_codec import dumps, loads
+
+
+log = get_logger("node")
+run_log = get_logger("run")
 
 
 class WorkflowContext:
     """工作流上下文，用于跟踪执行状态和传递数据"""
 
     def __init__(self):
-        self.execution_history: Dict[str, Dict[str, Any]] = {}  # 节点ID -> 执行记录
+        self.execution_history: Dict[str, ExecutionRecord] = {}  # 节点ID -> 执行记录
         self.global_data: Dict[str, Any] = {}  # 全局共享数据
         self.current_data: Any = None  # 当前传递的数据
+        self.event_sink: Optional[Callable[[Dict[str, Any]], None]] = None  # 运行中事件（如流式文本）的接收者
+        self.retention: Optional[HistoryRetention] = None  # 执行记录保留策略，None 表示全部保留
+        self.cancel_event: Optional[Event] = None  # 运行被停止或超时时置位，由调度器设置
+        self.abandoned: Set[str] = set()  # 已超时或被取消的节点，线程中迟到的执行记录不再写入
+        self.run_metrics: Optional[RunMetrics] = None  # 当前运行的指标记录，由调度器设置
 
     def record_execution(self, node_id: str, status: str, input_data: Any, output_data: Any = None):
         """记录节点执行情况"""
-        self.execution_history[node_id] = {
-            'status': status,
-            'input': input_data,
-            'output': output_data,
-            'timestamp': datetime.datetime.now().isoformat()
-        }
+        if node_id in self.abandoned:
+            return
+        self.execution_history[node_id] = ExecutionRecord(status, input_data, output_data)
 
-    def get_node_history(self, node_id: str) -> Optional[Dict[str, Any]]:
+    def is_cancelled(self) -> bool:
+        """运行是否已被停止，长时间运行的同步节点应当定期检查并提前退出"""
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def get_node_history(self, node_id: str) -> Optional[ExecutionRecord]:
         """获取节点的执行历史"""
         return self.execution_history.get(node_id)
 
+    def settle(self, node_id: str):
+        """节点结果已经发出，按保留策略释放执行记录"""
+        if self.retention is not None:
+            self.retention.settle(self.execution_history, node_id)
+            # current_data 只是最近一个节点的输出，不能让它把已释放的输出留到运行结束
+            self.current_data = None
+
     def set_global_data(self, key: str, value: Any):
         """设置全局数据"""
         self.global_data[key] = value
@@ -43,6 +74,20 @@ class WorkflowContext:
         """获取全局数据"""
         return self.global_data.get(key)
 
+    def emit(self, event: Dict[str, Any]):
+        """推送运行中事件，可能在工作线程中调用，event_sink 需要自行保证线程安全"""
+        if self.event_sink is not None:
+            self.event_sink(event)
+
+    def child(self) -> 'WorkflowContext':
+        """创建子上下文视图：可以读取父上下文的执行记录和全局数据，写入互不影响"""
+        child = WorkflowContext()
+        child.execution_history = ChainMap({}, self.execution_history)
+        child.global_data = dict(self.global_data)
+        child.cancel_event = self.cancel_event
+        child.run_metrics = self.run_metrics
+        return child
+
 
 class Node(ABC):
     """抽象基类，所有节点类型的父类"""
@@ -53,6 +98,12 @@ class Node(ABC):
         self.label = data.get('label', '')
         self.action = data.get('action', '未配置')
         self.description = data.get('description', '')
+        # 增量执行时是否可以复用上次的结果，data.incremental（或 data.cacheable）可以显式开启或关闭，
+        # 未设置时只有结果确定的节点复用
+        cacheable = data.get('incremental', data.get('cacheable'))
+        self.incremental = self.deterministic(data) if cacheable is None else cacheable is not False
+        # 节点执行的超时时间（秒），未设置时使用 WORKFLOW_NODE_TIMEOUT
+        self.node_timeout: Optional[float] = data.get('nodeTimeout')
         self.next_nodes: List['Node'] = []
 
     def __execute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List['Node']:
@@ -63,10 +114,26 @@ class Node(ABC):
         """执行节点逻辑，返回后续节点"""
         pass
 
+    async def aexecute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List['Node']:
+        """异步执行节点逻辑，默认把同步的 execute 放到线程池中执行"""
+        loop = asyncio.get_running_loop()
+        # 带上当前的 contextvars（如追踪中的节点），线程池不会自动传递
+        return await loop.run_in_executor(sync_node_executor, contextvars.copy_context().run,
+                                          self.execute, context, input_data)
+
+    @classmethod
+    def deterministic(cls, data: Dict[str, Any]) -> bool:
+        """相同的配置和输入是否总是得到相同的输出"""
+        return True
+
     def add_next_node(self, node: 'Node'):
         """添加后续节点"""
         self.next_nodes.append(node)
 
+    def successors_for_output(self, output: Any) -> List['Node']:
+        """根据节点的输出给出后续节点，用于复用结果时代替 execute 的返回值"""
+        return self.next_nodes
+
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(id={self.id}, type={self.type}, label={self.label})"
 
@@ -75,7 +142,7 @@ class InputNode(Node):
     """数据输入节点"""
 
     def execute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
-        print(f"执行输入节点 {self.label}，action: {self.action}")
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label, action=self.action)
         # 模拟输入数据
         output = parse_string_2_multi(self.action)
         context.current_data = output
@@ -87,7 +154,7 @@ class TransformNode(Node):
     """数据转换节点"""
 
     def execute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
-        print(f"执行转换节点 {self.label}，输入: {input_data}，action: {self.action}")
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label, input=input_data, action=self.action)
         # 模拟转换操作
         output_data = {"transformed_data": f"转换后的{input_data}"}
         context.current_data = output_data
@@ -97,7 +164,9 @@ class TransformNode(Node):
 
 LLM_IP = multienv.get("LLM_IP")
 LLM_PORT = multienv.get("LLM_PORT")
-print(f"LLM host and port: {multienv.get('LLM_IP')}:{multienv.get('LLM_PORT')}")
+# 大模型请求的超时时间（秒），流式请求为两次读取之间的最长间隔；节点可以用 data.timeout 单独设置
+LLM_TIMEOUT = float(multienv.get("LLM_TIMEOUT", "600"))
+log.info("llm.backend", host=LLM_IP, port=LLM_PORT)
 
 
 class LLMNode(Node):
@@ -111,43 +180,171 @@ class LLMNode(Node):
         self.messages = data.get('messages', [])
         self.ip = data.get('ip', LLM_IP)  # 默认IP
         self.port = data.get('port', LLM_PORT)  # 默认端口
+        self.stream = bool(data.get('stream', False))  # 流式输出，增量文本通过 context.emit 推送
+        self.timeout = data.get('timeout') or LLM_TIMEOUT
+        # 只有温度为 0 的确定性调用才走缓存，节点可以用 cache: false 关闭
+        self.cache = LLM_CACHE_ENABLED and data.get('cache', True) is not False and self.temperature == 0
+        # 相同请求在途时合并为一次调用，节点可以用 singleFlight: false 关闭
+        self.single_flight = SINGLE_FLIGHT_ENABLED and data.get('singleFlight', True) is not False
+
+    @classmethod
+    def deterministic(cls, data: Dict[str, Any]) -> bool:
+        # 温度大于 0 时每次回复都不同
+        return not data.get('temperature')
 
     def execute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
-        print(f"执行LLM节点 {self.label}，模型: {self.model}，温度: {self.temperature}")
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label,
+                  model=self.model, temperature=self.temperature)
 
         try:
-            # 准备请求数据
-            request_data = {
-                "model": self.model,
-                "temperature": self.temperature,
-                "max_tokens": self.max_tokens,
-                "messages": self._prepare_messages(input_data),
-                "stream": False,
-            }
+            request_data = self._build_request(input_data)
+            key = self._request_key(request_data)
+            if self.cache:
+                cached = llm_cache.get(key)
+                if cached is not None:
+                    return self._complete_cached(context, input_data, cached, "缓存")
+            if self.single_flight:
+                output_data, shared = single_flight.do(
+                    key, lambda: self._fetch(context, request_data, key))
+                if shared:
+                    return self._complete_cached(context, input_data, output_data, "在途请求")
+            else:
+                output_data = self._fetch(context, request_data, key)
+            return self._complete(context, input_data, output_data)
 
-            # 模拟API调用
-            print(
-                f"发送LLM请求: {json.dumps(request_data, indent=2, ensure_ascii=False)}")
+        except Exception as e:
+            return self._handle_error(context, input_data, e)
 
-            # 这里应该是实际的API调用代码
-            response = requests.post(f"http://{self.ip}:{self.port}/v1/chat/completions",
-                                     headers={
-                                         'Content-Type': 'application/json; charset=utf-8'},
-                                     json=request_data)
-            output_data = response.json()
-            output_data = output_data["choices"][0]["message"]["content"]
+    async def aexecute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
+        if httpx is None:
+            return await super().aexecute(context, input_data)
 
-            context.current_data = output_data
-            context.record_execution(
-                self.id, "completed", input_data, output_data)
-            return self.next_nodes if self.next_nodes else []
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label,
+                  model=self.model, temperature=self.temperature)
+
+        try:
+            request_data = self._build_request(input_data)
+            key = self._request_key(request_data)
+            if self.cache:
+                cached = await llm_cache.aget(key)
+                if cached is not None:
+                    return self._complete_cached(context, input_data, cached, "缓存")
+            if self.single_flight:
+                output_data, shared = await single_flight.ado(
+                    key, lambda: self._afetch(context, request_data, key))
+                if shared:
+                    return self._complete_cached(context, input_data, output_data, "在途请求")
+            else:
+                output_data = await self._afetch(context, request_data, key)
+            return self._complete(context, input_data, output_data)
 
         except Exception as e:
-            error_info = f"LLM节点执行失败: {str(e)}"
-            print(error_info)
-            context.record_execution(self.id, "failed", input_data, {
-                                     "error": error_info})
-            return []  # 出错时停止流程
+            return self._handle_error(context, input_data, e)
+
+    def _fetch(self, context: WorkflowContext, request_data: Dict[str, Any], key: str) -> str:
+        """发送请求并返回回复文本，流式增量推送到发起请求的 context"""
+        with endpoint_limiters.get(self.ip, self.port).limit(context.is_cancelled) as permit:
+            # 总是以流的方式发送，收到响应头时回报首字节延迟，流式与非流式请求的延迟口径一致
+            with http_sessions.stream("POST", self._url(),
+                                      headers={'Content-Type': 'application/json; charset=utf-8'},
+                                      json=request_data,
+                                      timeout=self.timeout) as response:
+                permit.observe(response.status_code)
+                if self.stream:
+                    response.raise_for_status()
+                    chunks = []
+                    for line in response.iter_lines(decode_unicode=True):
+                        # 线程无法被中断，运行停止后关闭响应，释放连接和并发名额
+                        if context.is_cancelled():
+                            raise RunCancelled("工作流已停止")
+                        if not self._consume_sse_line(context, line, chunks):
+                            break
+                    output_data = ''.join(chunks)
+                else:
+                    output_data = self._parse_response(response.json())
+        if self.cache:
+            llm_cache.set(key, output_data)
+        return output_data
+
+    async def _afetch(self, context: WorkflowContext, request_data: Dict[str, Any], key: str) -> str:
+        headers = {'Content-Type': 'application/json; charset=utf-8'}
+        async with endpoint_limiters.get(self.ip, self.port).alimit() as permit:
+            async with http_sessions.astream("POST", self._url(), headers=headers,
+                                             json=request_data, timeout=self.timeout) as response:
+                permit.observe(response.status_code)
+                if self.stream:
+                    response.raise_for_status()
+                    chunks = []
+                    async for line in response.aiter_lines():
+                        if not self._consume_sse_line(context, line, chunks):
+                            break
+                    output_data = ''.join(chunks)
+                else:
+                    await response.aread()
+                    output_data = self._parse_response(response.json())
+        if self.cache:
+            await llm_cache.aset(key, output_data)
+        return output_data
+
+    def _url(self) -> str:
+        return f"http://{self.ip}:{self.port}/v1/chat/completions"
+
+    def _build_request(self, input_data: Any) -> Dict[str, Any]:
+        """准备请求数据"""
+        request_data = {
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "messages": self._prepare_messages(input_data),
+            "stream": self.stream,
+        }
+        log.debug("llm.request", node=self.id, url=self._url(), messages=request_data["messages"])
+        return request_data
+
+    def _consume_sse_line(self, context: WorkflowContext, line: str, chunks: List[str]) -> bool:
+        """
+        处理 OpenAI 兼容的 SSE 流中的一行，增量文本追加到 chunks 并推送给前端
+        :return: 流是否还未结束
+        """
+        if not line or not line.startswith('data:'):
+            return True
+        payload = line[5:].strip()
+        if payload == '[DONE]':
+            return False
+        choices = loads(payload).get('choices') or [{}]
+        delta = (choices[0].get('delta') or {}).get('content')
+        if delta:
+            chunks.append(delta)
+            context.emit({"event": "token", "nodeId": self.id, "delta": delta})
+        return True
+
+    def _request_key(self, request_data: Dict[str, Any]) -> str:
+        """请求的规范化哈希，同时用作缓存键和合并请求的键"""
+        return llm_cache_key(self.ip, self.port, request_data["model"], request_data["temperature"],
+                             request_data["max_tokens"], request_data["messages"])
+
+    def _parse_response(self, response_json: Dict[str, Any]) -> str:
+        return response_json["choices"][0]["message"]["content"]
+
+    def _complete_cached(self, context: WorkflowContext, input_data: Any, output_data: str, source: str) -> List[Node]:
+        log.debug("llm.reused", node=self.id, label=self.label, source=source)
+        if self.stream:
+            # 流式节点一次性推送完整文本，前端处理方式不变
+            context.emit({"event": "token", "nodeId": self.id, "delta": output_data})
+        return self._complete(context, input_data, output_data)
+
+    def _complete(self, context: WorkflowContext, input_data: Any, output_data: str) -> List[Node]:
+        context.current_data = output_data
+        context.record_execution(
+            self.id, "completed", input_data, output_data)
+        return self.next_nodes if self.next_nodes else []
+
+    def _handle_error(self, context: WorkflowContext, input_data: Any, e: Exception) -> List[Node]:
+        error_info = f"LLM节点执行失败: {str(e)}"
+        log.warning("llm.failed", node=self.id, label=self.label, error=e)
+        context.record_execution(self.id, "failed", input_data, {
+                                 "error": error_info})
+        return []  # 出错时停止流程
 
     def _prepare_messages(self, input_data: Any) -> List[Dict[str, str]]:
         """准备对话消息"""
@@ -168,9 +365,21 @@ class ConditionalNode(Node):
     def __init__(self, node_id: str, node_type: str, data: Dict[str, Any]):
         super().__init__(node_id, node_type, data)
         self.condition = data["condition"]   # 默认条件为真，可以从data中获取实际条件
+        # 条件在加载时编译为闭包，执行时直接对上下文中的原始值求值
+        if isinstance(self.condition, str):
+            self.compiled_condition = compile_condition(self.condition)
+        elif isinstance(self.condition, (bool, int, float)):
+            # 编辑器导出的条件可能是 JSON 布尔值或数字，作为常量条件
+            constant = bool(self.condition)
+            self.compiled_condition = lambda context_data, input_data, global_data=None: constant
+        else:
+            raise ValueError(f"条件节点 {node_id} 的条件必须是表达式字符串或布尔值: {self.condition!r}")
         self.True_branch: List['Node'] = []
         self.False_branch: List['Node'] = []
 
+    def successors_for_output(self, output: Any) -> List[Node]:
+        return self.True_branch if output else self.False_branch
+
     def set_branches(self, True_branch: Node, False_branch: Node):
         """设置条件分支"""
         self.True_branch.append(True_branch)
@@ -185,35 +394,26 @@ class ConditionalNode(Node):
         self.False_branch.append(False_branch)
 
     def execute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
-        print(f"执行条件节点 {self.label}，输入: {input_data}，条件: {self.condition}")
-        org_condition = self.condition
-
-        # 解析条件表达式
-        var_extract = ExpressionEvaluateVariablor(
-            context.execution_history, input_data)
-        condition = var_extract.evaluate(org_condition)
-
-        if isinstance(condition, str):
-            # 解析条件表达式
-            bool_ast = parse_expression(condition)
-            evalucate_result = evaluate_ast(
-                bool_ast, {})
-            context.record_execution(
-                self.id, "completed", input_data, evalucate_result)
-
-            if evalucate_result:
-                print("条件为真，走True分支")
-                return self.True_branch
-            else:
-                print("条件为假，走False分支")
-                return self.False_branch
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label,
+                  input=input_data, condition=self.condition)
+        evalucate_result = self.compiled_condition(
+            context.execution_history, input_data, context.global_data)
+        context.record_execution(
+            self.id, "completed", input_data, evalucate_result)
+
+        if evalucate_result:
+            log.debug("condition.branch", node=self.id, result=True)
+            return self.True_branch
+        else:
+            log.debug("condition.branch", node=self.id, result=False)
+            return self.False_branch
 
 
 class OutputNode(Node):
     """数据输出节点"""
 
     def execute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
-        print(f"执行输出节点 {self.label}，输入: {input_data}，action: {self.action}")
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label, input=input_data, action=self.action)
         # 记录最终输出
         context.record_execution(self.id, "completed", input_data, {
                                  "final_output": input_data})
@@ -236,8 +436,11 @@ class FanInNode(Node):
         """获取并行路径数"""
         return len(self.parallel_nodes)
 
+    def successors_for_output(self, output: Any) -> List[Node]:
+        return self.parallel_nodes
+
     def execute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
-        print(f"执行扇入节点 {self.label}，并行路径数: {self.parallel_paths()}")
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label, paths=self.parallel_paths())
         context.record_execution(self.id, "parallel_start", input_data, {
                                  "parallel_count": self.parallel_paths()})
 
@@ -246,16 +449,59 @@ class FanInNode(Node):
 
 
 class FanOutNode(Node):
-    """扇出节点（并行结束）"""
+    """
+    扇出节点（并行结束）
+
+    作为汇聚屏障收集所有入边分支的输出，data.joinPolicy 选择汇聚策略：
+    - all: 等待所有分支（默认）
+    - firstK: 前 k 个分支成功到达即继续（data.k，默认1）
+    - quorum: 超过半数分支成功到达即继续
+    - deadline: 第一个分支到达后最多再等待 data.deadline 秒
+    非 all 策略下，迟到且只通向本节点的分支会被取消。
+    """
+
+    JOIN_POLICIES = ('all', 'firstK', 'quorum', 'deadline')
 
     def __init__(self, node_id: str, node_type: str, data: Dict[str, Any]):
         super().__init__(node_id, node_type, data)
         self.parallel_paths = data.get('parallelPaths', 1)
+        self.join_policy = data.get('joinPolicy') or 'all'
+        if self.join_policy not in self.JOIN_POLICIES:
+            raise ValueError(f"Unknown join policy: {self.join_policy}")
+        self.join_k = int(data.get('k') or 1)
+        self.join_deadline: Optional[float] = None
+        if self.join_policy == 'deadline':
+            deadline = data.get('deadline')
+            try:
+                self.join_deadline = float(deadline)
+            except (TypeError, ValueError):
+                raise ValueError(f"Join policy 'deadline' requires a numeric deadline: {deadline!r}") from None
+            if not self.join_deadline > 0:
+                raise ValueError(f"Join policy 'deadline' requires a positive deadline: {deadline!r}")
+
+    def join_satisfied(self, arrived: int, resolved: int, total: int) -> bool:
+        """
+        判断汇聚条件是否满足
+        :param arrived: 已成功到达的分支数
+        :param resolved: 已决出（到达、失败或跳过）的分支数
+        :param total: 入边总数
+        """
+        if resolved >= total:
+            return True
+        if self.join_policy == 'firstK':
+            return arrived >= self.join_k
+        if self.join_policy == 'quorum':
+            return arrived >= total // 2 + 1
+        return False
 
     def execute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
-        print(f"执行扇出节点 {self.label}，合并并行路径")
-        # 这里可以添加并行结果合并逻辑
-        output_data = {"merged_data": input_data}
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label, policy=self.join_policy)
+        # 调度器传入 {分支节点ID: 分支输出}，按到达顺序排列
+        branches = input_data if isinstance(input_data, dict) else {}
+        output_data = {
+            "merged_data": list(branches.values()),
+            "branches": branches,
+        }
         context.current_data = output_data
         context.record_execution(
             self.id, "parallel_end", input_data, output_data)
@@ -269,114 +515,134 @@ class APINode(Node):
         super().__init__(node_id, node_type, data)
         self.method = data.get('method', 'GET').upper()
         self.url = data.get('url', '')
-        self.headers = parse_string_2_multi(data.get('headers', {}))
+        headers = data.get('headers') or {}
+        self.headers = parse_string_2_multi(headers) if isinstance(headers, str) else headers
         self.body = parse_string_2_multi(data.get('body') or '{}')
         self.timeout = data.get('timeout', 10)  # 默认10秒超时
+        # 请求体模板只需序列化一次，URL 和请求体模板只编译一次
+        self.body_template = dumps(self.body) if isinstance(self.body, dict) else self.body
+        self.compiled_url = compile_template(self.url) if isinstance(self.url, str) else None
+        self.compiled_body = compile_template(self.body_template) if isinstance(self.body_template, str) else None
+        # 幂等请求默认合并在途的相同请求，singleFlight 可以显式开启或关闭
+        single = data.get('singleFlight')
+        self.single_flight = SINGLE_FLIGHT_ENABLED and (
+            self.method in IDEMPOTENT_METHODS if single is None else bool(single))
+
+    @classmethod
+    def deterministic(cls, data: Dict[str, Any]) -> bool:
+        # 有副作用的请求不能跳过，GET 的结果也随时间变化，默认都不复用
+        return False
 
     def execute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
-        print(f"执行API节点 {self.label}，输入: {input_data}")
-
-        var_extract = ExpressionEvaluateVariablor(
-            context.execution_history, input_data)
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label, method=self.method, input=input_data)
 
         try:
-            # 准备请求参数
-            url = var_extract.evaluate(self.url)
-            request_kwargs = {
-                'method': self.method,
-                'url': url,
-                'headers': self.headers,
-                'timeout': self.timeout
-            }
-
-            # 添加请求体（如果是POST/PUT/PATCH等方法）
-            if self.method in ['POST', 'PUT', 'PATCH', 'DELETE'] and self.body:
-                _body_str = ""
-                body_str = ""
-                if isinstance(self.body, dict):
-                    _body_str = json.dumps(self.body)
-                else:
-                    _body_str = self.body
-
-                try:
-                    # 尝试解析字符串形式的JSON
-                    body_str = var_extract.evaluate(_body_str)
-                    json_body = json.loads(body_str)
-                    request_kwargs['json'] = json_body
-                except json.JSONDecodeError as e:
-                    request_kwargs['data'] = self.body
+            request_kwargs = self._prepare_request(context, input_data)
 
             # 执行API请求
-            response = requests.request(**request_kwargs)
+            if self.single_flight:
+                response, _ = single_flight.do(
+                    flight_key(request_kwargs), lambda: http_sessions.request(**request_kwargs))
+            else:
+                response = http_sessions.request(**request_kwargs)
 
             # 处理响应
             response.raise_for_status()  # 如果响应状态码不是200，抛出异常
+            self._handle_response(context, input_data, response)
 
-            try:
-                response_data = response.json()  # 尝试解析JSON响应
-            except ValueError:
-                response_data = response.text  # 如果不是JSON，返回原始文本
+        except Exception as e:
+            self._handle_error(context, input_data, e)
+            raise  # 可以选择重新抛出异常或处理错误
 
-            # 构建输出数据
-            output_data = {
-                'status_code': response.status_code,
-                'headers': dict(response.headers),
-                'data': response_data,
-                'request': {
-                    'method': self.method,
-                    'url': self.url,
-                    'headers': self.headers,
-                    'body': self.body
-                }
-            }
+        return self.next_nodes if self.next_nodes else []
 
-            context.current_data = output_data
-            context.record_execution(
-                self.id, "completed", input_data, output_data)
-
-        except requests.RequestException as e:
-            error_info = {
-                'error': str(e),
-                'request': {
-                    'method': self.method,
-                    'url': self.url,
-                    'headers': self.headers,
-                    'body': self.body
-                }
-            }
-            if hasattr(e, 'response') and e.response:
-                error_info['response'] = {
-                    'status_code': e.response.status_code,
-                    'content': e.response.text
-                }
+    async def aexecute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
+        if httpx is None:
+            return await super().aexecute(context, input_data)
 
-            context.current_data = error_info
-            context.record_execution(self.id, "failed", input_data, error_info)
-            raise  # 可以选择重新抛出异常或处理错误
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label, method=self.method, input=input_data)
+
+        try:
+            request_kwargs = self._prepare_request(context, input_data)
+            # httpx 中原始字符串请求体使用 content 参数
+            if isinstance(request_kwargs.get('data'), str):
+                request_kwargs['content'] = request_kwargs.pop('data')
+
+            if self.single_flight:
+                response, _ = await single_flight.ado(
+                    flight_key(request_kwargs), lambda: http_sessions.arequest(**request_kwargs))
+            else:
+                response = await http_sessions.arequest(**request_kwargs)
+            response.raise_for_status()
+            self._handle_response(context, input_data, response)
 
         except Exception as e:
-            error_info = {
-                'error': str(e),
-                'request': {
-                    'method': self.method,
-                    'url': self.url,
-                    'headers': self.headers,
-                    'body': self.body
-                }
-            }
-            context.current_data = error_info
-            context.record_execution(self.id, "failed", input_data, error_info)
-            raise  # 可以选择重新抛出异常或处理错误
+            self._handle_error(context, input_data, e)
+            raise
 
         return self.next_nodes if self.next_nodes else []
 
+    def _prepare_request(self, context: WorkflowContext, input_data: Any) -> Dict[str, Any]:
+        """准备请求参数（requests 与 httpx 共用）"""
+        roots = (context.execution_history, input_data, context.global_data)
+
+        url = self.compiled_url.render(*roots) if self.compiled_url is not None else self.url
+        request_kwargs = {
+            'method': self.method,
+            'url': url,
+            'headers': self.headers,
+            'timeout': self.timeout
+        }
+
+        # 添加请求体（如果是POST/PUT/PATCH等方法）
+        if self.method in ['POST', 'PUT', 'PATCH', 'DELETE'] and self.body:
+            try:
+                # 尝试解析字符串形式的JSON
+                body_str = self.compiled_body.render(*roots) if self.compiled_body is not None else self.body_template
+                json_body = loads(body_str)
+                request_kwargs['json'] = json_body
+            except json.JSONDecodeError as e:
+                request_kwargs['data'] = self.body
+        return request_kwargs
+
+    def _handle_response(self, context: WorkflowContext, input_data: Any, response) -> None:
+        # 响应体在第一次被引用时才解析（JSON 失败时为原始文本）
+        output_data = LazyResponse.from_response(response, self._request_info())
+
+        context.current_data = output_data
+        context.record_execution(
+            self.id, "completed", input_data, output_data)
+
+    def _handle_error(self, context: WorkflowContext, input_data: Any, e: Exception) -> None:
+        error_info = {
+            'error': str(e),
+            'request': self._request_info()
+        }
+        # requests.HTTPError 与 httpx.HTTPStatusError 都带有 response
+        response = getattr(e, 'response', None)
+        if response is not None:
+            error_info['response'] = {
+                'status_code': response.status_code,
+                'content': response.text
+            }
+
+        context.current_data = error_info
+        context.record_execution(self.id, "failed", input_data, error_info)
+
+    def _request_info(self) -> Dict[str, Any]:
+        return {
+            'method': self.method,
+            'url': self.url,
+            'headers': self.headers,
+            'body': self.body
+        }
+
 
 class WebhookNode(Node):
     """Webhook节点"""
 
     def execute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
-        print(
-            f"执行Webhook节点 {self.label}，输入: {input_data}，action: {self.action}")
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label, input=input_data, action=self.action)
         # 模拟Webhook调用
         output_data = {"webhook_response": f"Webhook响应: {input_data}"}
         context.current_data = output_data
@@ -384,99 +650,312 @@ class WebhookNode(Node):
         return self.next_nodes if self.next_nodes else []
 
 
+class MapNode(Node):
+    """
+    映射节点：对列表中的每个元素执行一次子工作流
+
+    data.items: 列表来源，可以是 ${...} 引用，默认使用节点输入
+    data.body: 子工作流 {"nodes": [...], "edges": [...]}，入口节点接收当前元素作为输入
+    data.concurrency: 同时处理的元素数上限，默认4
+    每个元素使用独立的子上下文，可通过 ${global.item} 和 ${global.index} 引用当前元素。
+    """
+
+    def __init__(self, node_id: str, node_type: str, data: Dict[str, Any]):
+        super().__init__(node_id, node_type, data)
+        self.items = data.get('items') or ''
+        self.items_template = compile_template(self.items) if self.items else None
+        self.concurrency = max(1, int(data.get('concurrency') or 4))
+        self.body_plan = plan_cache.get_or_compile(
+            data.get('body') or {'nodes': [], 'edges': []}, compile_workflow)
+        plan = self.body_plan
+        # 子工作流没有输入节点时从拓扑序的第一个节点开始
+        self.body_start = plan.start_node or (
+            plan.nodes[plan.order[0]] if plan.order else None)
+        self.body_sinks = [node_id for node_id in plan.order
+                           if not plan.successors[node_id]]
+        if data.get('incremental', data.get('cacheable')) is None:
+            # 子工作流中有结果不确定的节点时整体不复用
+            self.incremental = all(node.incremental for node in plan.nodes.values())
+
+    def execute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
+        items = self._resolve_items(context, input_data)
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label,
+                  items=len(items), concurrency=self.concurrency)
+
+        # 元素在进程级线程池中处理，当前线程也参与：线程池被占满时由当前线程处理完所有元素，
+        # 嵌套的映射节点不会互相等待线程；每个元素的子运行在处理它的线程中执行，线程数不随嵌套放大
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        pending = iter(enumerate(items))
+        lock = Lock()
+
+        def work():
+            while True:
+                with lock:
+                    index, item = next(pending, (None, None))
+                if index is None:
+                    return
+                results[index] = self._run_item(context, index, item)
+
+        helpers = [sync_node_executor.submit(work) for _ in range(min(self.concurrency, len(items)) - 1)]
+        try:
+            work()
+        finally:
+            # 还没开始的帮手不再需要，正在处理元素的等待其完成
+            for helper in helpers:
+                helper.cancel()
+            errors = [helper.exception() for helper in helpers if not helper.cancelled()]
+        for error in errors:
+            if error is not None:
+                raise error
+        return self._finish(context, input_data, results)
+
+    async def aexecute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
+        items = self._resolve_items(context, input_data)
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label,
+                  items=len(items), concurrency=self.concurrency)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_item(index, item):
+            async with semaphore:
+                return await self._arun_item(context, index, item)
+
+        results = await asyncio.gather(
+            *(run_item(index, item) for index, item in enumerate(items)))
+        return self._finish(context, input_data, list(results))
+
+    def _resolve_items(self, context: WorkflowContext, input_data: Any) -> List[Any]:
+        items = resolve_items(self.items_template, context, input_data)
+        if not isinstance(items, (list, tuple)):
+            raise ValueError(f"映射节点的输入不是列表: {type(items).__name__}")
+        return list(items)
+
+    def _item_run(self, context: WorkflowContext, index: int, item: Any) -> 'Workflow':
+        run = Workflow.from_plan(self.body_plan, context.child())
+        run.context.set_global_data('item', item)
+        run.context.set_global_data('index', index)
+        return run
+
+    def _run_item(self, context: WorkflowContext, index: int, item: Any) -> Dict[str, Any]:
+        run = self._item_run(context, index, item)
+        if self.body_start:
+            # 子运行跟随外层运行停止，超时由外层运行和节点超时约束
+            DagScheduler(run, stop_event=context.cancel_event, start_node=self.body_start, start_input=item,
+                         timeout=0, parent_metrics=context.run_metrics, inline=True).run()
+        return self._item_result(run.context)
+
+    async def _arun_item(self, context: WorkflowContext, index: int, item: Any) -> Dict[str, Any]:
+        run = self._item_run(context, index, item)
+        if self.body_start:
+            await AsyncDagScheduler(run, stop_event=context.cancel_event, start_node=self.body_start,
+                                    start_input=item, timeout=0, parent_metrics=context.run_metrics).run()
+        return self._item_result(run.context)
+
+    def _item_result(self, item_context: WorkflowContext) -> Dict[str, Any]:
+        """取子工作流末端节点的输出作为该元素的结果"""
+        outputs = {}
+        errors = []
+        for node_id, record in item_context.execution_history.maps[0].items():
+            if record['status'] == 'failed':
+                errors.append({'nodeId': node_id, 'error': record['output']})
+            elif node_id in self.body_sinks:
+                outputs[node_id] = record['output']
+        if len(outputs) == 1:
+            output = next(iter(outputs.values()))
+        else:
+            output = outputs or None
+        return {'output': output, 'errors': errors}
+
+    def _finish(self, context: WorkflowContext, input_data: Any, results: List[Dict[str, Any]]) -> List[Node]:
+        output_data = {
+            'results': [result['output'] for result in results],
+            'errors': [dict(error, index=index)
+                       for index, result in enumerate(results) for error in result['errors']],
+        }
+        context.current_data = output_data
+        context.record_execution(self.id, "completed", input_data, output_data)
+        return self.next_nodes if self.next_nodes else []
+
+
+class FilterNode(Node):
+    """
+    过滤节点：按条件批量筛选记录列表，适合处理 API 返回的大量记录
+
+    data.items: 列表来源，可以是 ${...} 引用，默认使用节点输入
+    data.condition: 与条件节点相同的表达式，${item.字段} 引用当前记录，如 ${item.price} > 10 && ${item.state} == "ok"
+    data.output: records（默认，输出满足条件的记录）或 mask（输出与列表等长的布尔列表）
+    """
+
+    def __init__(self, node_id: str, node_type: str, data: Dict[str, Any]):
+        super().__init__(node_id, node_type, data)
+        self.items = data.get('items') or ''
+        self.items_template = compile_template(self.items) if self.items else None
+        self.condition = BatchCondition(data.get('condition') or 'true')
+        self.output = 'mask' if data.get('output') == 'mask' else 'records'
+
+    def execute(self, context: WorkflowContext, input_data: Optional[Any] = None) -> List[Node]:
+        items = resolve_items(self.items_template, context, input_data)
+        if not isinstance(items, (list, tuple)):
+            raise ValueError(f"过滤节点的输入不是列表: {type(items).__name__}")
+
+        roots = (context.execution_history, input_data, context.global_data)
+        if self.output == 'mask':
+            output_data = self.condition.mask(items, *roots)
+            matched = sum(output_data)
+        else:
+            output_data = self.condition.filter(items, *roots)
+            matched = len(output_data)
+        log.debug("node.execute", node=self.id, type=self.type, label=self.label, items=len(items), matched=matched)
+        context.current_data = output_data
+        context.record_execution(self.id, "completed", input_data, output_data)
+        return self.next_nodes if self.next_nodes else []
+
+
+def resolve_items(items_template: Optional[CompiledTemplate], context: WorkflowContext, input_data: Any) -> Any:
+    """列表来源：${...} 引用或者节点输入，字典取其所有值"""
+    if items_template is None:
+        items = input_data
+    elif items_template.single:
+        # 整个表达式是单个引用时保留原始类型
+        items = items_template.value(context.execution_history, input_data, context.global_data)
+    else:
+        items = parse_string_2_multi(
+            items_template.render(context.execution_history, input_data, context.global_data))
+    if isinstance(items, dict):
+        items = list(items.values())
+    return items
+
+
+NODE_TYPE_MAP = {
+    'input': InputNode,
+    'transform': TransformNode,
+    'conditional': ConditionalNode,
+    'output': OutputNode,
+    'fanIn': FanInNode,
+    'fanOut': FanOutNode,
+    'api': APINode,
+    'webhook': WebhookNode,
+    'llm': LLMNode,
+    'map': MapNode,
+    'filter': FilterNode,
+}
+KNOWN_NODE_TYPES.update(NODE_TYPE_MAP)
+
+
+def _parse_nodes(nodes_data: List[Dict[str, Any]]):
+    """解析所有节点，返回 (节点字典, 起始节点)"""
+    nodes: Dict[str, Node] = {}
+    start_node: Optional[Node] = None
+    for node_data in nodes_data:
+        node_id = node_data['id']
+        data = node_data['data']
+
+        # 获取实际类型（data中的type字段）
+        actual_type = data['type']
+        node_class = NODE_TYPE_MAP.get(actual_type, Node)
+        nodes[node_id] = node_class(node_id, actual_type, data)
+
+        # 找到起始节点（没有入边的节点）
+        if actual_type == 'input':
+            start_node = nodes[node_id]
+    return nodes, start_node
+
+
+def _connect_nodes(nodes: Dict[str, Node], edges: List[Dict[str, Any]]):
+    """连接所有节点"""
+    for edge in edges:
+        source_node = nodes[edge['source']]
+        target_node = nodes[edge['target']]
+
+        if isinstance(source_node, ConditionalNode):
+            handle = (edge.get('sourceHandle') or '').lower()
+            if 'true' == handle:
+                source_node.set_true_branche(target_node)
+            elif 'false' == handle:
+                source_node.set_false_branche(target_node)
+        elif isinstance(source_node, FanInNode):
+            source_node.add_parallel_node(target_node)
+        else:
+            source_node.add_next_node(target_node)
+
+
+def compile_workflow(workflow_json: Dict[str, Any], fingerprint: Optional[str] = None) -> WorkflowPlan:
+    """把工作流JSON编译为执行计划（节点对象在此创建并连线，之后只读）"""
+    if fingerprint is None:
+        fingerprint = workflow_fingerprint(workflow_json)
+    nodes, start_node = _parse_nodes(workflow_json['nodes'])
+    _connect_nodes(nodes, workflow_json['edges'])
+    references = {node_data['id']: context_references(node_data['data'])
+                  for node_data in workflow_json['nodes']}
+    config_hashes = {node_data['id']: node_config_hash(node_data['data'])
+                     for node_data in workflow_json['nodes']}
+    return WorkflowPlan(fingerprint, nodes, workflow_json['edges'], start_node, references, config_hashes)
+
+
 class Workflow:
     """工作流类，负责解析和执行整个工作流"""
 
     def __init__(self, workflow_json: Dict[str, Any]):
-        self.nodes: Dict[str, Node] = {}
-        self.edges = workflow_json['edges']
-        self.start_node: Optional[Node] = None
+        # 相同内容的工作流复用已编译的计划，每次运行只创建新的上下文
+        self.plan = plan_cache.get_or_compile(workflow_json, compile_workflow)
+        self.nodes: Mapping[str, Node] = self.plan.nodes
+        self.edges = self.plan.edges
+        self.start_node: Optional[Node] = self.plan.start_node
         self.context = WorkflowContext()
-        self._parse_nodes(workflow_json['nodes'])
-        self._connect_nodes()
-
-    def _parse_nodes(self, nodes_data: List[Dict[str, Any]]):
-        """解析所有节点"""
-        for node_data in nodes_data:
-            node_id = node_data['id']
-            node_type = node_data['type']
-            data = node_data['data']
-
-            # 根据类型创建不同的节点对象
-            node_type_map = {
-                'input': InputNode,
-                'transform': TransformNode,
-                'conditional': ConditionalNode,
-                'output': OutputNode,
-                'fanIn': FanInNode,
-                'fanOut': FanOutNode,
-                'api': APINode,
-                'webhook': WebhookNode,
-                'llm': LLMNode,
-            }
-
-            # 获取实际类型（data中的type字段）
-            actual_type = data['type']
-            node_class = node_type_map.get(actual_type, Node)
-            self.nodes[node_id] = node_class(node_id, actual_type, data)
-
-            # 找到起始节点（没有入边的节点）
-            if actual_type == 'input':
-                self.start_node = self.nodes[node_id]
-
-    def _connect_nodes(self):
-        """连接所有节点"""
-        for edge in self.edges:
-            source_node = self.nodes[edge['source']]
-            target_node = self.nodes[edge['target']]
-
-            if isinstance(source_node, ConditionalNode):
-                if 'true' == edge['sourceHandle'].lower():
-                    source_node.set_true_branche(target_node)
-                elif 'false' == edge['sourceHandle'].lower():
-                    source_node.set_false_branche(target_node)
-            elif isinstance(source_node, FanInNode):
-                source_node.add_parallel_node(target_node)
-            else:
-                source_node.add_next_node(target_node)
-
-    def execute(self):
-        """使用广度优先算法执行整个工作流"""
+        self.context.retention = HistoryRetention(plan=self.plan)
+        self.metrics_label = self.plan.fingerprint[:12]  # 指标中的 workflow 标签
+
+    @classmethod
+    def from_plan(cls, plan: WorkflowPlan, context: Optional[WorkflowContext] = None) -> 'Workflow':
+        """直接基于已编译的计划创建一次运行"""
+        workflow = cls.__new__(cls)
+        workflow.plan = plan
+        workflow.nodes = plan.nodes
+        workflow.edges = plan.edges
+        workflow.start_node = plan.start_node
+        workflow.metrics_label = plan.fingerprint[:12]
+        if context is None:
+            context = WorkflowContext()
+            context.retention = HistoryRetention(plan=plan)
+        workflow.context = context
+        return workflow
+
+    def execute(self, on_node_complete=None):
+        """按依赖关系并行执行整个工作流"""
         if not self.start_node:
-            print("工作流没有起始节点")
+            run_log.warning("run.no_start_node", workflow=self.plan.fingerprint[:12])
             return
 
-        print("开始执行工作流(BFS顺序)...")
+        run_log.info("run.start", workflow=self.plan.fingerprint[:12], mode="thread", nodes=len(self.nodes))
 
-        # 使用队列进行BFS
-        queue = deque()
-        visited = set()
+        DagScheduler(self, on_node_complete).run()
 
-        # 从起始节点开始
-        queue.append((self.start_node, None))
-        visited.add(self.start_node.id)
+        self._print_history()
+
+    async def aexecute(self, on_node_complete=None):
+        """在当前事件循环上异步执行整个工作流"""
+        if not self.start_node:
+            run_log.warning("run.no_start_node", workflow=self.plan.fingerprint[:12])
+            return
 
-        while queue:
-            current_node, current_input = queue.popleft()
+        run_log.info("run.start", workflow=self.plan.fingerprint[:12], mode="async", nodes=len(self.nodes))
 
-            # 执行当前节点
-            next_step_nodes = current_node.__execute(
-                self.context, current_input)
+        await AsyncDagScheduler(self, on_node_complete).run()
 
-            for next_node in next_step_nodes:
-                if next_node and next_node.id not in visited:
-                    # 传递当前上下文中的数据
-                    queue.append((next_node, self.context.current_data))
-                    visited.add(next_node.id)
+        self._print_history()
 
-        print("工作流执行完成(BFS顺序)")
-        print("\n执行历史记录:")
-        for node_id, history in self.context.execution_history.items():
-            print(f"节点 {node_id}: {history}")
+    def _print_history(self):
+        run_log.info("run.finish", workflow=self.plan.fingerprint[:12],
+                     nodes=len(self.context.execution_history))
+        # 完整的执行记录只在 DEBUG 级别输出
+        if run_log.is_enabled(logging.DEBUG):
+            for node_id, history in self.context.execution_history.items():
+                run_log.debug("run.record", node=node_id, record=history)
 
     def get_execution_history(self) -> Dict[str, Dict[str, Any]]:
-        """获取执行历史"""
-        return self.context.execution_history
+        """获取执行历史（转换为普通字典，转存的大对象会被加载）"""
+        return {node_id: record.to_dict()
+                for node_id, record in self.context.execution_history.items()}
 
 
 def test3():
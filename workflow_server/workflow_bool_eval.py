@@ -1,7 +1,11 @@
-from typing import Union, Dict, List, Literal, Any
+from typing import Union, Dict, List, Literal, Any, Callable, Tuple
 import json
+import operator
+import re
 from typing import Dict, Any, Union
 
+from extract_var import compile_reference, compile_template
+
 
 def evaluate_ast(ast: Dict[str, Any], context: Dict[str, Any]) -> Union[bool, int, float, str]:
     node_type = ast['type']
@@ -87,6 +91,55 @@ def evaluate_expression(ast_json: str, context: Dict[str, Any]) -> Union[bool, i
     return evaluate_ast(ast, context)
 
 
+# 词法规则，按原逐字符扫描的判断顺序排列
+_TOKEN_PATTERN = re.compile(r'''
+    (?P<SPACE>\s+)
+  | \$\{(?P<TEMPLATE_LITERAL>[^}]*)\}
+  | (?P<UNCLOSED_TEMPLATE>\$\{)
+  | (?P<LEFT_PAREN>\()
+  | (?P<RIGHT_PAREN>\))
+  | (?P<STRING>"[^"]*"|'[^']*')
+  | (?P<UNCLOSED_STRING>["'])
+  | (?P<LOGICAL_AND>&&)
+  | (?P<LOGICAL_OR>\|\|)
+  | (?P<EQUAL>==)
+  | (?P<NOT_EQUAL>!=)
+  | (?P<GREATER_EQUAL>>=)
+  | (?P<LESS_EQUAL><=)
+  | (?P<GREATER>>)
+  | (?P<LESS><)
+  | (?P<TRUE>true)
+  | (?P<FALSE>false)
+  | (?P<NUMBER>\d[\d.]*)
+  | (?P<IDENTIFIER>[^\W\d]\w*)
+''', re.VERBOSE)
+
+
+def tokenize(input_str: str) -> List[Dict]:
+    """
+    词法分析，token 为 {'type', 'value', 'start', 'end'}
+    模板字面量的 value 是 ${} 内的路径，字符串字面量的 value 带引号
+    """
+    tokens = []
+    current = 0
+    length = len(input_str)
+    while current < length:
+        match = _TOKEN_PATTERN.match(input_str, current)
+        if match is None:
+            raise ValueError(f"Unexpected character: {input_str[current]}")
+        token_type = match.lastgroup
+        if token_type == 'UNCLOSED_TEMPLATE':
+            raise ValueError("Unclosed template literal, missing '}'")
+        if token_type == 'UNCLOSED_STRING':
+            raise ValueError("Unclosed string literal")
+        if token_type != 'SPACE':
+            tokens.append({'type': token_type, 'value': match.group(token_type),
+                           'start': match.start(), 'end': match.end()})
+        current = match.end()
+    tokens.append({'type': 'EOF', 'value': '', 'start': length, 'end': length})
+    return tokens
+
+
 # 定义 AST 节点类型
 ASTNode = Union[
     # BinaryExpression, LogicalExpression, UnaryExpression, ParenthesizedExpression
@@ -212,136 +265,135 @@ class Parser:
         raise ValueError(message)
 
     def tokenize(self, input_str: str) -> List[Dict]:
-        tokens = []
-        current = 0
+        return tokenize(input_str)
 
-        while current < len(input_str):
-            char = input_str[current]
 
-            # 跳过空白字符
-            if char.isspace():
-                current += 1
-                continue
-
-            # 处理模板字面量 ${...}
-            if char == '$' and current + 1 < len(input_str) and input_str[current + 1] == '{':
-                current += 2  # 跳过 ${
-                value = ''
-                while current < len(input_str) and input_str[current] != '}':
-                    value += input_str[current]
-                    current += 1
-                if current >= len(input_str) or input_str[current] != '}':
-                    raise ValueError("Unclosed template literal, missing '}'")
-                current += 1  # 跳过 }
-                tokens.append({'type': 'TEMPLATE_LITERAL', 'value': value})
-                continue
-
-            # 处理括号
-            if char == '(':
-                tokens.append({'type': 'LEFT_PAREN', 'value': '('})
-                current += 1
-                continue
+def parse_expression(input_str: str) -> ASTNode:
+    parser = Parser(input_str)
+    return parser.parse()
 
-            if char == ')':
-                tokens.append({'type': 'RIGHT_PAREN', 'value': ')'})
-                current += 1
-                continue
 
-            # 处理字符串字面量
-            if char == '"' or char == "'":
-                quote = char
-                value = quote
-                current += 1
-                while current < len(input_str) and input_str[current] != quote:
-                    value += input_str[current]
-                    current += 1
-                if current >= len(input_str):
-                    raise ValueError("Unclosed string literal")
-                value += quote
-                current += 1
-                tokens.append({'type': 'STRING', 'value': value})
-                continue
+Condition = Callable[[Any, Any, Any], Any]
+_Closure = Callable[[Tuple[Any, Any, Any]], Any]
 
-            # 处理逻辑运算符
-            if char == '&' and current + 1 < len(input_str) and input_str[current + 1] == '&':
-                tokens.append({'type': 'LOGICAL_AND', 'value': '&&'})
-                current += 2
-                continue
+_BINARY_OPERATORS = {
+    '==': operator.eq, '!=': operator.ne,
+    '>': operator.gt, '<': operator.lt,
+    '>=': operator.ge, '<=': operator.le,
+}
 
-            if char == '|' and current + 1 < len(input_str) and input_str[current + 1] == '|':
-                tokens.append({'type': 'LOGICAL_OR', 'value': '||'})
-                current += 2
-                continue
+# 模板值为字符串时，按原先替换后再解析的规则识别的布尔值和数字
+_NUMBER_TEXT = re.compile(r'\d[\d.]*')
 
-            # 处理比较运算符
-            if char == '=' and current + 1 < len(input_str) and input_str[current + 1] == '=':
-                tokens.append({'type': 'EQUAL', 'value': '=='})
-                current += 2
-                continue
+# 与模板相连时会在文本替换后合并成一个 token 的类型
+_OPERAND_TOKENS = frozenset(('TEMPLATE_LITERAL', 'STRING', 'TRUE', 'FALSE', 'NUMBER', 'IDENTIFIER'))
 
-            if char == '!' and current + 1 < len(input_str) and input_str[current + 1] == '=':
-                tokens.append({'type': 'NOT_EQUAL', 'value': '!='})
-                current += 2
-                continue
 
-            if char == '>' and current + 1 < len(input_str) and input_str[current + 1] == '=':
-                tokens.append({'type': 'GREATER_EQUAL', 'value': '>='})
-                current += 2
-                continue
+def compile_condition(source: str) -> Condition:
+    """
+    把条件表达式编译为闭包树，返回的函数参数为 (context, input, global)
 
-            if char == '<' and current + 1 < len(input_str) and input_str[current + 1] == '=':
-                tokens.append({'type': 'LESS_EQUAL', 'value': '<='})
-                current += 2
-                continue
+    作为独立操作数的 ${...} 直接绑定到上下文取值并保留原始类型（字符串形式的
+    true/false 和数字仍按原先的规则识别），字符串字面量中的 ${...} 求值时替换为文本。
+    模板与其它操作数相连（如 ${a}${b}）、表达式无法完整解析时，回退为每次执行先替换文本再解析求值。
+    """
+    try:
+        parser = Parser(source)
+        ast = parser.parse()
+        # 有未解析完的 token 时（如 ${a} ${op} 5），只有替换文本后才知道表达式的结构
+        if parser.is_at_end() and _standalone_templates(parser.tokens):
+            closure = _compile_ast(ast)
+            return lambda context_data, input_data, global_data=None: \
+                closure((context_data, input_data, global_data or {}))
+    except ValueError:
+        pass
+
+    template = compile_template(source)
+
+    def evaluate_text(context_data: Any, input_data: Any, global_data: Any = None) -> Any:
+        return evaluate_ast(parse_expression(template.render(context_data, input_data, global_data)), {})
+
+    return evaluate_text
+
+
+def _standalone_templates(tokens: List[Dict]) -> bool:
+    """模板字面量前后都不与其它操作数直接相连"""
+    for previous, token in zip(tokens, tokens[1:]):
+        if previous['end'] == token['start'] and 'TEMPLATE_LITERAL' in (previous['type'], token['type']) \
+                and previous['type'] in _OPERAND_TOKENS and token['type'] in _OPERAND_TOKENS:
+            return False
+    return True
 
-            if char == '>':
-                tokens.append({'type': 'GREATER', 'value': '>'})
-                current += 1
-                continue
 
-            if char == '<':
-                tokens.append({'type': 'LESS', 'value': '<'})
-                current += 1
-                continue
+def _template_operand(value: Any) -> Any:
+    if isinstance(value, str):
+        text = value.strip()
+        if text == 'true':
+            return True
+        if text == 'false':
+            return False
+        if _NUMBER_TEXT.fullmatch(text):
+            try:
+                return float(text)
+            except ValueError:
+                return value
+    return value
 
-            # 处理布尔字面量
-            if input_str[current:current+4] == 'true':
-                tokens.append({'type': 'TRUE', 'value': 'true'})
-                current += 4
-                continue
 
-            if input_str[current:current+5] == 'false':
-                tokens.append({'type': 'FALSE', 'value': 'false'})
-                current += 5
-                continue
+def _compile_ast(ast: Dict[str, Any]) -> _Closure:
+    node_type = ast['type']
 
-            # 处理数字
-            if char.isdigit():
-                value = ''
-                while current < len(input_str) and (input_str[current].isdigit() or input_str[current] == '.'):
-                    value += input_str[current]
-                    current += 1
-                tokens.append({'type': 'NUMBER', 'value': value})
-                continue
+    if node_type == 'BinaryExpression':
+        left = _compile_ast(ast['left'])
+        right = _compile_ast(ast['right'])
+        compare = _BINARY_OPERATORS.get(ast['operator'])
+        if compare is None:
+            raise ValueError(f"Unknown binary operator: {ast['operator']}")
+        return lambda roots: compare(left(roots), right(roots))
+
+    if node_type == 'LogicalExpression':
+        left = _compile_ast(ast['left'])
+        right = _compile_ast(ast['right'])
+        # 短路求值
+        if ast['operator'] == '&&':
+            return lambda roots: right(roots) if left(roots) else False
+        if ast['operator'] == '||':
+            return lambda roots: True if left(roots) else right(roots)
+        raise ValueError(f"Unknown logical operator: {ast['operator']}")
 
-            # 处理标识符
-            if char.isalpha() or char == '_':
-                value = ''
-                while current < len(input_str) and (input_str[current].isalnum() or input_str[current] == '_'):
-                    value += input_str[current]
-                    current += 1
-                tokens.append({'type': 'IDENTIFIER', 'value': value})
-                continue
+    if node_type == 'Identifier':
+        name = ast['name']
 
-            raise ValueError(f"Unexpected character: {char}")
+        def identifier(roots):
+            raise KeyError(f"Variable '{name}' not found in context")
+        return identifier
 
-        tokens.append({'type': 'EOF', 'value': ''})
-        return tokens
+    if node_type == 'TemplateLiteral':
+        path = ast['path']
+        access = compile_reference(path)
 
+        def template_literal(roots):
+            value = access(roots)
+            if value is None:
+                raise KeyError(f"Path '{path}' not found in context")
+            return _template_operand(value)
+        return template_literal
 
-def parse_expression(input_str: str) -> ASTNode:
-    parser = Parser(input_str)
-    return parser.parse()
+    if node_type == 'Literal':
+        value = ast['value']
+        if isinstance(value, str) and '${' in value:
+            # 模板渲染会去掉首尾空白，字符串字面量需要保留
+            template = compile_template(value)
+            stripped = value.strip()
+            head = value[:value.index(stripped)] if stripped else value
+            tail = value[len(head) + len(stripped):]
+            return lambda roots: head + template.render(*roots) + tail
+        return lambda roots: value
+
+    if node_type == 'ParenthesizedExpression':
+        return _compile_ast(ast['expression'])
+
+    raise ValueError(f"Unknown AST node type: {node_type}")
 
 
 def ast_to_string(ast: dict) -> str:
@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Any, Optional, List
+
+from multienv import multienv
+
+
+LLM_CACHE_ENABLED = multienv.get("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_MAX_ENTRIES = int(multienv.get("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_MAX_BYTES = int(multienv.get("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_TTL = float(multienv.get("LLM_CACHE_TTL", "3600"))
+# 为空时不启用磁盘缓存
+LLM_CACHE_DB = multienv.get("LLM_CACHE_DB", "")
+LLM_CACHE_DB_TTL = float(multienv.get("LLM_CACHE_DB_TTL", str(7 * 24 * 3600)))
+
+
+def llm_cache_key(ip: Any, port: Any, model: str, temperature: Any,
+                  max_tokens: Any, messages: List[Dict[str, Any]]) -> str:
+    """对请求的关键参数做规范化 JSON 序列化后取哈希"""
+    canonical = json.dumps([str(ip), str(port), model, temperature, max_tokens, messages],
+                           sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    大模型响应的两级缓存
+
+    内存层：LRU，按条目数和总字节数限制容量，条目带 TTL；
+    磁盘层（可选）：SQLite，进程重启后仍然有效，命中时回填内存层。
+    只缓存字符串，容量按 UTF-8 编码后的字节数计算（中文每个字符约 3 字节）。
+    """
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, max_bytes: int = LLM_CACHE_MAX_BYTES,
+                 ttl: float = LLM_CACHE_TTL, db_path: Optional[str] = LLM_CACHE_DB or None,
+                 db_ttl: float = LLM_CACHE_DB_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.db_ttl = db_ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (过期时间, 内容, 字节数)
+        self._bytes = 0
+        self._lock = Lock()
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+                          'stores': 0, 'evictions': 0, 'expirations': 0}
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """)
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._memory_get(key)
+        if value is None and self._db is not None:
+            value = self._disk_get(key)
+        if value is None:
+            self._count('misses')
+        return value
+
+    def set(self, key: str, value: str):
+        # 只缓存回复文本，None 或其它对象（如解析失败的响应）不缓存
+        if not isinstance(value, str):
+            return
+        self._memory_set(key, value)
+        self._count('stores')
+        if self._db is not None:
+            self._disk_set(key, value)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """异步版本，磁盘层的读取放到线程池中，避免阻塞事件循环"""
+        value = self._memory_get(key)
+        if value is None and self._db is not None:
+            value = await asyncio.get_running_loop().run_in_executor(None, self._disk_get, key)
+        if value is None:
+            self._count('misses')
+        return value
+
+    async def aset(self, key: str, value: str):
+        if not isinstance(value, str):
+            return
+        self._memory_set(key, value)
+        self._count('stores')
+        if self._db is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._disk_set, key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update(entries=len(self._entries), bytes=self._bytes,
+                         max_entries=self.max_entries, max_bytes=self.max_bytes,
+                         disk_enabled=self._db is not None)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _ = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                self._counters['expirations'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['memory_hits'] += 1
+            return value
+
+    def _memory_set(self, key: str, value: str):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._counters['evictions'] += 1
+
+    def _drop(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] + self.db_ttl < time.time():
+            return None
+        self._memory_set(key, row[0])
+        self._count('disk_hits')
+        return row[0]
+
+    def _disk_set(self, key: str, value: str):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time()))
+            self._db.commit()
+
+
+# 全局实例
+llm_cache = LLMResponseCache()
@@ -0,0 +1,250 @@
+import os
+import queue
+import sqlite3
+import time
+import uuid
+from threading import Event, Lock, Thread
+from typing import Dict, Any, Optional, List
+
+from multienv import multienv
+from workflow_codec import dumps, loads
+from workflow_log import get_logger
+from workflow_response import plain
+
+
+log = get_logger("checkpoint")
+
+# 服务端数据文件所在的目录，默认为服务代码旁的 data 目录，不随启动时的工作目录变化
+WORKFLOW_DATA_DIR = multienv.get("WORKFLOW_DATA_DIR",
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+CHECKPOINT_DB = multienv.get("WORKFLOW_CHECKPOINT_DB", os.path.join(WORKFLOW_DATA_DIR, "checkpoints.db"))
+# 后台写线程最多攒多久/多少条记录提交一次事务
+CHECKPOINT_FLUSH_INTERVAL = float(multienv.get("WORKFLOW_CHECKPOINT_FLUSH_MS", "200")) / 1000
+CHECKPOINT_BATCH_SIZE = int(multienv.get("WORKFLOW_CHECKPOINT_BATCH_SIZE", "256"))
+
+
+class _Json:
+    """写入时才序列化的参数，由后台写线程编码"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+
+def _encode(params: tuple) -> tuple:
+    # 恢复运行时下游节点需要完整的 API 响应
+    return tuple(dumps(param.value, default=plain) if isinstance(param, _Json) else param for param in params)
+
+
+class CheckpointStore:
+    """
+    运行检查点的 SQLite 存储
+
+    每个节点完成后追加一条记录（节点结果和它选择的后续节点），
+    恢复时按顺序重放即可还原调度状态。序列化和写入都由后台线程批量进行，
+    调用方（服务模式下是事件循环）只需要入队；节点的输入输出在完成后不应再被修改，
+    会被继续修改的全局数据在入队时复制一份。
+    """
+
+    def __init__(self, db_path: str = CHECKPOINT_DB, flush_interval: float = CHECKPOINT_FLUSH_INTERVAL,
+                 batch_size: int = CHECKPOINT_BATCH_SIZE):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer: Optional[Thread] = None
+        self._lock = Lock()
+        self._conn = self._connect()
+        self._conn.executescript("""
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id TEXT PRIMARY KEY,
+            workflow_json TEXT NOT NULL,
+            fingerprint TEXT,
+            status TEXT NOT NULL,
+            frontier TEXT,
+            global_data TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS run_nodes (
+            run_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            node_id TEXT NOT NULL,
+            status TEXT,
+            is_success INTEGER NOT NULL,
+            input TEXT,
+            output TEXT,
+            error TEXT,
+            next_ids TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (run_id, seq)
+        );
+        CREATE TABLE IF NOT EXISTS run_traces (
+            run_id TEXT PRIMARY KEY,
+            trace TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        """)
+        self._conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def start_run(self, workflow_json: Dict[str, Any], fingerprint: Optional[str] = None) -> str:
+        run_id = uuid.uuid4().hex
+        now = time.time()
+        self._submit("INSERT INTO runs (run_id, workflow_json, fingerprint, status, frontier, global_data,"
+                     " created_at, updated_at) VALUES (?, ?, ?, 'running', '[]', '{}', ?, ?)",
+                     (run_id, _Json(workflow_json), fingerprint, now, now))
+        return run_id
+
+    def record_node(self, run_id: str, seq: int, node_id: str, status: Optional[str], is_success: bool,
+                    input_data: Any, output_data: Any, error: Optional[str], next_ids: List[str]):
+        self._submit("INSERT OR REPLACE INTO run_nodes (run_id, seq, node_id, status, is_success, input, output,"
+                     " error, next_ids, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (run_id, seq, node_id, status, int(is_success), _Json(input_data), _Json(output_data),
+                      error, _Json(list(next_ids)), time.time()))
+
+    def update_run(self, run_id: str, status: Optional[str] = None, frontier: Optional[List[str]] = None,
+                   global_data: Optional[Dict[str, Any]] = None):
+        self._submit("UPDATE runs SET status = COALESCE(?, status), frontier = COALESCE(?, frontier),"
+                     " global_data = COALESCE(?, global_data), updated_at = ? WHERE run_id = ?",
+                     (status, None if frontier is None else _Json(list(frontier)),
+                      None if global_data is None else _Json(dict(global_data)), time.time(), run_id))
+
+    def save_trace(self, run_id: str, trace: Dict[str, Any]):
+        """保存运行的 Chrome Trace 时间线"""
+        self._submit("INSERT OR REPLACE INTO run_traces (run_id, trace, created_at) VALUES (?, ?, ?)",
+                     (run_id, _Json(trace), time.time()))
+
+    def load_trace(self, run_id: str) -> Optional[Dict[str, Any]]:
+        self.flush()
+        with self._lock:
+            row = self._conn.execute("SELECT trace FROM run_traces WHERE run_id = ?", (run_id,)).fetchone()
+        return loads(row[0]) if row is not None else None
+
+    def load_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        self.flush()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT run_id, workflow_json, fingerprint, status, frontier, global_data, created_at, updated_at"
+                " FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'run_id': row[0],
+            'workflow': loads(row[1]),
+            'fingerprint': row[2],
+            'status': row[3],
+            'frontier': loads(row[4] or '[]'),
+            'global_data': loads(row[5] or '{}'),
+            'created_at': row[6],
+            'updated_at': row[7],
+        }
+
+    def load_nodes(self, run_id: str) -> List[Dict[str, Any]]:
+        """按完成顺序返回运行中的节点记录"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, node_id, status, is_success, input, output, error, next_ids"
+                " FROM run_nodes WHERE run_id = ? ORDER BY seq", (run_id,)).fetchall()
+        return [{
+            'seq': row[0],
+            'node_id': row[1],
+            'status': row[2],
+            'is_success': bool(row[3]),
+            'input': loads(row[4]),
+            'output': loads(row[5]),
+            'error': row[6],
+            'next_ids': loads(row[7]),
+        } for row in rows]
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已入队的写入全部提交"""
+        if self._writer is None:
+            return True
+        done = Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _submit(self, sql: str, params: tuple):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = Thread(target=self._write_loop, name="workflow-checkpoint", daemon=True)
+                    self._writer.start()
+        self._queue.put((sql, params))
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and not isinstance(batch[-1], Event):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            waiters = [item for item in batch if isinstance(item, Event)]
+            writes = []
+            for item in batch:
+                if isinstance(item, Event):
+                    continue
+                sql, params = item
+                try:
+                    writes.append((sql, _encode(params)))
+                except (TypeError, ValueError, RuntimeError) as e:
+                    log.error("checkpoint.encode_failed", error=e)
+            if writes:
+                try:
+                    with self._lock, self._conn:
+                        for sql, params in writes:
+                            self._conn.execute(sql, params)
+                except sqlite3.Error as e:
+                    log.error("checkpoint.write_failed", error=e, rows=len(writes))
+            for waiter in waiters:
+                waiter.set()
+
+
+class RunCheckpoint:
+    """单次运行的检查点写入器，由调度器在每个节点完成后调用"""
+
+    def __init__(self, store: CheckpointStore, run_id: str, next_seq: int = 0):
+        self.store = store
+        self.run_id = run_id
+        self.seq = next_seq
+
+    def node_finished(self, node_id: str, status: Optional[str], is_success: bool, input_data: Any,
+                      output_data: Any, error: Optional[str], next_ids: List[str],
+                      frontier: List[str], global_data: Dict[str, Any]):
+        self.store.record_node(self.run_id, self.seq, node_id, status, is_success,
+                               input_data, output_data, error, next_ids)
+        self.store.update_run(self.run_id, frontier=frontier, global_data=global_data)
+        self.seq += 1
+
+    def finish(self, status: str):
+        self.store.update_run(self.run_id, status=status)
+
+
+_store: Optional[CheckpointStore] = None
+_store_lock = Lock()
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    """检查点是可选功能，第一次使用时才创建数据库"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CheckpointStore()
+    return _store
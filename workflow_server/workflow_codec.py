@@ -0,0 +1,69 @@
+"""
+JSON 编解码
+
+websocket 消息、工作流配置存储、API 请求体模板、响应体和节点输入的解析统一经过这里。
+安装了 orjson 时使用 orjson，否则（或 WORKFLOW_JSON_BACKEND=json 时）使用标准库 json，
+两者输出的都是紧凑、不转义非 ASCII 字符的 JSON。
+
+orjson 不支持的输入交给标准库处理：超过 64 位的整数、NaN/Infinity 字面量、单独的代理字符等，
+解析失败时统一抛出标准库的 json.JSONDecodeError。与标准库仍有的差异：编码时 NaN/Infinity 输出为 null，
+解析时超过 64 位的整数成为浮点数。指纹计算依赖标准库的输出格式，不经过这里。
+"""
+import json
+from typing import Any, Callable, Optional, Union
+
+from multienv import multienv
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库
+    orjson = None
+
+
+_orjson = orjson if multienv.get("WORKFLOW_JSON_BACKEND", "auto") != "json" else None
+JSON_BACKEND = 'orjson' if _orjson is not None else 'json'
+
+JSONDecodeError = json.JSONDecodeError
+
+if _orjson is not None:
+    # 非字符串的键按标准库的方式转换；日期和 dataclass 与标准库一样交给 default
+    _ORJSON_OPTIONS = _orjson.OPT_NON_STR_KEYS | _orjson.OPT_PASSTHROUGH_DATETIME | _orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def _std_dumps(value: Any, default: Optional[Callable[[Any], Any]]) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=default)
+
+
+def dumpb(value: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """编码为 UTF-8 字节，orjson 直接输出字节，省去字符串的中转"""
+    if _orjson is not None:
+        try:
+            return _orjson.dumps(value, default=default, option=_ORJSON_OPTIONS)
+        except _orjson.JSONEncodeError:
+            pass  # 交给标准库，标准库同样无法编码时由它报错
+    text = _std_dumps(value, default)
+    try:
+        return text.encode('utf-8')
+    except UnicodeEncodeError:
+        # 单独的代理字符无法编码为 UTF-8，转义为 \uXXXX
+        return json.dumps(value, separators=(',', ':'), default=default).encode('utf-8')
+
+
+def dumps(value: Any, default: Optional[Callable[[Any], Any]] = None) -> str:
+    """编码为字符串"""
+    if _orjson is not None:
+        try:
+            return _orjson.dumps(value, default=default, option=_ORJSON_OPTIONS).decode('utf-8')
+        except _orjson.JSONEncodeError:
+            pass
+    return _std_dumps(value, default)
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """解析字符串或字节，失败时抛出 json.JSONDecodeError（字节不是合法 UTF-8 时为 UnicodeDecodeError）"""
+    if _orjson is not None:
+        try:
+            return _orjson.loads(data)
+        except _orjson.JSONDecodeError:
+            pass  # 由标准库再解析一次，保持标准库接受的输入和报错信息
+    return json.loads(data)
@@ -4,7 +4,7 @@ from fastapi.responses import JSONResponse
 from fastapi import APIRouter, HTTPException, Depends, Response
 from contextlib import contextmanager
 import sqlite3
-import json
+from workflow_codec import dumps, loads
 from datetime import datetime
 
 
@@ -43,7 +43,7 @@ class WorkflowDB:
         INSERT INTO workflows (name, config_json, updated_at, exported_at)
         VALUES (?, ?, ?, ?)
         """
-        config_json = json.dumps(workflow['config'])
+        config_json = dumps(workflow['config'])
         cursor = self.conn.cursor()  # 获取游标对象
 
         cursor.execute(query, (
@@ -68,7 +68,7 @@ class WorkflowDB:
             return {
                 'id': row[0],
                 'name': row[1],
-                'config': json.loads(row[2]),
+                'config': loads(row[2]),
                 'created_at': row[3],
                 'updated_at': row[4],
                 'exported_at': row[5]
@@ -85,7 +85,7 @@ class WorkflowDB:
             workflows.append({
                 'id': row[0],
                 'name': row[1],
-                'config': json.loads(row[2]),
+                'config': loads(row[2]),
                 'created_at': row[3],
                 'updated_at': row[4],
                 'exported_at': row[5]
@@ -99,7 +99,7 @@ class WorkflowDB:
         SET name = ?, config_json = ?, updated_at = ?, exported_at = ?
         WHERE id = ?
         """
-        config_json = json.dumps(workflow['config'])
+        config_json = dumps(workflow['config'])
         updated_at = datetime.now().isoformat()  # 更新为当前时间
 
         self.conn.execute(query, (
@@ -134,7 +134,7 @@ class WorkflowDB:
             workflows.append({
                 'id': row[0],
                 'name': row[1],
-                'config': json.loads(row[2]),
+                'config': loads(row[2]),
                 'created_at': row[3],
                 'updated_at': row[4],
                 'exported_at': row[5]
@@ -0,0 +1,380 @@
+"""
+批量条件求值：用与条件节点相同的表达式语言过滤记录列表
+
+${item.<路径>} 引用当前记录的字段（${item} 为记录本身），其它 ${...}（context/input/global）
+整批只取一次值。安装了 NumPy 时被引用的字段先转换为列，比较和 &&/|| 以数组运算完成；
+同一字段中类型混杂（如数字和字符串）、字符串字面量中引用记录字段，或者未安装 NumPy 时逐条求值，
+两种方式结果相同。
+
+与条件节点不同，记录中缺少的字段（或值为 null）不报错：涉及它的比较为假，单独作为操作数时为假。
+"""
+from collections import ChainMap
+from typing import Dict, Any, Optional, List, Sequence, Tuple, Callable
+
+from extract_var import compile_path, compile_reference, compile_template, split_path
+from workflow_bool_eval import Parser, _BINARY_OPERATORS, _standalone_templates, _template_operand
+from workflow_log import get_logger
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 NumPy 时逐条求值
+    np = None
+
+
+log = get_logger("filter")
+
+if np is None:
+    log.warning("filter.numpy_missing", fallback="row", hint="pip install numpy")
+
+# 超过该长度的字符串列不转换为定长字符串数组（NumPy 没有变长字符串类型时）
+_MAX_FIXED_WIDTH = 256
+
+# 记录中缺少的字段
+MISSING = object()
+
+# 绝对值超过 2^53 的整数转换为 float64 会丢失精度，这样的列逐条求值
+_MAX_EXACT_INT = 2 ** 53
+
+
+# 可以按列求值的值类型，子类（如枚举）逐条计算
+_KINDS = {bool: 'bool', int: 'num', float: 'num', str: 'str'}
+
+
+class _Unvectorizable(Exception):
+    """表达式或数据无法按列求值，改为逐条求值"""
+
+
+def _item_path(path: str) -> Optional[str]:
+    """${item.xxx} 返回 xxx（${item} 返回空串），其它引用返回 None"""
+    path = path.strip()
+    if path == 'item':
+        return ''
+    if path.startswith('item.') or path.startswith('item['):
+        return path[5:] if path[4] == '.' else path[4:]
+    return None
+
+
+class BatchCondition:
+    """
+    编译后的批量条件，mask() 返回每条记录是否满足条件，filter() 返回满足条件的记录
+
+    表达式在创建时解析一次，语法错误在求值时抛出（与条件节点在执行时失败一致）。
+    """
+
+    def __init__(self, source: str, vectorize: bool = True):
+        self.source = source
+        self.error: Optional[ValueError] = None
+        self.item_paths: List[str] = []  # 表达式引用的记录字段
+        self.vectorize = vectorize and np is not None
+        self.vectorized_runs = 0
+        self.row_runs = 0
+        try:
+            parser = Parser(source)
+            self.ast = parser.parse()
+            if not parser.is_at_end():
+                raise ValueError(f"Unexpected token at position {parser.current}")
+            if not _standalone_templates(parser.tokens):
+                raise ValueError("过滤条件中的 ${...} 不能与其它操作数相连")
+        except ValueError as e:
+            self.error = e
+            return
+        self._walks: Dict[str, Callable[[Any], Any]] = {}
+        self._row = self._compile_row(self.ast)
+        try:
+            self._vector = self._compile_vector(self.ast) if self.vectorize else None
+        except _Unvectorizable:
+            self._vector = None
+
+    def mask(self, records: Sequence[Any], context_data: Any = None, input_data: Any = None,
+             global_data: Optional[Dict[str, Any]] = None) -> List[bool]:
+        """每条记录是否满足条件"""
+        mask = self._mask(records, (context_data or {}, input_data, global_data or {}))
+        if np is not None and isinstance(mask, np.ndarray):
+            return mask.tolist()
+        return [bool(matched) for matched in mask]
+
+    def filter(self, records: Sequence[Any], context_data: Any = None, input_data: Any = None,
+               global_data: Optional[Dict[str, Any]] = None) -> List[Any]:
+        """满足条件的记录，保持原顺序"""
+        mask = self._mask(records, (context_data or {}, input_data, global_data or {}))
+        if np is not None and isinstance(mask, np.ndarray):
+            return [records[index] for index in np.flatnonzero(mask)]
+        return [record for record, matched in zip(records, mask) if matched]
+
+    def _mask(self, records: Sequence[Any], roots: Tuple[Any, Any, Any]):
+        if self.error is not None:
+            raise self.error
+        if self._vector is not None and len(records) > 0:
+            try:
+                columns = {path: _column(path, self._walks[path], records) for path in self.item_paths}
+                operand = self._vector(_Batch(len(records), columns, roots))
+                self.vectorized_runs += 1
+                return _truth(operand, len(records))
+            except _Unvectorizable:
+                log.debug("filter.row_fallback", condition=self.source, records=len(records))
+        self.row_runs += 1
+        row = self._row
+        return [_row_truth(row(record, roots)) for record in records]
+
+    def _walk_for(self, path: str) -> Callable[[Any], Any]:
+        if path not in self._walks:
+            self._walks[path] = compile_path(path)
+            self.item_paths.append(path)
+        return self._walks[path]
+
+    # ---- 逐条求值 ----
+
+    def _compile_row(self, ast: Dict[str, Any]) -> Callable[[Any, Tuple[Any, Any, Any]], Any]:
+        node_type = ast['type']
+
+        if node_type == 'BinaryExpression':
+            left = self._compile_row(ast['left'])
+            right = self._compile_row(ast['right'])
+            compare = _BINARY_OPERATORS[ast['operator']]
+
+            def binary(record, roots):
+                a, b = left(record, roots), right(record, roots)
+                if a is MISSING or b is MISSING:
+                    return False
+                return compare(a, b)
+            return binary
+
+        if node_type == 'LogicalExpression':
+            left = self._compile_row(ast['left'])
+            right = self._compile_row(ast['right'])
+            if ast['operator'] == '&&':
+                return lambda record, roots: _row_truth(left(record, roots)) and _row_truth(right(record, roots))
+            return lambda record, roots: _row_truth(left(record, roots)) or _row_truth(right(record, roots))
+
+        if node_type == 'Identifier':
+            name = ast['name']
+
+            def identifier(record, roots):
+                raise KeyError(f"Variable '{name}' not found in context")
+            return identifier
+
+        if node_type == 'TemplateLiteral':
+            path = ast['path']
+            item_path = _item_path(path)
+            if item_path is not None:
+                walk = self._walk_for(item_path)
+
+                def field(record, roots):
+                    value = walk(record)
+                    return MISSING if value is None else _template_operand(value)
+                return field
+            scalar = _scalar_reference(path)
+            return lambda record, roots: scalar(roots)
+
+        if node_type == 'Literal':
+            value = ast['value']
+            if isinstance(value, str) and '${' in value:
+                # 字符串中的记录字段通过 context 中的 item 引用
+                template = compile_template(value)
+                return lambda record, roots: template.render(ChainMap({'item': record}, roots[0]), *roots[1:])
+            return lambda record, roots: value
+
+        if node_type == 'ParenthesizedExpression':
+            return self._compile_row(ast['expression'])
+
+        raise ValueError(f"Unknown AST node type: {node_type}")
+
+    # ---- 按列求值 ----
+
+    def _compile_vector(self, ast: Dict[str, Any]) -> Callable[['_Batch'], '_Operand']:
+        node_type = ast['type']
+
+        if node_type == 'BinaryExpression':
+            left = self._compile_vector(ast['left'])
+            right = self._compile_vector(ast['right'])
+            operator = ast['operator']
+            return lambda batch: _compare(operator, left(batch), right(batch))
+
+        if node_type == 'LogicalExpression':
+            left = self._compile_vector(ast['left'])
+            right = self._compile_vector(ast['right'])
+            combine = np.logical_and if ast['operator'] == '&&' else np.logical_or
+            return lambda batch: _Operand('bool', combine(_truth(left(batch), batch.size),
+                                                          _truth(right(batch), batch.size)))
+
+        if node_type == 'Identifier':
+            name = ast['name']
+
+            def identifier(batch):
+                raise KeyError(f"Variable '{name}' not found in context")
+            return identifier
+
+        if node_type == 'TemplateLiteral':
+            path = ast['path']
+            item_path = _item_path(path)
+            if item_path is not None:
+                self._walk_for(item_path)
+                return lambda batch: batch.columns[item_path]
+            scalar = _scalar_reference(path)
+            return lambda batch: _scalar_operand(scalar(batch.roots))
+
+        if node_type == 'Literal':
+            value = ast['value']
+            if isinstance(value, str) and '${' in value:
+                template = compile_template(value)
+                if any(_item_path(part[2][2:-1]) is not None for part in template.parts):
+                    raise _Unvectorizable()
+                return lambda batch: _scalar_operand(template.render(*batch.roots))
+            operand = _scalar_operand(value)
+            return lambda batch: operand
+
+        if node_type == 'ParenthesizedExpression':
+            return self._compile_vector(ast['expression'])
+
+        raise ValueError(f"Unknown AST node type: {node_type}")
+
+
+class _Batch:
+    __slots__ = ('size', 'columns', 'roots')
+
+    def __init__(self, size: int, columns: Dict[str, '_Operand'], roots: Tuple[Any, Any, Any]):
+        self.size = size
+        self.columns = columns
+        self.roots = roots
+
+
+class _Operand:
+    """
+    按列求值的中间结果
+    kind: num（float64，布尔值也按数字比较）/ bool / str / none（整列缺失）
+    values 为数组或标量，valid 为有效位数组（None 表示全部有效）
+    """
+
+    __slots__ = ('kind', 'values', 'valid')
+
+    def __init__(self, kind: str, values: Any, valid: Any = None):
+        self.kind = kind
+        self.values = values
+        self.valid = valid
+
+
+def _scalar_reference(path: str) -> Callable[[Tuple[Any, Any, Any]], Any]:
+    """整批共用的引用，与条件节点一样找不到时报错"""
+    access = compile_reference(path)
+
+    def reference(roots):
+        value = access(roots)
+        if value is None:
+            raise KeyError(f"Path '{path}' not found in context")
+        return _template_operand(value)
+    return reference
+
+
+def _row_truth(value: Any) -> bool:
+    return value is not MISSING and bool(value)
+
+
+def _kind_of(value: Any) -> str:
+    kind = _KINDS.get(type(value))
+    if kind is None:
+        raise _Unvectorizable()
+    if type(value) is int and not -_MAX_EXACT_INT <= value <= _MAX_EXACT_INT:
+        raise _Unvectorizable()
+    return kind
+
+
+def _scalar_operand(value: Any) -> _Operand:
+    return _Operand(_kind_of(value), value)
+
+
+def _column(path: str, walk: Callable[[Any], Any], records: Sequence[Any]) -> _Operand:
+    """取出一个字段的所有值并转换为数组，类型混杂时放弃按列求值"""
+    steps = split_path(path)
+    if len(steps) == 1 and type(steps[0]) is str:
+        # 最常见的单层字段直接取值，省去每条记录一次函数调用
+        key = steps[0]
+        values = [record.get(key) if type(record) is dict else walk(record) for record in records]
+    else:
+        values = [walk(record) for record in records]
+    types = set(map(type, values))
+    if str in types:
+        values = [_template_operand(value) if type(value) is str else value for value in values]
+        types = set(map(type, values))
+    missing = type(None) in types
+    types.discard(type(None))
+    kinds = set()
+    for value_type in types:
+        if value_type not in _KINDS:
+            raise _Unvectorizable()
+        kinds.add(_KINDS[value_type])
+    if not kinds:
+        return _Operand('none', None, np.zeros(len(values), dtype=bool))
+
+    valid = None
+    if missing:
+        objects = np.array(values, dtype=object)
+        valid = objects != None  # noqa: E711 逐元素比较
+    if kinds <= {'num', 'bool'}:
+        kind = 'bool' if kinds == {'bool'} else 'num'
+        if missing:
+            objects[~valid] = False if kind == 'bool' else 0.0
+            values = objects
+        array = np.array(values, dtype=bool if kind == 'bool' else np.float64)
+        if int in types and (np.abs(array) > _MAX_EXACT_INT).any():
+            raise _Unvectorizable()
+    elif kinds == {'str'}:
+        kind = 'str'
+        if missing:
+            objects[~valid] = ''
+            values = objects.tolist()
+        array = _string_array(values)
+    else:
+        raise _Unvectorizable()
+    return _Operand(kind, array, valid)
+
+
+def _string_array(values: List[str]):
+    string_dtype = getattr(getattr(np, 'dtypes', None), 'StringDType', None)
+    if string_dtype is not None:
+        return np.array(values, dtype=string_dtype())
+    if max(map(len, values), default=0) > _MAX_FIXED_WIDTH:
+        raise _Unvectorizable()
+    return np.array(values, dtype=str)
+
+
+def _valid(left: _Operand, right: _Operand):
+    if left.valid is None:
+        return right.valid
+    if right.valid is None:
+        return left.valid
+    return left.valid & right.valid
+
+
+def _compare(operator: str, left: _Operand, right: _Operand) -> _Operand:
+    if left.kind == 'none' or right.kind == 'none':
+        return _Operand('bool', False)
+    numeric = ('num', 'bool')
+    valid = _valid(left, right)
+    if (left.kind in numeric) != (right.kind in numeric):
+        # 数字与字符串：相等比较恒为假（不等恒为真），大小比较与逐条求值一样报错
+        if valid is not None and not np.any(valid):
+            return _Operand('bool', False)
+        if operator not in ('==', '!='):
+            left_type = 'float' if left.kind == 'num' else left.kind
+            right_type = 'float' if right.kind == 'num' else right.kind
+            raise TypeError(f"'{operator}' not supported between instances of '{left_type}' and '{right_type}'")
+        result = operator == '!='
+    else:
+        result = _BINARY_OPERATORS[operator](left.values, right.values)
+    if valid is not None:
+        result = np.logical_and(result, valid)
+    return _Operand('bool', result)
+
+
+def _truth(operand: _Operand, size: int):
+    """操作数的真值，缺失的记录为假，广播为长度为 size 的布尔数组"""
+    if operand.kind == 'none':
+        return np.zeros(size, dtype=bool)
+    values = operand.values
+    if operand.kind == 'str':
+        truth = np.not_equal(values, '') if isinstance(values, np.ndarray) else bool(values)
+    else:
+        truth = values != 0 if isinstance(values, np.ndarray) else bool(values)
+    if operand.valid is not None:
+        truth = np.logical_and(truth, operand.valid)
+    return np.broadcast_to(np.asarray(truth, dtype=bool), (size,))
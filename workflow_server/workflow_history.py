@@ -0,0 +1,271 @@
+import datetime
+import os
+import pickle
+import sys
+import tempfile
+import time
+import weakref
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from threading import Lock
+from typing import Dict, Any, Iterator, Optional
+
+from multienv import multienv
+from workflow_response import LazyResponse
+
+
+# 执行记录保留策略：all（全部保留）、last:N（只保留最近 N 个节点的输入输出）、
+# referenced（只保留被其它节点通过 ${context.<id>} 引用的节点）、
+# live / live:spill（引用者全部执行完后丢弃 / 转存到磁盘）
+HISTORY_RETENTION = multienv.get("WORKFLOW_HISTORY_RETENTION", "all")
+# 超过该大小（字节，抽样估算值）的输入输出在结果发出后写入临时文件，记录中只保留句柄；0 表示不转存
+PAYLOAD_MAX_BYTES = int(multienv.get("WORKFLOW_PAYLOAD_MAX_BYTES", str(16 * 1024 * 1024)))
+# 小于该大小的对象转存没有意义
+_SPILL_MIN_BYTES = 1024
+PAYLOAD_SPILL_DIR = multienv.get("WORKFLOW_PAYLOAD_SPILL_DIR",
+                                 os.path.join(tempfile.gettempdir(), "workflow_payloads"))
+
+
+def known_size(obj: Any) -> Optional[int]:
+    """不遍历对象就能得到的字节数：字符串、字节和惰性响应，其它对象返回 None"""
+    if obj is None:
+        return 0
+    if isinstance(obj, (str, bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, LazyResponse):
+        return obj.size
+    return None
+
+
+def approx_size(obj: Any, samples: int = 8, depth: int = 4) -> int:
+    """
+    按抽样粗略估算对象占用的字节数：每层最多查看 samples 个元素并按平均值推算整体，
+    超过 depth 层的容器只按元素个数计算，耗时与对象大小无关
+    """
+    size = known_size(obj)
+    if size is not None:
+        return size
+    if isinstance(obj, Mapping):
+        count = len(obj)
+        if count == 0 or depth == 0:
+            return 64 + 16 * count
+        picked = list(islice(obj.items(), samples))
+        sampled = sum(approx_size(key, samples, depth - 1) + approx_size(value, samples, depth - 1)
+                      for key, value in picked)
+        return 64 + sampled * count // len(picked)
+    if isinstance(obj, (list, tuple)):
+        count = len(obj)
+        if count == 0 or depth == 0:
+            return 56 + 8 * count
+        # 均匀取样，避免只看开头的元素
+        picked = [obj[i * count // min(count, samples)] for i in range(min(count, samples))]
+        sampled = sum(approx_size(item, samples, depth - 1) for item in picked)
+        return 56 + 8 * count + sampled * count // len(picked)
+    if isinstance(obj, (set, frozenset)):
+        count = len(obj)
+        if count == 0 or depth == 0:
+            return 56 + 8 * count
+        picked = list(islice(obj, samples))
+        return 56 + 8 * count + sum(approx_size(item, samples, depth - 1) for item in picked) * count // len(picked)
+    return sys.getsizeof(obj)
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class PayloadHandle:
+    """转存到临时文件的大对象，句柄被回收时删除文件"""
+
+    __slots__ = ('path', 'size', 'kind', '__weakref__')
+
+    def __init__(self, value: Any, size: int):
+        os.makedirs(PAYLOAD_SPILL_DIR, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(suffix='.pkl', dir=PAYLOAD_SPILL_DIR)
+        weakref.finalize(self, _remove_file, self.path)  # 序列化失败时同样删除
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.size = size
+        self.kind = type(value).__name__
+
+    def load(self) -> Any:
+        with open(self.path, 'rb') as f:
+            return pickle.load(f)
+
+    def __repr__(self) -> str:
+        return f"<PayloadHandle {self.kind} ~{self.size} bytes>"
+
+
+def resolve_payload(value: Any) -> Any:
+    return value.load() if isinstance(value, PayloadHandle) else value
+
+
+# 转存在单独的线程中进行，序列化和写盘不占用调度器（服务模式下是事件循环）
+_spill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="payload-spill")
+_swap_lock = Lock()
+
+
+def flush_spills():
+    """等待已提交的转存完成"""
+    _spill_executor.submit(lambda: None).result()
+
+
+class ExecutionRecord(Mapping):
+    """
+    节点执行记录
+
+    使用 __slots__ 存储，同时保持原先字典的读取方式（record['output']、record.get(...)），
+    创建时原样保存输入输出，调度器和回调拿到的是内存中的对象；结果发出后（settle）
+    超过 PAYLOAD_MAX_BYTES 的部分在后台转存为 PayloadHandle，读取时透明加载；
+    被保留策略释放后输入输出为 None。
+    """
+
+    __slots__ = ('status', 'raw_input', 'raw_output', 'created_at', 'released')
+
+    _FIELDS = ('status', 'input', 'output', 'timestamp')
+
+    def __init__(self, status: str, input_data: Any, output_data: Any):
+        self.status = status
+        self.raw_input = input_data
+        self.raw_output = output_data
+        self.created_at = time.time()
+        self.released = False
+
+    @property
+    def input(self) -> Any:
+        return resolve_payload(self.raw_input)
+
+    @property
+    def output(self) -> Any:
+        return resolve_payload(self.raw_output)
+
+    @property
+    def timestamp(self) -> str:
+        return datetime.datetime.fromtimestamp(self.created_at).isoformat()
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._FIELDS)
+
+    def __len__(self) -> int:
+        return len(self._FIELDS)
+
+    def compact(self, limit: Optional[int] = None):
+        """在后台把超过 limit（默认 PAYLOAD_MAX_BYTES）的输入输出转存到磁盘"""
+        if limit is None:
+            limit = PAYLOAD_MAX_BYTES
+        if limit <= 0 or self.released:
+            return
+        for field in ('raw_input', 'raw_output'):
+            value = getattr(self, field)
+            if value is None or isinstance(value, (bool, int, float, PayloadHandle)):
+                continue
+            size = approx_size(value)
+            if size > limit:
+                _spill_executor.submit(self._swap, field, value, size)
+
+    def spill(self):
+        """输入输出整体转存到磁盘（过小的对象除外）"""
+        self.compact(_SPILL_MIN_BYTES)
+
+    def _swap(self, field: str, value: Any, size: int):
+        try:
+            handle = PayloadHandle(value, size)
+        except (pickle.PicklingError, TypeError, AttributeError, OSError):
+            return  # 无法序列化时原样保留
+        with _swap_lock:
+            # 转存期间记录可能已被释放或替换
+            if getattr(self, field) is value:
+                setattr(self, field, handle)
+
+    def release(self):
+        """释放输入输出，只保留状态和时间"""
+        with _swap_lock:
+            self.raw_input = None
+            self.raw_output = None
+            self.released = True
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = {field: self[field] for field in self._FIELDS}
+        for field in ('input', 'output'):
+            if isinstance(record[field], LazyResponse):
+                record[field] = record[field].to_dict()
+        return record
+
+    def __repr__(self) -> str:
+        # 不加载转存的内容
+        return repr({'status': self.status, 'input': self.raw_input, 'output': self.raw_output,
+                     'timestamp': self.timestamp, **({'released': True} if self.released else {})})
+
+
+class HistoryRetention:
+    """
+    单次运行的执行记录保留策略
+
+    节点结果经回调发出之后由调度器调用 settle（跳过的节点同样会 settle），
+    按策略释放不再需要的记录，保留的大对象在后台转存；回调和下游节点的输入始终拿到内存中的完整结果。
+
+    live 模式按编译时的引用分析计数：一个节点的所有引用者都执行完（或被跳过、取消）
+    之后立即释放它的记录，live:spill 则转存到磁盘而不是丢弃。
+    引用者在环上时无法确定最后一次使用，对应的记录不释放。
+    """
+
+    def __init__(self, spec: str = HISTORY_RETENTION, plan=None):
+        mode, _, arg = spec.strip().partition(':')
+        if mode not in ('all', 'last', 'referenced', 'live'):
+            raise ValueError(f"未知的执行记录保留策略: {spec}")
+        self.mode = mode
+        self.limit = max(int(arg or 0), 0) if mode == 'last' else 0
+        self.spill = mode == 'live' and arg == 'spill'
+
+        consumers = plan.consumers if plan is not None else {}
+        cyclic = plan.cyclic if plan is not None else frozenset()
+        self.references = plan.references if plan is not None else {}
+        self.referenced = frozenset(consumers)
+        self.pinned = frozenset(producer for producer, ids in consumers.items()
+                                if any(consumer in cyclic for consumer in ids))
+        self.remaining: Dict[str, int] = {producer: len(ids) for producer, ids in consumers.items()}
+        self._settled: "deque[str]" = deque()
+        self._done = set()
+
+    def settle(self, history: Dict[str, ExecutionRecord], node_id: str):
+        if self.mode == 'last':
+            if node_id in history:
+                self._settled.append(node_id)
+            while len(self._settled) > self.limit:
+                self._release(history, self._settled.popleft())
+        elif self.mode == 'referenced':
+            if node_id not in self.referenced:
+                self._release(history, node_id)
+        elif self.mode == 'live':
+            if node_id not in self._done:
+                self._done.add(node_id)
+                # 该节点引用的上游少了一个待执行的引用者
+                for producer in self.references.get(node_id, ()):
+                    self.remaining[producer] -= 1
+                    if self.remaining[producer] == 0 and producer in self._done:
+                        self._release(history, producer)
+            if self.remaining.get(node_id, 0) == 0:
+                self._release(history, node_id)
+        record = history.get(node_id)
+        if isinstance(record, ExecutionRecord):
+            record.compact()
+
+    def _release(self, history: Dict[str, ExecutionRecord], node_id: str):
+        if self.mode == 'live' and node_id in self.pinned:
+            return
+        record = history.get(node_id)
+        if isinstance(record, ExecutionRecord):
+            if self.spill:
+                record.spill()
+            else:
+                record.release()
@@ -0,0 +1,208 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager, contextmanager
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from threading import Lock
+from typing import Dict, Any
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from multienv import multienv
+from workflow_metrics import METRICS_ENABLED, endpoint_duration, endpoint_label
+from workflow_trace import http_span
+
+try:
+    import httpx
+except ImportError:  # 未安装 httpx 时异步引擎回退到线程池执行
+    httpx = None
+
+
+# 每个主机连接池的最大连接数
+HTTP_POOL_MAXSIZE = int(multienv.get("HTTP_POOL_MAXSIZE", "32"))
+# 连接池满时是否阻塞等待空闲连接（否则临时新建连接，用完即丢弃）
+HTTP_POOL_BLOCK = multienv.get("HTTP_POOL_BLOCK", "0") == "1"
+# 异步客户端空闲连接的保活时间（秒）
+HTTP_KEEPALIVE_EXPIRY = float(multienv.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+
+def host_key(url: str) -> str:
+    """连接池按 scheme://host:port 区分"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+# 共享会话和客户端的 Cookie 策略：不保存也不发送任何 Cookie。
+# 连接池在所有运行和用户之间共享，响应的 Set-Cookie 一旦进入共享的容器，
+# 就会随后续其它用户的请求发出；需要 Cookie 的请求应在请求头中自行携带。
+NO_COOKIES = DefaultCookiePolicy(allowed_domains=[])
+
+
+async def _aclose_quietly(client):
+    try:
+        await client.aclose()
+    except Exception:  # 原事件循环已关闭时连接无法正常关闭，直接丢弃
+        pass
+
+
+class _HostStats:
+    __slots__ = ('requests', 'in_flight', 'peak_in_flight', 'waited')
+
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.waited = 0  # 发起时连接池已占满的请求数
+
+
+class SessionRegistry:
+    """
+    进程级 HTTP 会话注册表
+
+    同步请求按主机复用 requests.Session，每个会话挂载独立的连接池；
+    异步请求共享当前事件循环上的 httpx.AsyncClient。两者都保持长连接，
+    避免每次节点执行都重新建立 TCP/TLS 连接。共享的会话和客户端不保存 Cookie。
+    """
+
+    def __init__(self, pool_maxsize: int = HTTP_POOL_MAXSIZE, pool_block: bool = HTTP_POOL_BLOCK,
+                 keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY):
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keepalive_expiry = keepalive_expiry
+        self._sessions: Dict[str, requests.Session] = {}
+        self._stats: Dict[str, _HostStats] = {}
+        self._lock = Lock()
+        self._async_client = None
+        self._async_client_loop = None
+        self._closing = set()  # 正在关闭的旧客户端任务，保持引用直到完成
+
+    def session_for(self, url: str) -> requests.Session:
+        key = host_key(url)
+        session = self._sessions.get(key)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is None:
+                    session = requests.Session()
+                    session.cookies.set_policy(NO_COOKIES)
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize,
+                                          pool_block=self.pool_block)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._sessions[key] = session
+        return session
+
+    def async_client(self):
+        """获取当前事件循环上共享的 httpx 异步客户端"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            limits = httpx.Limits(max_connections=None,
+                                  max_keepalive_connections=self.pool_maxsize,
+                                  keepalive_expiry=self.keepalive_expiry)
+            previous, previous_loop = self._async_client, self._async_client_loop
+            self._async_client = httpx.AsyncClient(limits=limits, cookies=CookieJar(NO_COOKIES))
+            self._async_client_loop = loop
+            if previous is not None:
+                self._close_later(previous, previous_loop)
+        return self._async_client
+
+    def _close_later(self, client, loop):
+        """关闭被替换的客户端：原事件循环仍在运行时在原循环上关闭，否则在当前循环上关闭"""
+        if loop is not None and loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(_aclose_quietly(client), loop)
+                return
+            except RuntimeError:  # 原事件循环刚刚关闭
+                pass
+        task = asyncio.get_running_loop().create_task(_aclose_quietly(client))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """完整读取响应体后返回；需要边收边处理时使用 stream()，统计才会包括读取的时间"""
+        with self._track(url), http_span(method, url):
+            return self.session_for(url).request(method, url, **kwargs)
+
+    @contextmanager
+    def stream(self, method: str, url: str, **kwargs):
+        """同步的流式请求：耗时统计和追踪覆盖到响应体读取结束，退出时关闭响应"""
+        with self._track(url), http_span(method, url):
+            with self.session_for(url).request(method, url, stream=True, **kwargs) as response:
+                yield response
+
+    async def arequest(self, method: str, url: str, **kwargs):
+        with self._track(url), http_span(method, url):
+            return await self.async_client().request(method, url, **kwargs)
+
+    @asynccontextmanager
+    async def astream(self, method: str, url: str, **kwargs):
+        with self._track(url), http_span(method, url):
+            async with self.async_client().stream(method, url, **kwargs) as response:
+                yield response
+
+    @contextmanager
+    def _track(self, url: str):
+        key = host_key(url)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _HostStats()
+            stats.requests += 1
+            if stats.in_flight >= self.pool_maxsize:
+                stats.waited += 1
+            stats.in_flight += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        finally:
+            with self._lock:
+                stats.in_flight -= 1
+            if METRICS_ENABLED:
+                endpoint_duration.observe((endpoint_label(url), outcome), time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        各主机的连接池统计
+
+        connections/pool_requests 来自 urllib3 连接池（仅同步请求），
+        reuse_rate 为复用已有连接的请求占比；waiting 为当前超出连接池容量的请求数。
+        """
+        hosts = {}
+        with self._lock:
+            for key, stats in self._stats.items():
+                hosts[key] = {
+                    'requests': stats.requests,
+                    'in_flight': stats.in_flight,
+                    'peak_in_flight': stats.peak_in_flight,
+                    'waiting': max(0, stats.in_flight - self.pool_maxsize),
+                    'waited': stats.waited,
+                }
+            sessions = dict(self._sessions)
+
+        for key, session in sessions.items():
+            connections, pool_requests = self._pool_counters(session)
+            info = hosts.setdefault(key, {})
+            info['connections'] = connections
+            info['pool_requests'] = pool_requests
+            info['reuse_rate'] = 1 - connections / pool_requests if pool_requests else 0.0
+        return {'pool_maxsize': self.pool_maxsize, 'pool_block': self.pool_block, 'hosts': hosts}
+
+    @staticmethod
+    def _pool_counters(session: requests.Session):
+        connections = pool_requests = 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is not None:
+                    connections += pool.num_connections
+                    pool_requests += pool.num_requests
+        return connections, pool_requests
+
+
+# 全局实例
+http_sessions = SessionRegistry()
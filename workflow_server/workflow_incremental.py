@@ -0,0 +1,156 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Any, Optional, Tuple
+
+from multienv import multienv
+from workflow_response import LazyResponse, is_preview
+
+
+# 服务端保存的节点结果数量上限
+RESULT_STORE_SIZE = int(multienv.get("WORKFLOW_RESULT_STORE_SIZE", "1024"))
+# 服务端保存的节点结果的有效期（秒），0 表示不过期
+RESULT_STORE_TTL = float(multienv.get("WORKFLOW_RESULT_STORE_TTL", "3600"))
+
+# 可以复用的执行状态，失败、取消的结果总是重新执行
+_REUSABLE_STATUS = ('completed', 'parallel_start', 'parallel_end')
+
+
+class ResultStore:
+    """按节点指纹保存最近的执行结果，LRU 淘汰，超过 ttl 秒的结果不再复用"""
+
+    def __init__(self, maxsize: int = RESULT_STORE_SIZE, ttl: float = RESULT_STORE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._results: "OrderedDict[str, Tuple[float, Tuple[str, Any, Any]]]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, fingerprint: str) -> Optional[Tuple[str, Any, Any]]:
+        with self._lock:
+            entry = self._results.get(fingerprint)
+            if entry is not None and self.ttl > 0 and time.monotonic() - entry[0] > self.ttl:
+                del self._results[fingerprint]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(fingerprint)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, fingerprint: str, status: str, input_data: Any, output_data: Any):
+        with self._lock:
+            self._results[fingerprint] = (time.monotonic(), (status, input_data, output_data))
+            self._results.move_to_end(fingerprint)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': len(self._results), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses, 'expired': self.expired}
+
+
+# 全局实例
+result_store = ResultStore()
+
+
+def _canonical(value: Any) -> Any:
+    # API 响应按原始响应体的摘要计算指纹，不需要解码
+    return value.canonical() if isinstance(value, LazyResponse) else str(value)
+
+
+def content_digest(value: Any) -> str:
+    """值的内容摘要：字符串和字节直接计算，API 响应只用原始响应体的摘要，其它值按规范化的 JSON 计算"""
+    if isinstance(value, (bytes, bytearray)):
+        raw = bytes(value)
+    elif isinstance(value, str):
+        raw = value.encode('utf-8', 'surrogatepass')
+    else:
+        if isinstance(value, LazyResponse):
+            value = value.canonical()
+        raw = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':'),
+                         default=_canonical).encode('utf-8', 'surrogatepass')
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+
+class IncrementalRun:
+    """
+    增量执行：单次运行的节点指纹与结果复用
+
+    节点指纹 = H(节点配置, 激活它的上游节点指纹, 它通过 ${context.<id>} 引用的节点指纹, 全局数据)，
+    与编辑器 data.runtime 中上次运行留下的指纹或服务端 ResultStore 中的指纹一致时，
+    直接复用上次的输出，不再执行节点。
+
+    有上游的节点的输入由上游的输出决定，已经包含在上游指纹中，不再序列化输入本身；
+    只有起始节点计入输入的摘要。结果不确定的节点（温度大于 0 的大模型、API 请求等，
+    见节点的 incremental）不复用，执行后把输出的摘要并入指纹，下游随输出的变化重新执行。
+    """
+
+    def __init__(self, plan, runtime: Optional[Dict[str, Dict[str, Any]]] = None,
+                 store: ResultStore = result_store):
+        self.plan = plan
+        self.store = store
+        self.fingerprints: Dict[str, str] = {}
+        self.reused = set()
+        # 编辑器回传的上次运行结果：指纹 -> (状态, 输入, 输出)；
+        # 推送时只有预览的 API 响应不能复用，完整内容以服务端 ResultStore 为准
+        self.previous: Dict[str, Tuple[str, Any, Any]] = {}
+        for runtime_data in (runtime or {}).values():
+            if runtime_data and runtime_data.get('isSuccess') and runtime_data.get('fingerprint') \
+                    and not is_preview(runtime_data.get('output')):
+                self.previous[runtime_data['fingerprint']] = (
+                    'completed', runtime_data.get('input'), runtime_data.get('output'))
+
+    @staticmethod
+    def runtime_of(workflow_json: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """取出工作流JSON中各节点上次运行的结果"""
+        return {node_data['id']: node_data['data'].get('runtime')
+                for node_data in workflow_json['nodes'] if node_data['data'].get('runtime')}
+
+    def fingerprint(self, node_id: str, upstream, input_data: Any, global_data: Dict[str, Any]) -> str:
+        """计算并记住节点本次执行的指纹"""
+        references = self.plan.references.get(node_id, ())
+        canonical = json.dumps([
+            self.plan.config_hashes.get(node_id),
+            sorted(self.fingerprints.get(source, '') for source in upstream),
+            [self.fingerprints.get(source, '') for source in references],
+            None if upstream else content_digest(input_data),
+            content_digest(global_data),
+        ], separators=(',', ':'))
+        fingerprint = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+        self.fingerprints[node_id] = fingerprint
+        return fingerprint
+
+    def lookup(self, node, fingerprint: str) -> Optional[Tuple[str, Any, Any]]:
+        """查找可以复用的结果"""
+        if not node.incremental:
+            return None
+        result = self.store.get(fingerprint) or self.previous.get(fingerprint)
+        if result is not None:
+            self.reused.add(node.id)
+        return result
+
+    def remember(self, node_id: str, status: Optional[str], input_data: Any, output_data: Any):
+        """保存真实执行成功的结果；不复用的节点只把输出摘要并入指纹"""
+        fingerprint = self.fingerprints.get(node_id)
+        if not fingerprint or status not in _REUSABLE_STATUS:
+            return
+        node = self.plan.nodes.get(node_id)
+        if node is not None and not node.incremental:
+            self.fingerprints[node_id] = hashlib.sha256(
+                f"{fingerprint}:{content_digest(output_data)}".encode('utf-8')).hexdigest()[:32]
+            return
+        self.store.put(fingerprint, status, input_data, output_data)
+
+    def fingerprint_of(self, node_id: str, status: Optional[str]) -> Optional[str]:
+        """发给前端的指纹，只有可复用的结果才带上"""
+        if status in _REUSABLE_STATUS:
+            return self.fingerprints.get(node_id)
+        return None
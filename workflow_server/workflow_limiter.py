@@ -0,0 +1,324 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from threading import Event, Lock
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from multienv import multienv
+from workflow_singleflight import RunCancelled
+
+
+# 令牌桶：每秒请求数上限（0 表示不限速）与突发容量
+LLM_LIMIT_RATE = float(multienv.get("LLM_LIMIT_RATE", "0"))
+LLM_LIMIT_BURST = float(multienv.get("LLM_LIMIT_BURST", "10"))
+# AIMD 并发窗口
+LLM_LIMIT_INITIAL_WINDOW = float(multienv.get("LLM_LIMIT_INITIAL_WINDOW", "8"))
+LLM_LIMIT_MIN_WINDOW = float(multienv.get("LLM_LIMIT_MIN_WINDOW", "1"))
+LLM_LIMIT_MAX_WINDOW = float(multienv.get("LLM_LIMIT_MAX_WINDOW", "64"))
+# 拥塞时窗口乘以该系数
+LLM_LIMIT_BACKOFF = float(multienv.get("LLM_LIMIT_BACKOFF", "0.5"))
+# 首字节延迟（收到响应头的时间）超过近期最小值的多少倍视为拥塞；默认 0 只看 429/503 和连接错误。
+# 大模型的首字节延迟随提示长度变化很大，只在请求比较均匀的后端上开启
+LLM_LIMIT_LATENCY_TOLERANCE = float(multienv.get("LLM_LIMIT_LATENCY_TOLERANCE", "0"))
+
+# 视为拥塞的状态码；其它错误（如 400、500）是请求本身的问题，只计数不缩小窗口
+_CONGESTION_STATUS = frozenset((429, 503))
+
+# 基线延迟取最近多少次请求的最小值
+_LATENCY_SAMPLES = 100
+
+# 同步排队时每隔多少秒检查一次运行是否已被停止
+_CANCEL_CHECK_INTERVAL = 0.1
+
+
+class _Waiter:
+    __slots__ = ('event', 'future', 'loop', 'granted')
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.granted = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class Permit:
+    """一次请求占用的并发名额，用于回报状态码与延迟"""
+
+    __slots__ = ('started', 'latency', 'status')
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.latency: Optional[float] = None
+        self.status: Optional[int] = None
+
+    def observe(self, status: int):
+        """
+        收到响应头时调用，延迟为首字节延迟；流式和非流式请求都应在读取响应体之前调用，
+        名额会一直占用到读取结束
+        """
+        self.status = status
+        self.latency = time.monotonic() - self.started
+
+
+class EndpointLimiter:
+    """
+    单个后端的自适应限流器
+
+    令牌桶限制请求速率，AIMD 窗口限制并发：正常响应时窗口每轮加一，
+    遇到 429/503 或没有收到响应的错误（连接失败、超时）时窗口按比例缩小；
+    latency_tolerance 大于 0 时首字节延迟明显高于基线也视为拥塞。
+    超出窗口的请求按先来先到排队，线程与协程共用同一个队列。
+    """
+
+    def __init__(self, name: str, rate: float = LLM_LIMIT_RATE, burst: float = LLM_LIMIT_BURST,
+                 initial_window: float = LLM_LIMIT_INITIAL_WINDOW, min_window: float = LLM_LIMIT_MIN_WINDOW,
+                 max_window: float = LLM_LIMIT_MAX_WINDOW, backoff: float = LLM_LIMIT_BACKOFF,
+                 latency_tolerance: float = LLM_LIMIT_LATENCY_TOLERANCE):
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.min_window = min_window
+        self.max_window = max_window
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.window = min(max(initial_window, min_window), max_window)
+
+        self._lock = Lock()
+        self._waiters: "deque[_Waiter]" = deque()
+        self._in_flight = 0
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._latencies: "deque[float]" = deque(maxlen=_LATENCY_SAMPLES)
+        self._last_decrease = 0.0
+
+        self._counters = {'requests': 0, 'queued': 0, 'throttled': 0, 'errors': 0,
+                          'congested': 0, 'decreases': 0, 'max_queue_depth': 0}
+        self._queue_wait = 0.0
+
+    @contextmanager
+    def limit(self, cancelled: Optional[Callable[[], bool]] = None):
+        """
+        同步获取名额，退出时根据 permit 的回报调整窗口
+
+        cancelled 返回 True 时（如 context.is_cancelled）放弃排队并抛出 RunCancelled；
+        线程无法像协程一样被直接取消，只能在等待期间定期检查。
+        """
+        waited = self._acquire(cancelled)
+        delay = self._reserve_token()
+        if delay > 0:
+            try:
+                self._sleep(delay, cancelled)
+            except RunCancelled:
+                self._release(None)
+                raise
+        self._add_wait(waited + delay)
+        permit = Permit()
+        try:
+            yield permit
+        except RunCancelled:  # 运行被停止不作为拥塞信号
+            self._release(None)
+            raise
+        except Exception:
+            self._release(permit, failed=True)
+            raise
+        except BaseException:
+            self._release(None)
+            raise
+        self._release(permit)
+
+    @asynccontextmanager
+    async def alimit(self):
+        waited = await self._aacquire()
+        delay = self._reserve_token()
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._release(None)
+            raise
+        self._add_wait(waited + delay)
+        permit = Permit()
+        try:
+            yield permit
+        except RunCancelled:
+            self._release(None)
+            raise
+        except Exception:
+            self._release(permit, failed=True)
+            raise
+        except BaseException:  # 取消不作为拥塞信号
+            self._release(None)
+            raise
+        self._release(permit)
+
+    def _acquire(self, cancelled: Optional[Callable[[], bool]] = None) -> float:
+        started = time.monotonic()
+        with self._lock:
+            waiter = self._try_acquire(None)
+        if waiter is None:
+            return 0.0
+        if cancelled is None:
+            waiter.event.wait()
+        else:
+            while not waiter.event.wait(_CANCEL_CHECK_INTERVAL):
+                if cancelled():
+                    self._abandon(waiter)
+                    raise RunCancelled("工作流已停止")
+        return time.monotonic() - started
+
+    @staticmethod
+    def _sleep(seconds: float, cancelled: Optional[Callable[[], bool]]):
+        """等待令牌，期间检查运行是否已被停止"""
+        deadline = time.monotonic() + seconds
+        while True:
+            if cancelled is not None and cancelled():
+                raise RunCancelled("工作流已停止")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, _CANCEL_CHECK_INTERVAL) if cancelled is not None else remaining)
+
+    async def _aacquire(self) -> float:
+        started = time.monotonic()
+        with self._lock:
+            waiter = self._try_acquire(asyncio.get_running_loop())
+        if waiter is None:
+            return 0.0
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        return time.monotonic() - started
+
+    def _abandon(self, waiter: _Waiter):
+        """放弃排队：名额已经分给了自己时交还给下一个等待者"""
+        with self._lock:
+            if waiter.granted:
+                self._in_flight -= 1
+                self._wake_waiters()
+            else:
+                self._waiters.remove(waiter)
+
+    def _try_acquire(self, loop) -> Optional[_Waiter]:
+        """在锁内调用：有空闲名额时直接占用并返回 None，否则排队"""
+        self._counters['requests'] += 1
+        if not self._waiters and self._in_flight < self._capacity():
+            self._in_flight += 1
+            return None
+        waiter = _Waiter(loop)
+        self._waiters.append(waiter)
+        self._counters['queued'] += 1
+        self._counters['max_queue_depth'] = max(self._counters['max_queue_depth'], len(self._waiters))
+        return waiter
+
+    def _reserve_token(self) -> float:
+        """预占一个令牌，返回需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def _release(self, permit: Optional[Permit], failed: bool = False):
+        with self._lock:
+            self._in_flight -= 1
+            if permit is not None:
+                self._feedback(permit, failed)
+            self._wake_waiters()
+
+    def _feedback(self, permit: Permit, failed: bool):
+        """在锁内调用：AIMD 调整窗口"""
+        now = time.monotonic()
+        latency = permit.latency if permit.latency is not None else now - permit.started
+        status = permit.status
+
+        congested = False
+        if status == 429:
+            self._counters['throttled'] += 1
+            congested = True
+        elif status in _CONGESTION_STATUS or (failed and status is None):
+            self._counters['errors'] += 1
+            congested = True
+        elif failed or (status is not None and status >= 500):
+            # 请求本身的错误：不调整窗口，也不计入基线延迟
+            self._counters['errors'] += 1
+            return
+        elif self._latencies and self.latency_tolerance > 0 \
+                and latency > min(self._latencies) * self.latency_tolerance:
+            self._counters['congested'] += 1
+            congested = True
+
+        if not congested:
+            self._latencies.append(latency)
+            # 窗口被用满时才增长，避免空闲期无限扩大
+            if self._in_flight + 1 >= math.floor(self.window):
+                self.window = min(self.max_window, self.window + 1 / self.window)
+        elif now - self._last_decrease > latency:
+            # 同一轮内的多个拥塞信号只缩小一次
+            self.window = max(self.min_window, self.window * self.backoff)
+            self._last_decrease = now
+            self._counters['decreases'] += 1
+
+    def _wake_waiters(self):
+        while self._waiters and self._in_flight < self._capacity():
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self._in_flight += 1
+            waiter.wake()
+
+    def _capacity(self) -> int:
+        return max(1, math.floor(self.window))
+
+    def _add_wait(self, seconds: float):
+        with self._lock:
+            self._queue_wait += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update(window=round(self.window, 2), in_flight=self._in_flight,
+                         queue_depth=len(self._waiters), queue_wait_total=round(self._queue_wait, 3),
+                         baseline_latency=round(min(self._latencies), 3) if self._latencies else None,
+                         rate=self.rate)
+        return stats
+
+
+class LimiterRegistry:
+    """按 ip:port 管理限流器"""
+
+    def __init__(self):
+        self._limiters: Dict[Tuple[str, str], EndpointLimiter] = {}
+        self._lock = Lock()
+
+    def get(self, ip: Any, port: Any) -> EndpointLimiter:
+        key = (str(ip), str(port))
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.setdefault(key, EndpointLimiter(f"{key[0]}:{key[1]}"))
+        return limiter
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {limiter.name: limiter.stats() for limiter in limiters}
+
+
+# 全局实例
+endpoint_limiters = LimiterRegistry()
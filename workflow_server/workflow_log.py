@@ -0,0 +1,203 @@
+import atexit
+import json
+import logging
+import queue
+import reprlib
+import sys
+import time
+from threading import Thread
+from typing import Dict, Any, Optional
+
+from multienv import multienv
+
+
+# 日志级别：节点执行细节为 DEBUG，INFO 级别下节点循环中几乎没有日志开销
+WORKFLOW_LOG_LEVEL = multienv.get("WORKFLOW_LOG_LEVEL", "INFO").upper()
+# 单个字段（输入、输出、请求体等）在日志中最多保留的字符数，0 表示不截断
+WORKFLOW_LOG_TRUNCATE = int(multienv.get("WORKFLOW_LOG_TRUNCATE", "200"))
+# 输出格式：text（key=value）或 json（每行一个 JSON 对象）
+WORKFLOW_LOG_FORMAT = multienv.get("WORKFLOW_LOG_FORMAT", "text")
+# 日志文件，为空时写到 stderr
+WORKFLOW_LOG_FILE = multienv.get("WORKFLOW_LOG_FILE", "")
+# 后台线程一次最多合并写入多少条日志
+WORKFLOW_LOG_BATCH_SIZE = int(multienv.get("WORKFLOW_LOG_BATCH_SIZE", "512"))
+
+_ROOT = "workflow"
+
+
+def _make_repr(limit: int) -> reprlib.Repr:
+    """有界的 repr：大对象只遍历前面一部分，开销与截断长度相关而不是对象大小"""
+    short = reprlib.Repr()
+    if limit > 0:
+        short.maxstring = limit
+        short.maxother = limit
+        short.maxlist = short.maxtuple = short.maxset = short.maxdict = max(limit // 10, 6)
+        short.maxlevel = 4
+    else:
+        short.maxstring = short.maxother = sys.maxsize
+        short.maxlist = short.maxtuple = short.maxset = short.maxdict = sys.maxsize
+        short.maxlevel = sys.maxsize
+    return short
+
+
+_short = _make_repr(WORKFLOW_LOG_TRUNCATE)
+
+
+def truncate(value: Any, limit: int = WORKFLOW_LOG_TRUNCATE) -> str:
+    """把字段值转成长度有限的字符串"""
+    text = value if isinstance(value, str) else _short.repr(value)
+    if 0 < limit < len(text):
+        return f"{text[:limit]}...({len(text)} chars)"
+    return text
+
+
+class EventLogger:
+    """
+    结构化事件日志
+
+    每条日志是一个事件名加若干字段：log.debug("node.execute", node=self.id, type=self.type, input=input_data)。
+    事件名是稳定的“来源.动作”形式（node.execute、llm.failed、run.finish 等），日志消费方按事件名过滤，
+    可变的信息都放在字段中。
+    级别未开启时直接返回，字段不做任何格式化；开启时字段在调用线程中按
+    WORKFLOW_LOG_TRUNCATE 截断成字符串（之后对象被修改也不影响日志），
+    其余格式化和 I/O 由后台线程完成。
+    """
+
+    __slots__ = ('logger',)
+
+    def __init__(self, name: str):
+        self.logger = logging.getLogger(f"{_ROOT}.{name}")
+
+    def is_enabled(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level: int, event: str, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, extra={'fields': {key: truncate(value) for key, value in fields.items()}})
+
+    def debug(self, event: str, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event: str, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event: str, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+
+class EventFormatter(logging.Formatter):
+    """把事件和字段格式化为一行文本或 JSON"""
+
+    def __init__(self, style: str = WORKFLOW_LOG_FORMAT):
+        super().__init__()
+        self.json = style == 'json'
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields: Dict[str, str] = getattr(record, 'fields', None) or {}
+        if self.json:
+            line = {'ts': round(record.created, 6), 'level': record.levelname,
+                    'logger': record.name, 'event': record.getMessage(), **fields}
+            if record.exc_info:
+                line['exc'] = self.formatException(record.exc_info)
+            return json.dumps(line, ensure_ascii=False, default=str)
+
+        created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))
+        parts = [f"{created}.{int(record.msecs):03d}", record.levelname, record.name, record.getMessage()]
+        parts.extend(f"{key}={value}" for key, value in fields.items())
+        line = ' '.join(parts)
+        if record.exc_info:
+            line = f"{line}\n{self.formatException(record.exc_info)}"
+        return line
+
+
+class _QueueHandler(logging.Handler):
+    """调用线程只把记录放入队列，不做 I/O"""
+
+    def __init__(self, records: "queue.SimpleQueue"):
+        super().__init__()
+        self.records = records
+
+    def emit(self, record: logging.LogRecord):
+        # 与 logging.handlers.QueueHandler 相同，提前固定消息和异常文本
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.put(record)
+
+
+class BatchLogSink:
+    """
+    异步批量写日志
+
+    后台线程取出队列中已有的全部记录（最多 batch_size 条），
+    格式化后一次写入并 flush，高峰期大量日志只产生少量系统调用。
+    """
+
+    def __init__(self, stream=None, formatter: Optional[logging.Formatter] = None,
+                 batch_size: int = WORKFLOW_LOG_BATCH_SIZE):
+        self.stream = stream or sys.stderr
+        self.formatter = formatter or EventFormatter()
+        self.batch_size = batch_size
+        self.records: "queue.SimpleQueue" = queue.SimpleQueue()
+        self.handler = _QueueHandler(self.records)
+        self.dropped = 0
+        self._thread = Thread(target=self._write_loop, name="workflow-log", daemon=True)
+        self._thread.start()
+
+    def _write_loop(self):
+        while True:
+            batch = [self.records.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            lines = []
+            for record in batch:
+                if record is None:
+                    continue
+                try:
+                    lines.append(self.formatter.format(record))
+                except Exception:
+                    self.dropped += 1
+            if lines:
+                try:
+                    self.stream.write('\n'.join(lines) + '\n')
+                    self.stream.flush()
+                except (OSError, ValueError):
+                    self.dropped += len(lines)
+            if stop:
+                return
+
+    def stop(self, timeout: float = 2.0):
+        """写完队列中剩余的日志（进程退出时调用）"""
+        if self._thread.is_alive():
+            self.records.put(None)
+            self._thread.join(timeout)
+
+
+def setup_logging(level: str = WORKFLOW_LOG_LEVEL, log_file: str = WORKFLOW_LOG_FILE) -> BatchLogSink:
+    """配置 workflow.* 日志，只应调用一次"""
+    stream = open(log_file, 'a', encoding='utf-8') if log_file else sys.stderr
+    sink = BatchLogSink(stream)
+    root = logging.getLogger(_ROOT)
+    root.setLevel(getattr(logging, level, logging.INFO))
+    root.addHandler(sink.handler)
+    root.propagate = False
+    atexit.register(sink.stop)
+    return sink
+
+
+# 全局实例
+log_sink = setup_logging()
+
+
+def get_logger(name: str) -> EventLogger:
+    return EventLogger(name)
@@ -0,0 +1,324 @@
+import bisect
+import math
+import random
+import time
+from threading import Lock
+from typing import Dict, Any, Optional, Tuple, List, Sequence, Set
+from urllib.parse import urlsplit
+
+from multienv import multienv
+from workflow_history import approx_size, known_size
+
+
+METRICS_ENABLED = multienv.get("WORKFLOW_METRICS_ENABLED", "1") == "1"
+# 没有现成大小的输入输出（列表、字典等）按该比例抽样估算，默认 0 只记录字符串、字节和 API 响应的大小
+METRICS_SIZE_SAMPLE = float(multienv.get("WORKFLOW_METRICS_SIZE_SAMPLE", "0"))
+# 标签取值个数的上限，超出后归入 other：workflow 来自 URL 路径，endpoint 来自节点配置的地址
+METRICS_MAX_WORKFLOWS = int(multienv.get("WORKFLOW_METRICS_MAX_WORKFLOWS", "200"))
+METRICS_MAX_ENDPOINTS = int(multienv.get("WORKFLOW_METRICS_MAX_ENDPOINTS", "100"))
+
+# 耗时直方图的桶（秒），覆盖本地节点到长时间的大模型调用
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# 数据量直方图的桶（字节）
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+OTHER_LABEL = 'other'
+# 内置节点类型，由 workflow 模块注册；其它类型（配置中任意填写的 type）归入 other
+KNOWN_NODE_TYPES: Set[str] = set()
+
+
+class BoundedLabels:
+    """取值个数有上限的标签：最先出现的 limit 个值原样保留，之后的新值归入 other"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._seen: Set[str] = set()
+        self._lock = Lock()
+
+    def __call__(self, value: Any) -> str:
+        value = str(value)
+        if value in self._seen:
+            return value
+        with self._lock:
+            if len(self._seen) < self.limit:
+                self._seen.add(value)
+                return value
+        return OTHER_LABEL
+
+
+# 全局实例
+workflow_label = BoundedLabels(METRICS_MAX_WORKFLOWS)
+_endpoint_hosts = BoundedLabels(METRICS_MAX_ENDPOINTS)
+
+
+def endpoint_label(url: str) -> str:
+    """出站请求按主机名统计，不包含协议、端口、路径和查询参数"""
+    host = urlsplit(url).hostname
+    return _endpoint_hosts(host) if host else OTHER_LABEL
+
+
+def node_type_label(node_type: str) -> str:
+    return node_type if node_type in KNOWN_NODE_TYPES else OTHER_LABEL
+
+
+def payload_size(value: Any) -> Optional[int]:
+    """
+    输入输出的字节数，只取不需要遍历的来源（字符串、字节、API 响应的原始长度）。
+    其它对象按 METRICS_SIZE_SAMPLE 抽样估算，未抽中时返回 None，不记录。
+    """
+    size = known_size(value)
+    if size is None and METRICS_SIZE_SAMPLE > 0 and random.random() < METRICS_SIZE_SAMPLE:
+        size = approx_size(value)
+    return size
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in values]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, labels: Tuple = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+
+class Histogram(_Metric):
+    """按标签分组的累计直方图，observe 只在锁内做一次二分查找和几次加法"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}  # 标签 -> [各桶计数..., 总和, 总数]
+
+    def observe(self, labels: Tuple, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        lines = []
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {values[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内的指标集合，按 Prometheus 文本格式输出"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# 全局实例
+metrics = MetricsRegistry()
+
+node_duration = metrics.histogram(
+    "workflow_node_duration_seconds", "Node execution wall time", ("node_type", "workflow", "status"))
+node_queue_wait = metrics.histogram(
+    "workflow_node_queue_wait_seconds", "Time between a node becoming ready and starting", ("node_type", "workflow"))
+node_input_bytes = metrics.histogram(
+    "workflow_node_input_bytes", "Estimated node input size", ("node_type", "workflow"), SIZE_BUCKETS)
+node_output_bytes = metrics.histogram(
+    "workflow_node_output_bytes", "Estimated node output size", ("node_type", "workflow"), SIZE_BUCKETS)
+nodes_total = metrics.counter(
+    "workflow_nodes_total", "Finished nodes by status", ("node_type", "workflow", "status"))
+nodes_in_flight = metrics.gauge(
+    "workflow_nodes_in_flight", "Nodes currently executing")
+run_duration = metrics.histogram(
+    "workflow_run_duration_seconds", "Workflow run wall time", ("workflow", "status"))
+runs_in_flight = metrics.gauge(
+    "workflow_runs_in_flight", "Workflow runs currently executing")
+run_peak_concurrency = metrics.histogram(
+    "workflow_run_peak_concurrency", "Most nodes executing at once within a run", ("workflow",),
+    (1, 2, 4, 8, 16, 32, 64, 128))
+endpoint_duration = metrics.histogram(
+    "workflow_endpoint_request_duration_seconds", "Outbound HTTP request time per endpoint",
+    ("endpoint", "outcome"))
+
+
+class NodeTiming:
+    """单个节点一次执行的时间点（time.monotonic）"""
+
+    __slots__ = ('queued_at', 'started', 'finished')
+
+    def __init__(self, queued_at: Optional[float] = None):
+        self.queued_at = queued_at
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def start(self):
+        self.started = time.monotonic()
+        if self.queued_at is None:
+            self.queued_at = self.started
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    @property
+    def duration(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+    @property
+    def queue_wait(self) -> float:
+        if self.started is None or self.queued_at is None:
+            return 0.0
+        return self.started - self.queued_at
+
+
+class RunMetrics:
+    """
+    单次运行的指标记录，由调度器调用
+
+    映射节点的子运行通过 sub_run() 记录，节点指标归到外层运行的 workflow 标签下，
+    不计入运行数和运行耗时。
+    """
+
+    def __init__(self, label: str, enabled: bool = METRICS_ENABLED, run_level: bool = True):
+        self.workflow = workflow_label(label)
+        self.enabled = enabled
+        self.run_level = run_level
+        self.started = time.monotonic()
+        self.running = 0
+        self.peak = 0
+        self._lock = Lock()
+        if enabled and run_level:
+            runs_in_flight.inc()
+
+    def sub_run(self) -> 'RunMetrics':
+        return RunMetrics(self.workflow, self.enabled, run_level=False)
+
+    def node_started(self, timing: NodeTiming):
+        """在执行节点的线程或任务中调用"""
+        timing.start()
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        if self.enabled:
+            nodes_in_flight.inc()
+
+    def node_finished(self, timing: NodeTiming):
+        timing.finish()
+        with self._lock:
+            self.running -= 1
+        if self.enabled:
+            nodes_in_flight.dec()
+
+    def observe_node(self, node, status: Optional[str], timing: Optional[NodeTiming],
+                     input_data: Any = None, output_data: Any = None):
+        """节点结果处理完后调用；复用、取消等没有真正执行的节点只计数"""
+        if not self.enabled:
+            return
+        node_type = node_type_label(node.type)
+        nodes_total.inc((node_type, self.workflow, status or 'unknown'))
+        if timing is None or timing.finished is None:
+            return
+        node_duration.observe((node_type, self.workflow, status or 'unknown'), timing.duration)
+        node_queue_wait.observe((node_type, self.workflow), timing.queue_wait)
+        input_size = payload_size(input_data)
+        if input_size is not None:
+            node_input_bytes.observe((node_type, self.workflow), input_size)
+        output_size = payload_size(output_data)
+        if output_size is not None:
+            node_output_bytes.observe((node_type, self.workflow), output_size)
+
+    def finish(self, status: str):
+        if not self.enabled:
+            return
+        self.enabled = False
+        if not self.run_level:
+            return
+        runs_in_flight.dec()
+        run_duration.observe((self.workflow, status), time.monotonic() - self.started)
+        run_peak_concurrency.observe((self.workflow,), self.peak)
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import re
+from collections import OrderedDict, deque
+from threading import Lock
+from types import MappingProxyType
+from typing import Dict, Any, List, Tuple, Callable, Mapping, Optional, Set
+
+from multienv import multienv
+from extract_var import ExpressionEvaluateVariablor
+
+
+# 计划缓存最多保留的工作流数量
+PLAN_CACHE_SIZE = int(multienv.get("WORKFLOW_PLAN_CACHE_SIZE", "128"))
+
+# 参与指纹计算的边字段，其余字段（样式、动画等）只影响前端展示
+_EDGE_KEYS = ('source', 'target', 'sourceHandle')
+
+# 引用路径的第一段即节点ID
+_REF_HEAD = re.compile(r'[^.\[\s]+')
+
+
+def workflow_fingerprint(workflow_json: Dict[str, Any]) -> str:
+    """
+    计算工作流内容哈希
+
+    只包含节点配置和连线关系，忽略 runtime、坐标、选中状态等编辑器字段，
+    这样编辑器每次回传的运行结果不会让缓存失效。
+    """
+    nodes = []
+    for node_data in workflow_json['nodes']:
+        data = {k: v for k, v in node_data['data'].items() if k != 'runtime'}
+        nodes.append([node_data['id'], data])
+    edges = [[edge.get(k) for k in _EDGE_KEYS]
+             for edge in workflow_json['edges']]
+    canonical = json.dumps([nodes, edges], sort_keys=True,
+                           ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def node_config_hash(data: Dict[str, Any]) -> str:
+    """单个节点配置的哈希，用于增量执行的节点指纹，同样忽略 runtime"""
+    canonical = json.dumps({k: v for k, v in data.items() if k != 'runtime'}, sort_keys=True,
+                           ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def context_references(data: Any) -> Set[str]:
+    """
+    静态扫描节点配置中通过 ${context.<id>...}（或省略 context. 前缀）引用的节点ID
+    runtime 字段是上次运行的结果，不参与扫描
+    """
+    refs: Set[str] = set()
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            for match in ExpressionEvaluateVariablor.pattern.finditer(item):
+                ref = match.group(1).strip()
+                if ref == 'input' or ref.startswith(('input.', 'global.')):
+                    continue
+                if ref.startswith('context.'):
+                    ref = ref[8:]
+                head = _REF_HEAD.match(ref)
+                if head:
+                    refs.add(head.group(0))
+        elif isinstance(item, dict):
+            stack.extend(value for key, value in item.items() if key != 'runtime')
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return refs
+
+
+class WorkflowPlan:
+    """
+    编译后的工作流执行计划
+
+    同一工作流的所有运行共享一个计划：节点对象（含预解析的配置）、连线、
+    拓扑顺序和邻接表在编译时一次性生成，之后只读；每次运行只需要分配
+    WorkflowContext 和调度状态。
+    """
+
+    __slots__ = ('fingerprint', 'nodes', 'edges', 'start_node',
+                 'order', 'cyclic', 'successors', 'predecessors', 'in_degree',
+                 'references', 'consumers', 'config_hashes')
+
+    def __init__(self, fingerprint: str, nodes: Dict[str, Any], edges: List[Dict[str, Any]], start_node,
+                 references: Optional[Dict[str, Set[str]]] = None,
+                 config_hashes: Optional[Dict[str, str]] = None):
+        self.fingerprint = fingerprint
+        self.nodes: Mapping[str, Any] = MappingProxyType(dict(nodes))
+        self.edges: Tuple[Dict[str, Any], ...] = tuple(
+            {k: edge.get(k) for k in _EDGE_KEYS} for edge in edges)
+        self.start_node = start_node
+
+        successors: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+        predecessors: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+        in_degree: Dict[str, int] = {node_id: 0 for node_id in nodes}
+        for edge in self.edges:
+            successors[edge['source']].append(edge['target'])
+            predecessors[edge['target']].append(edge['source'])
+            in_degree[edge['target']] += 1
+        self.successors: Mapping[str, Tuple[str, ...]] = MappingProxyType(
+            {node_id: tuple(targets) for node_id, targets in successors.items()})
+        self.predecessors: Mapping[str, Tuple[str, ...]] = MappingProxyType(
+            {node_id: tuple(sources) for node_id, sources in predecessors.items()})
+        self.in_degree: Mapping[str, int] = MappingProxyType(in_degree)
+        self.order: Tuple[str, ...]
+        self.cyclic: frozenset  # 环上的节点及其下游，可能执行多次
+        self.order, self.cyclic = self._topological_order()
+
+        # 引用关系（静态分析结果）：节点ID -> 它引用的节点，以及反向的 节点ID -> 引用它的节点
+        references = {consumer: tuple(sorted(p for p in producers if p in nodes and p != consumer))
+                      for consumer, producers in (references or {}).items() if consumer in nodes}
+        consumers: Dict[str, List[str]] = {}
+        for consumer, producers in references.items():
+            for producer in producers:
+                consumers.setdefault(producer, []).append(consumer)
+        self.references: Mapping[str, Tuple[str, ...]] = MappingProxyType(
+            {node_id: producers for node_id, producers in references.items() if producers})
+        self.consumers: Mapping[str, Tuple[str, ...]] = MappingProxyType(
+            {node_id: tuple(sorted(ids)) for node_id, ids in consumers.items()})
+        # 节点ID -> 节点配置哈希
+        self.config_hashes: Mapping[str, str] = MappingProxyType(dict(config_hashes or {}))
+
+    def _topological_order(self) -> Tuple[Tuple[str, ...], frozenset]:
+        """Kahn 算法求拓扑序，环上的节点按原始顺序追加在最后"""
+        remaining = dict(self.in_degree)
+        queue = deque(node_id for node_id, count in remaining.items() if count == 0)
+        order = []
+        while queue:
+            node_id = queue.popleft()
+            order.append(node_id)
+            for target in self.successors[node_id]:
+                remaining[target] -= 1
+                if remaining[target] == 0:
+                    queue.append(target)
+        seen = set(order)
+        cyclic = [node_id for node_id in remaining if node_id not in seen]
+        return tuple(order + cyclic), frozenset(cyclic)
+
+    def __repr__(self) -> str:
+        return f"WorkflowPlan(fingerprint={self.fingerprint[:12]}, nodes={len(self.nodes)})"
+
+
+class PlanCache:
+    """按内容哈希缓存执行计划，LRU 淘汰"""
+
+    def __init__(self, maxsize: int = PLAN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._plans: "OrderedDict[str, WorkflowPlan]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compile(self, workflow_json: Dict[str, Any],
+                       compile_fn: Callable[[Dict[str, Any], str], WorkflowPlan]) -> WorkflowPlan:
+        fingerprint = workflow_fingerprint(workflow_json)
+        with self._lock:
+            plan = self._plans.get(fingerprint)
+            if plan is not None:
+                self._plans.move_to_end(fingerprint)
+                self.hits += 1
+                return plan
+            self.misses += 1
+
+        # 编译放在锁外，并发编译同一工作流时以先写入的为准
+        plan = compile_fn(workflow_json, fingerprint)
+        with self._lock:
+            plan = self._plans.setdefault(fingerprint, plan)
+            self._plans.move_to_end(fingerprint)
+            while len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+        return plan
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': len(self._plans), 'maxsize': self.maxsize,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+# 全局实例
+plan_cache = PlanCache()
@@ -0,0 +1,145 @@
+"""
+API 节点的惰性响应
+
+响应体以原始字节保存，第一次读取 data（${context.<id>.output.data...} 引用、条件、下游节点）时
+才解码并缓存结果，没有任何节点读取的大响应不产生解码开销，也不占用解码后对象的内存。
+"""
+import hashlib
+from collections.abc import Mapping
+from typing import Dict, Any, Optional, Iterator
+
+from multienv import multienv
+from workflow_codec import loads
+
+
+# 推送给前端的响应体超过该大小（字节）时只推送开头部分的文本，0 表示总是推送完整内容
+RESPONSE_PREVIEW_BYTES = int(multienv.get("WORKFLOW_RESPONSE_PREVIEW_BYTES", "4096"))
+
+_UTF8 = ('utf-8', 'utf8')
+_UNDECODED = object()
+
+
+def _decode_text(content: bytes, encoding: Optional[str]) -> str:
+    try:
+        return content.decode(encoding or 'utf-8', 'replace')
+    except LookupError:  # 响应头声明了未知的字符集
+        return content.decode('utf-8', 'replace')
+
+
+class LazyResponse(Mapping):
+    """
+    API 节点的输出
+
+    保持原先字典的读取方式（output['data']、output.get('headers')），
+    data 优先按 JSON 解码，失败时为文本；headers 在第一次读取时才复制为字典。
+    str() 与原先的字典一致，repr() 不触发解码。
+    """
+
+    __slots__ = ('status_code', 'content', 'encoding', 'request', '_headers', '_data')
+
+    _FIELDS = ('status_code', 'headers', 'data', 'request')
+
+    def __init__(self, status_code: int, headers: Any, content: bytes, encoding: Optional[str] = None,
+                 request: Optional[Dict[str, Any]] = None):
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+        self.request = request
+        self._headers = headers
+        self._data = _UNDECODED
+
+    @classmethod
+    def from_response(cls, response, request: Optional[Dict[str, Any]] = None) -> 'LazyResponse':
+        """requests 和 httpx 的响应都可以，响应体已经读取完毕"""
+        return cls(response.status_code, response.headers, response.content, response.encoding, request)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        if type(self._headers) is not dict:
+            self._headers = dict(self._headers or {})
+        return self._headers
+
+    @property
+    def data(self) -> Any:
+        if self._data is _UNDECODED:
+            self._data = self._decode()
+        return self._data
+
+    @property
+    def decoded(self) -> bool:
+        return self._data is not _UNDECODED
+
+    @property
+    def size(self) -> int:
+        return len(self.content)
+
+    @property
+    def text(self) -> str:
+        return _decode_text(self.content, self.encoding)
+
+    def _decode(self) -> Any:
+        # 未声明字符集或声明为 UTF-8 时直接解析字节，由 json 识别 UTF-8/16/32
+        use_bytes = not self.encoding or self.encoding.lower() in _UTF8
+        try:
+            return loads(self.content if use_bytes else self.text)
+        except ValueError:  # 不是 JSON（包括空响应体），返回原始文本
+            return self.text
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._FIELDS)
+
+    def __len__(self) -> int:
+        return len(self._FIELDS)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: self[field] for field in self._FIELDS}
+
+    def preview(self, limit: int = RESPONSE_PREVIEW_BYTES) -> Dict[str, Any]:
+        """推送给前端的内容：响应体超过 limit 字节时 data 只包含开头部分的文本"""
+        if limit <= 0 or len(self.content) <= limit:
+            return self.to_dict()
+        return {
+            'status_code': self.status_code,
+            'headers': self.headers,
+            'data': {'preview': _decode_text(self.content[:limit], self.encoding),
+                     'truncated': True, 'size': len(self.content)},
+            'request': self.request,
+        }
+
+    def canonical(self) -> Dict[str, Any]:
+        """计算指纹用的表示：响应体以摘要代替，不需要解码"""
+        return {
+            'status_code': self.status_code,
+            'headers': self.headers,
+            'data': hashlib.sha256(self.content).hexdigest(),
+            'request': self.request,
+        }
+
+    def __str__(self) -> str:
+        return str(self.to_dict())
+
+    def __repr__(self) -> str:
+        state = 'decoded' if self.decoded else 'raw'
+        return f"<LazyResponse {self.status_code} {len(self.content)} bytes {state}>"
+
+    def __reduce__(self):
+        # 转存到磁盘时保存原始响应体，加载后仍然按需解码
+        return (LazyResponse, (self.status_code, self.headers, self.content, self.encoding, self.request))
+
+
+def is_preview(value: Any) -> bool:
+    """是否为 preview() 推送给前端的截断内容（前端回传时已经不是完整的响应）"""
+    data = value.get('data') if isinstance(value, dict) else None
+    return isinstance(data, dict) and data.get('truncated') is True and 'preview' in data
+
+
+def plain(value: Any, full: bool = True) -> Any:
+    """json.dumps 的 default：惰性响应转换为完整内容或预览，其它对象转为字符串"""
+    if isinstance(value, LazyResponse):
+        return value.to_dict() if full else value.preview()
+    return str(value)
@@ -0,0 +1,730 @@
+import asyncio
+import inspect
+import queue
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import BoundedSemaphore, Event
+from typing import Dict, Any, Optional, List, Tuple, Callable, Set
+
+from multienv import multienv
+from workflow_metrics import NodeTiming, RunMetrics
+from workflow_trace import RunTrace, node_scope
+
+
+# 单次运行中同时执行的节点数上限
+MAX_PARALLEL_NODES = int(multienv.get("WORKFLOW_MAX_PARALLEL", "8"))
+
+# 进程级线程池：同步调度器执行节点、映射节点处理元素、异步引擎中同步节点回退都使用它，
+# 单次运行的并发数由 WORKFLOW_MAX_PARALLEL 另行限制
+sync_node_executor = ThreadPoolExecutor(
+    max_workers=int(multienv.get("WORKFLOW_SYNC_WORKERS", "32")),
+    thread_name_prefix="workflow-sync-node")
+
+# 单次运行的超时时间（秒），0 表示不限制；超时后正在执行和未开始的节点都标记为取消
+RUN_TIMEOUT = float(multienv.get("WORKFLOW_RUN_TIMEOUT", "0"))
+
+# 节点的默认超时时间（秒），0 表示不限制；节点可以用 data.nodeTimeout 单独设置
+NODE_TIMEOUT = float(multienv.get("WORKFLOW_NODE_TIMEOUT", "0"))
+
+# 停止运行后等待被取消的异步节点收尾（中断 HTTP 请求、归还并发名额）的最长时间
+CANCEL_GRACE = 2.0
+
+# 等待节点结果时检查 stop_event 的间隔，长时间运行的节点不会推迟停止
+STOP_POLL_INTERVAL = 0.1
+
+
+def node_timeout(node) -> Optional[float]:
+    """节点的超时时间，未设置时使用 WORKFLOW_NODE_TIMEOUT"""
+    timeout = getattr(node, 'node_timeout', None) or NODE_TIMEOUT
+    return timeout if timeout > 0 else None
+
+
+def timeout_error(timeout: float) -> str:
+    return f"节点执行超时（{timeout:g}秒）"
+
+
+class NodeTimeout(Exception):
+    """节点执行超过了超时时间"""
+
+
+async def _wait_node(coro, timeout: float):
+    """
+    等待节点协程，超时后取消它（进行中的 HTTP 请求随之中断）并抛出 NodeTimeout。
+    与 wait_for 不同，节点内部抛出的 TimeoutError 不会被当成节点超时。
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    if not done:
+        task.cancel()
+        raise NodeTimeout(timeout_error(timeout))
+    return task.result()
+
+
+def run_node(node, context, input_data: Any, run_metrics: Optional[RunMetrics] = None,
+             timing: Optional[NodeTiming] = None, trace: Optional[RunTrace] = None
+             ) -> Tuple[List[Any], bool, Optional[str]]:
+    """执行单个节点，返回 (后续节点, 是否成功, 错误信息)"""
+    if run_metrics is not None:
+        run_metrics.node_started(timing)
+    try:
+        with node_scope(trace, node.id):
+            next_nodes = node.execute(context, input_data) or []
+        return next_nodes, True, None
+    except Exception as e:
+        context.record_execution(
+            node.id, "failed", input_data, {"error": str(e)})
+        return [], False, str(e)
+    finally:
+        if run_metrics is not None:
+            run_metrics.node_finished(timing)
+
+
+async def arun_node(node, context, input_data: Any, run_metrics: Optional[RunMetrics] = None,
+                    timing: Optional[NodeTiming] = None, trace: Optional[RunTrace] = None
+                    ) -> Tuple[List[Any], bool, Optional[str]]:
+    """异步执行单个节点，返回 (后续节点, 是否成功, 错误信息)"""
+    if run_metrics is not None:
+        run_metrics.node_started(timing)
+    try:
+        with node_scope(trace, node.id):
+            timeout = node_timeout(node)
+            if timeout is None:
+                next_nodes = await node.aexecute(context, input_data) or []
+            else:
+                next_nodes = await _wait_node(node.aexecute(context, input_data), timeout) or []
+        return next_nodes, True, None
+    except asyncio.CancelledError:
+        raise
+    except NodeTimeout as e:
+        context.record_execution(node.id, "failed", input_data, {"error": str(e)})
+        # 回退到线程池的同步节点无法中断，之后写入的执行记录被忽略
+        context.abandoned.add(node.id)
+        return [], False, str(e)
+    except Exception as e:
+        context.record_execution(
+            node.id, "failed", input_data, {"error": str(e)})
+        return [], False, str(e)
+    finally:
+        if run_metrics is not None:
+            run_metrics.node_finished(timing)
+
+
+def _node_result(context, node_id: str) -> Tuple[Any, Any]:
+    """获取节点执行记录中的输入和输出"""
+    node_history = context.get_node_history(node_id)
+    input = node_history.get('input') if node_history else None
+    output = node_history.get('output') if node_history else None
+    return input, output
+
+
+class DagState:
+    """
+    单次运行的DAG调度状态
+
+    入度和邻接表来自编译好的 WorkflowPlan，节点的所有入边都已决出后才会就绪：
+    至少有一条入边被激活（前驱执行后选择了它）则执行，否则跳过并向下游传播。
+
+    汇聚节点（实现了 join_satisfied 的节点，如 FanOutNode）可以按策略提前就绪，
+    此时只为它服务、尚未完成的上游分支会被取消。
+    """
+
+    def __init__(self, plan, start_node=None, start_input: Any = None):
+        self.nodes = plan.nodes
+        self.start_node = start_node or plan.start_node
+        self.start_input = start_input
+        self.successors = plan.successors
+        self.predecessors = plan.predecessors
+        self.in_degree = plan.in_degree
+        self.pending: Dict[str, int] = dict(plan.in_degree)  # 剩余未决入边数
+
+        # 节点ID -> {前驱ID: 前驱输出}，只保存到节点就绪为止，之后输出的生命周期由执行记录的保留策略决定
+        self.activated: Dict[str, Dict[str, Any]] = {}
+        self.sources: Dict[str, Tuple[str, ...]] = {}  # 已就绪节点 -> 激活它的前驱ID（增量执行计算指纹用）
+        self.resolved = set()  # 已就绪或已跳过的节点
+        self.ready: deque = deque()  # (节点, 输入)
+        self.ready_at: Dict[str, float] = {}  # 节点ID -> 就绪时间(monotonic)，用于统计排队时间
+        self.deadlines: Dict[str, float] = {}  # 汇聚节点ID -> 截止时间(monotonic)
+        self.cancelled: List[str] = []  # 因汇聚提前完成而取消的节点，等待调度器处理
+        self.finished = set()  # 已执行完毕或已跳过的节点
+        self.skipped: List[str] = []  # 新跳过的节点，等待调度器处理
+
+    def start(self):
+        """起始节点就绪，其他没有入边的节点无法到达，直接跳过"""
+        self.resolved.add(self.start_node.id)
+        self._push_ready(self.start_node, self.start_input)
+        for node_id, count in list(self.pending.items()):
+            if count == 0 and node_id not in self.resolved:
+                self._resolve(node_id)
+
+    def complete(self, node_id: str, output: Any, next_nodes: List[Any]):
+        """节点执行完毕，激活其选择的后续节点并决出对应入边"""
+        self.finished.add(node_id)
+        chosen = {node.id for node in next_nodes if node}
+        for target in self.successors[node_id]:
+            self.pending[target] -= 1
+            if target in self.resolved:
+                # 已就绪或已跳过的节点不会再读取输入（如汇聚后迟到的分支），不保留输出
+                continue
+            if target in chosen:
+                self.activated.setdefault(target, {})[node_id] = output
+            if self.pending[target] == 0:
+                self._resolve(target)
+            elif self._is_join(target):
+                self._check_join(target)
+
+    def release_stalled(self) -> bool:
+        """
+        存在环时部分节点的入边永远无法全部决出，
+        此时放行一个已被激活的节点（与原BFS的“首次到达即执行”一致）
+        """
+        for node_id in self.activated:
+            if node_id not in self.resolved:
+                self.resolved.add(node_id)
+                self._dispatch(node_id)
+                return True
+        return False
+
+    def next_deadline(self) -> Optional[float]:
+        """最近的汇聚截止时间，没有则返回 None"""
+        return min(self.deadlines.values()) if self.deadlines else None
+
+    def expire(self, now: Optional[float] = None):
+        """让已到截止时间的汇聚节点就绪"""
+        now = time.monotonic() if now is None else now
+        for node_id, deadline in list(self.deadlines.items()):
+            if deadline <= now and node_id not in self.resolved:
+                self._fire_join(node_id)
+
+    def take_cancelled(self) -> List[str]:
+        cancelled, self.cancelled = self.cancelled, []
+        return cancelled
+
+    def replay(self, node_id: str, output: Any, next_ids: List[str], cancelled: bool = False):
+        """按检查点记录重放一个已完成（或已取消）的节点，不重新执行"""
+        self.resolved.add(node_id)
+        self.deadlines.pop(node_id, None)
+        if not cancelled:
+            self.complete(node_id, output, [self.nodes[i] for i in next_ids if i in self.nodes])
+
+    def drop_ready(self, node_ids: Set[str]):
+        self.ready = deque(item for item in self.ready if item[0].id not in node_ids)
+
+    def take_skipped(self) -> List[str]:
+        skipped, self.skipped = self.skipped, []
+        return skipped
+
+    def _resolve(self, node_id: str):
+        self.resolved.add(node_id)
+        self.deadlines.pop(node_id, None)
+        if node_id in self.activated:
+            self._dispatch(node_id)
+        else:
+            # 未被激活的节点被跳过，其出边同样视为已决出
+            self.skipped.append(node_id)
+            self.complete(node_id, None, [])
+
+    def take_sources(self, node_id: str) -> Tuple[str, ...]:
+        return self.sources.pop(node_id, ())
+
+    def _dispatch(self, node_id: str):
+        """被激活的节点就绪：取出输入后不再持有前驱的输出"""
+        input_data = self._input_for(node_id)
+        self.sources[node_id] = tuple(self.activated.pop(node_id))
+        self._push_ready(self.nodes[node_id], input_data)
+
+    def _push_ready(self, node, input_data: Any):
+        self.ready.append((node, input_data))
+        self.ready_at[node.id] = time.monotonic()
+
+    def _is_join(self, node_id: str) -> bool:
+        return hasattr(self.nodes[node_id], 'join_satisfied')
+
+    def _check_join(self, node_id: str):
+        node = self.nodes[node_id]
+        arrived = len(self.activated.get(node_id, ()))
+        total = self.in_degree[node_id]
+        if node.join_satisfied(arrived, total - self.pending[node_id], total):
+            self._fire_join(node_id)
+        elif arrived and node.join_deadline is not None and node_id not in self.deadlines:
+            # 截止时间从第一个分支到达时开始计算
+            self.deadlines[node_id] = time.monotonic() + node.join_deadline
+
+    def _fire_join(self, node_id: str):
+        """汇聚节点提前就绪，取消仍在为它服务的上游分支"""
+        self._resolve(node_id)
+        for upstream in self._exclusive_upstream(node_id):
+            self.resolved.add(upstream)
+            self.cancelled.append(upstream)
+        if self.cancelled:
+            cancelled = set(self.cancelled)
+            self.ready = deque(item for item in self.ready
+                               if item[0].id not in cancelled)
+
+    def _exclusive_upstream(self, join_id: str) -> List[str]:
+        """
+        找出只通向该汇聚节点的上游节点：其所有后继都是该汇聚节点或同类节点。
+        已决出（执行过或跳过）的节点不在其中，正在执行的节点会被包含。
+        """
+        ancestors = []
+        seen = {join_id}
+        stack = list(self.predecessors[join_id])
+        while stack:
+            node_id = stack.pop()
+            if node_id in seen:
+                continue
+            seen.add(node_id)
+            ancestors.append(node_id)
+            stack.extend(self.predecessors[node_id])
+
+        exclusive = {join_id}
+        changed = True
+        while changed:
+            changed = False
+            for node_id in ancestors:
+                if node_id not in exclusive and all(
+                        target in exclusive for target in self.successors[node_id]):
+                    exclusive.add(node_id)
+                    changed = True
+        exclusive.discard(join_id)
+        return [node_id for node_id in ancestors
+                if node_id in exclusive and node_id not in self.finished]
+
+    def _input_for(self, node_id: str) -> Any:
+        """多个前驱时取最后完成的前驱输出，汇聚节点获得所有到达分支的输出"""
+        branches = self.activated.get(node_id, {})
+        if self._is_join(node_id):
+            return dict(branches)
+        outputs = list(branches.values())
+        return outputs[-1] if outputs else None
+
+
+class _SchedulerBase:
+    """同步/异步调度器共用的结果处理逻辑"""
+
+    def __init__(self, workflow, on_node_complete: Optional[Callable] = None,
+                 stop_event: Optional[Event] = None, start_node=None, start_input: Any = None,
+                 checkpoint=None, replay: Optional[List[Dict[str, Any]]] = None, incremental=None,
+                 trace: Optional[RunTrace] = None, timeout: Optional[float] = None,
+                 parent_metrics: Optional[RunMetrics] = None):
+        self.workflow = workflow
+        self.context = workflow.context
+        self.on_node_complete = on_node_complete
+        self.stop_event = stop_event or Event()
+        self.state = DagState(workflow.plan, start_node, start_input)
+        self.cancelled = set()
+        self.checkpoint = checkpoint  # RunCheckpoint，为 None 时不写检查点
+        self.replay = replay or []  # 恢复运行时需要重放的检查点记录
+        self.incremental = incremental  # IncrementalRun，为 None 时所有节点都执行
+        # 子运行（映射节点）的节点指标记在外层运行的标签下，不单独计为一次运行
+        if parent_metrics is not None:
+            self.metrics = parent_metrics.sub_run()
+        else:
+            self.metrics = RunMetrics(getattr(workflow, 'metrics_label', None) or workflow.plan.fingerprint[:12])
+        self.context.run_metrics = self.metrics
+        self.timings: Dict[str, NodeTiming] = {}  # 正在执行的节点的计时
+        self.failed = False
+        self.trace = trace  # RunTrace，为 None 时不记录时间线
+        # 整次运行的截止时间，timeout 为 None 时使用 WORKFLOW_RUN_TIMEOUT，不大于 0 表示不限制
+        timeout = RUN_TIMEOUT if timeout is None else timeout
+        self.deadline = time.monotonic() + timeout if timeout > 0 else None
+        self.timed_out = False
+        self.aborted = False  # 异步运行被调用方取消
+        self.status: Optional[str] = None  # 运行结束后为 completed / failed / stopped / timeout
+        # 停止或超时时置位，线程中的同步节点（如流式读取）据此提前退出
+        self.context.cancel_event = self.stop_event
+
+    def _restore(self) -> List[Tuple]:
+        """
+        重放检查点中的节点记录，还原执行记录和调度状态，返回需要补发的回调参数。
+        失败的节点不重放，恢复后会重新执行。
+        """
+        events = []
+        replayed = set()
+        for row in self.replay:
+            node_id = row['node_id']
+            if node_id not in self.state.nodes or row['status'] == 'failed':
+                continue
+            self.context.record_execution(node_id, row['status'], row['input'], row['output'])
+            if row['status'] == 'cancelled':
+                self.cancelled.add(node_id)
+                self.state.replay(node_id, None, [], cancelled=True)
+            else:
+                self.state.replay(node_id, row['output'], row['next_ids'])
+            replayed.add(node_id)
+            events.append((node_id, row['is_success'], row['input'], row['output'], row['error']))
+        self.state.drop_ready(replayed)
+        # 重放过程中汇聚节点再次触发的取消，原运行中已经记录过的不再重复处理
+        self.state.cancelled = [node_id for node_id in self.state.take_cancelled()
+                                if node_id not in replayed]
+        return events + self._collect_cancelled()
+
+    def _try_reuse(self, node, input_data: Any) -> Optional[Tuple[List[Any], bool, Optional[str]]]:
+        """
+        增量执行：计算节点指纹，命中上次的结果时直接写入执行记录，
+        返回与 run_node 相同格式的结果；未命中返回 None，节点照常执行
+        """
+        upstream = self.state.take_sources(node.id)
+        if self.incremental is None:
+            return None
+        fingerprint = self.incremental.fingerprint(node.id, upstream, input_data, self.context.global_data)
+        result = self.incremental.lookup(node, fingerprint)
+        if result is None:
+            return None
+        status, input, output = result
+        self.context.record_execution(node.id, status, input, output)
+        return node.successors_for_output(output) or [], True, None
+
+    def _wait_timeout(self) -> float:
+        """距离最近的截止时间（汇聚、节点超时、运行超时）还有多久，最长等待 STOP_POLL_INTERVAL"""
+        deadlines = [deadline for deadline in (self.state.next_deadline(), self._next_node_deadline(),
+                                               self.deadline) if deadline is not None]
+        if not deadlines:
+            return STOP_POLL_INTERVAL
+        return min(STOP_POLL_INTERVAL, max(0.0, min(deadlines) - time.monotonic()))
+
+    def _next_node_deadline(self) -> Optional[float]:
+        return None
+
+    def _stopping(self) -> bool:
+        """是否应当停止调度：外部停止或者超过运行截止时间"""
+        if self.deadline is not None and not self.timed_out and time.monotonic() >= self.deadline:
+            self.timed_out = True
+            self.stop_event.set()
+        return self.stop_event.is_set()
+
+    def _collect(self, node, result) -> List[Tuple]:
+        """
+        处理一个节点的执行结果，返回需要触发的回调参数列表。
+        已被取消的节点的迟到结果直接丢弃。
+        """
+        if node.id in self.cancelled:
+            return []
+        next_nodes, is_success, error = result
+
+        # 获取执行结果
+        input, output = _node_result(self.context, node.id)
+        events = [(node.id, is_success, input, output, error)]
+        record = self.context.get_node_history(node.id)
+        status = record['status'] if record is not None else ("completed" if is_success else "failed")
+        if self.incremental is not None and is_success:
+            self.incremental.remember(node.id, status, input, output)
+        if self.incremental is not None and node.id in self.incremental.reused:
+            status = "reused"
+        self.failed = self.failed or not is_success
+        timing = self.timings.pop(node.id, None)
+        self.metrics.observe_node(node, status, timing, input, output)
+        if self.trace is not None:
+            self.trace.node_span(node, status, timing)
+
+        self.state.complete(node.id, output, next_nodes)
+        if self.checkpoint is not None:
+            self._checkpoint(node.id, is_success, input, output, error,
+                             [next_node.id for next_node in next_nodes if next_node])
+        return events + self._collect_cancelled()
+
+    def _collect_cancelled(self) -> List[Tuple]:
+        return [self._mark_cancelled(node_id, "汇聚节点已满足条件，分支被取消")
+                for node_id in self.state.take_cancelled()]
+
+    def _cancel_remaining(self) -> List[Tuple]:
+        """
+        运行被停止或超时：正在执行和已就绪但还未开始的节点都标记为取消。
+        这些取消不写入检查点，从检查点恢复时会重新执行它们。
+        """
+        error = "工作流运行超时，节点被取消" if self.timed_out else "工作流已停止，节点被取消"
+        pending = list(self._running()) + [node.id for node, _ in self.state.ready]
+        self.state.ready.clear()
+        return [self._mark_cancelled(node_id, error, checkpoint=False)
+                for node_id in pending if node_id not in self.cancelled]
+
+    def _mark_cancelled(self, node_id: str, error: str, checkpoint: bool = True) -> Tuple:
+        self.cancelled.add(node_id)
+        self._cancel_running(node_id)
+        self.context.record_execution(node_id, "cancelled", None, {"error": error})
+        # 线程中无法中断的节点之后写入的执行记录被忽略
+        self.context.abandoned.add(node_id)
+        timing = self.timings.pop(node_id, None)
+        self.metrics.observe_node(self.state.nodes[node_id], "cancelled", None)
+        if self.trace is not None:
+            self.trace.node_span(self.state.nodes[node_id], "cancelled", timing)
+        if checkpoint and self.checkpoint is not None:
+            self._checkpoint(node_id, False, None, {"error": error}, error, [])
+        return node_id, False, None, {"error": error}, error
+
+    def _checkpoint(self, node_id: str, is_success: bool, input: Any, output: Any,
+                    error: Optional[str], next_ids: List[str]):
+        record = self.context.get_node_history(node_id)
+        status = record['status'] if record is not None else ("completed" if is_success else "failed")
+        frontier = [node.id for node, _ in self.state.ready] + list(self._running())
+        self.checkpoint.node_finished(node_id, status, is_success, input, output, error,
+                                      next_ids, frontier, self.context.global_data)
+
+    def _settle(self, events: List[Tuple]):
+        """回调已经拿到完整结果，之后执行记录可以按保留策略释放"""
+        for event in events:
+            self.context.settle(event[0])
+        for node_id in self.state.take_skipped():
+            self.context.settle(node_id)
+
+    def _timing(self, node) -> NodeTiming:
+        timing = self.timings[node.id] = NodeTiming(self.state.ready_at.pop(node.id, None))
+        return timing
+
+    def _finish_run(self):
+        if self.timed_out:
+            status = "timeout"
+        elif self.stop_event.is_set() or self.aborted:
+            status = "stopped"
+        else:
+            status = "failed" if self.failed else "completed"
+        self.status = status
+        self.metrics.finish(status)
+        if self.trace is not None:
+            self.trace.finish(status)
+
+    def _running(self):
+        return ()
+
+    def _cancel_running(self, node_id: str):
+        pass
+
+
+class _InlineExecutor:
+    """在调用线程中直接执行，返回已完成的 Future"""
+
+    @staticmethod
+    def submit(fn, *args) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+class DagScheduler(_SchedulerBase):
+    """
+    基于依赖关系的并行调度器，就绪节点提交到进程级线程池，同时执行的节点数不超过 max_workers
+
+    inline=True 时节点在调用线程中依次执行，不使用线程池：映射节点的每个元素已经占用一个线程，
+    子运行不再为自己的节点另开线程。此时节点超时无法生效，由外层节点的超时约束。
+    """
+
+    def __init__(self, workflow, on_node_complete: Optional[Callable] = None,
+                 stop_event: Optional[Event] = None, max_workers: int = MAX_PARALLEL_NODES,
+                 inline: bool = False, **kwargs):
+        super().__init__(workflow, on_node_complete, stop_event, **kwargs)
+        self.max_workers = max_workers
+        self.inline = inline
+        self.futures: Dict[str, Any] = {}
+        self.node_deadlines: Dict[str, Tuple[float, Any]] = {}  # 设置了超时的节点的 (截止时间, 输入)
+
+    def run(self):
+        state = self.state
+        state.start()
+        self._emit(self._restore())
+
+        # 工作线程完成后把结果放入队列，保证回调按完成顺序触发
+        finished: "queue.Queue" = queue.Queue()
+        pool = _InlineExecutor() if self.inline else sync_node_executor
+        # 本次运行占用的线程数，节点完成（或取消成功）时归还
+        slots = BoundedSemaphore(self.max_workers)
+
+        def submit(node, input_data):
+            reused = self._try_reuse(node, input_data)
+            if reused is not None:
+                future = Future()
+                future.set_result(reused)
+            else:
+                future = pool.submit(run_node, node, self.context, input_data,
+                                     self.metrics, self._timing(node), self.trace)
+                timeout = node_timeout(node)
+                if timeout is not None:
+                    self.node_deadlines[node.id] = (time.monotonic() + timeout, input_data)
+            self.futures[node.id] = future
+
+            def done(f):
+                slots.release()
+                finished.put((node, f))
+            future.add_done_callback(done)
+
+        try:
+            while not self._stopping():
+                while state.ready and slots.acquire(blocking=False):
+                    submit(*state.ready.popleft())
+
+                if not self.futures and not state.ready:
+                    if state.release_stalled():
+                        continue
+                    break
+
+                # 名额被超时节点仍在运行的线程占满时，同样在这里等待它们结束
+                try:
+                    node, future = finished.get(timeout=self._wait_timeout())
+                except queue.Empty:
+                    state.expire()
+                    events = self._collect_cancelled() + self._expire_nodes()
+                else:
+                    # 已取消或超时的节点的迟到结果直接丢弃
+                    if self.futures.get(node.id) is not future:
+                        continue
+                    del self.futures[node.id]
+                    self.node_deadlines.pop(node.id, None)
+                    events = self._collect(node, future.result())
+
+                self._emit(events)
+            if self.stop_event.is_set():
+                self._emit(self._cancel_remaining())
+        finally:
+            # 被取消或超时的节点所在线程可能仍在运行，不等待它们结束；
+            # 同步节点读取流式响应时会检查 context.cancel_event 提前退出
+            for future in self.futures.values():
+                future.cancel()
+            self._finish_run()
+
+    def _next_node_deadline(self) -> Optional[float]:
+        return min(deadline for deadline, _ in self.node_deadlines.values()) if self.node_deadlines else None
+
+    def _expire_nodes(self) -> List[Tuple]:
+        """超时的节点按失败处理，执行它的线程无法中断，结果到达后被丢弃"""
+        now = time.monotonic()
+        events = []
+        for node_id, (deadline, input_data) in list(self.node_deadlines.items()):
+            if deadline > now:
+                continue
+            del self.node_deadlines[node_id]
+            node = self.state.nodes[node_id]
+            self.futures.pop(node_id).cancel()
+            timing = self.timings.get(node_id)
+            if timing is not None and timing.started is not None:
+                timing.finish()
+            error = timeout_error(node_timeout(node))
+            self.context.record_execution(node_id, "failed", input_data, {"error": error})
+            self.context.abandoned.add(node_id)
+            events += self._collect(node, ([], False, error))
+        return events
+
+    def _emit(self, events: List[Tuple]):
+        """触发回调"""
+        if self.on_node_complete:
+            for event in events:
+                self.on_node_complete(*event)
+        self._settle(events)
+
+    def _running(self):
+        return self.futures.keys()
+
+    def _cancel_running(self, node_id: str):
+        # 线程中的节点无法中断，只能取消尚未开始的任务，迟到的结果会被丢弃
+        self.node_deadlines.pop(node_id, None)
+        future = self.futures.pop(node_id, None)
+        if future is not None:
+            future.cancel()
+
+
+class AsyncDagScheduler(_SchedulerBase):
+    """
+    DagScheduler 的异步版本，直接运行在调用方的事件循环上
+
+    节点以 asyncio 任务执行，等待网络时不占用线程；
+    只实现了同步 execute 的节点由 Node.aexecute 回退到 sync_node_executor。
+    """
+
+    def __init__(self, workflow, on_node_complete: Optional[Callable] = None,
+                 stop_event: Optional[Event] = None, max_concurrency: int = MAX_PARALLEL_NODES, **kwargs):
+        super().__init__(workflow, on_node_complete, stop_event, **kwargs)
+        self.max_concurrency = max_concurrency
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.cancelling: List[asyncio.Future] = []  # 已取消、还在收尾的节点任务
+
+    async def run(self):
+        state = self.state
+        state.start()
+        await self._emit(self._restore())
+
+        finished: asyncio.Queue = asyncio.Queue()
+        getter: Optional[asyncio.Task] = None
+
+        def submit(node, input_data):
+            reused = self._try_reuse(node, input_data)
+            if reused is not None:
+                task = asyncio.get_running_loop().create_future()
+                task.set_result(reused)
+            else:
+                task = asyncio.create_task(arun_node(node, self.context, input_data,
+                                                     self.metrics, self._timing(node), self.trace))
+            self.tasks[node.id] = task
+            task.add_done_callback(lambda t: finished.put_nowait((node, t)))
+
+        try:
+            while not self._stopping():
+                while state.ready and len(self.tasks) < self.max_concurrency:
+                    submit(*state.ready.popleft())
+
+                if not self.tasks:
+                    if state.release_stalled():
+                        continue
+                    break
+
+                if getter is None and not finished.empty():
+                    # 已有结果时直接取出，不创建等待任务和定时器
+                    done = True
+                    node, task = finished.get_nowait()
+                else:
+                    # 保留未完成的 get 任务，超时后下一轮继续等待，避免丢失结果
+                    if getter is None:
+                        getter = asyncio.ensure_future(finished.get())
+                    done, _ = await asyncio.wait({getter}, timeout=self._wait_timeout())
+                    if done:
+                        node, task = getter.result()
+                        getter = None
+                if not done:
+                    state.expire()
+                    events = self._collect_cancelled()
+                else:
+                    # 已取消的节点的迟到结果直接丢弃
+                    if self.tasks.get(node.id) is not task:
+                        continue
+                    del self.tasks[node.id]
+                    events = self._collect(node, task.result())
+
+                await self._emit(events)
+            if self.stop_event.is_set():
+                await self._emit(self._cancel_remaining())
+        except asyncio.CancelledError:
+            # 调用方取消了整个运行（如客户端断开）。stop_event 可能与外层运行共用（映射节点的子运行），这里不置位
+            self.aborted = True
+            raise
+        finally:
+            if getter is not None:
+                getter.cancel()
+            # 调用方取消时来不及回调，只记录执行记录、指标和时间线
+            self._cancel_remaining()
+            # 等被取消的节点中断 HTTP 请求、归还并发名额后再返回，避免连续运行时积压
+            pending = [task for task in self.cancelling if not task.done()]
+            if pending:
+                await asyncio.wait(pending, timeout=CANCEL_GRACE)
+            self._finish_run()
+
+    async def _emit(self, events: List[Tuple]):
+        """触发回调，回调可以是普通函数或协程函数"""
+        if self.on_node_complete:
+            for event in events:
+                result = self.on_node_complete(*event)
+                if inspect.isawaitable(result):
+                    await result
+        self._settle(events)
+
+    def _running(self):
+        return self.tasks.keys()
+
+    def _cancel_running(self, node_id: str):
+        task = self.tasks.pop(node_id, None)
+        if task is not None:
+            task.cancel()
+            self.cancelling.append(task)
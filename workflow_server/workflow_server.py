@@ -1,13 +1,27 @@
-from collections import deque
 from workflow import Workflow
+from workflow_scheduler import DagScheduler, AsyncDagScheduler
 import asyncio
-import json
-from concurrent.futures import ThreadPoolExecutor
+import uuid
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, WebSocket, HTTPException
 from threading import Event
-from fastapi.responses import HTMLResponse
+from typing import Dict, Any, Optional, List
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from workflow_db import router as workflow_router
+from workflow_cache import llm_cache
+from workflow_http import http_sessions
+from workflow_singleflight import single_flight
+from workflow_limiter import endpoint_limiters
+from workflow_history import HistoryRetention
+from workflow_checkpoint import RunCheckpoint, get_checkpoint_store
+from workflow_incremental import IncrementalRun, result_store
+from workflow_log import get_logger
+from workflow_metrics import metrics
+from workflow_trace import RunTrace
+from extract_var import template_cache
+from workflow_response import plain
+from workflow_codec import dumpb, dumps, loads
+from multienv import multienv
 
 # 原有工作流相关代码保持不变，此处省略...
 # （将用户提供的所有类定义放在这里）
@@ -21,8 +35,6 @@ app.add_middleware(
 )
 app.include_router(workflow_router)
 
-executor = ThreadPoolExecutor()
-
 # 示例工作流配置
 example_workflow = {
     "nodes": [
@@ -76,48 +88,47 @@ example_workflow = {
 }
 
 
+log = get_logger("server")
+
+# 结果已通过 websocket 实时发出，服务端默认只保留仍会被引用的执行记录
+SERVER_HISTORY_RETENTION = multienv.get("WORKFLOW_SERVER_HISTORY_RETENTION", "live")
+
+
 class StoppableWorkflow(Workflow):
     def __init__(self, *args, **kwargs):
         super().__init__(*args,  **kwargs)
         self.stop_event = Event()
+        self.context.retention = HistoryRetention(SERVER_HISTORY_RETENTION, self.plan)
+        self.checkpoint: Optional[RunCheckpoint] = None  # 开启检查点时每个节点完成后持久化
+        self.replay: Optional[List[Dict[str, Any]]] = None  # 从检查点恢复时重放的节点记录
+        self.incremental: Optional[IncrementalRun] = None  # 增量执行时复用指纹相同的节点结果
+        self.trace: Optional[RunTrace] = None  # 记录时间线，运行结束后保存到检查点数据库
+        self.timeout: Optional[float] = None  # 运行超时（秒），None 时使用 WORKFLOW_RUN_TIMEOUT
+        self.status: Optional[str] = None  # 调度器给出的运行结果：completed / failed / stopped / timeout
 
     def execute(self, on_node_complete=None):
         if not self.start_node:
             return
 
-        queue = deque([(self.start_node, None)])
-        visited = set([self.start_node.id])
+        scheduler = DagScheduler(self, on_node_complete, self.stop_event,
+                                 checkpoint=self.checkpoint, replay=self.replay, incremental=self.incremental,
+                                 trace=self.trace, timeout=self.timeout)
+        try:
+            scheduler.run()
+        finally:
+            self.status = scheduler.status
 
-        while queue and not self.stop_event.is_set():
-            current_node, current_input = queue.popleft()
+    async def aexecute(self, on_node_complete=None):
+        if not self.start_node:
+            return
 
-            try:
-                next_step_nodes = current_node.execute(
-                    self.context, current_input)
-                is_success = True
-                error = None
-            except Exception as e:
-                self.context.record_execution(
-                    current_node.id, "failed", current_input, {"error": str(e)})
-                is_success = False
-                error = str(e)
-                next_step_nodes = []
-
-            # 获取执行结果
-            node_history = self.context.get_node_history(current_node.id)
-            input = node_history.get('input') if node_history else None
-            output = node_history.get('output') if node_history else None
-
-            # 触发回调
-            if on_node_complete:
-                on_node_complete(current_node.id, is_success,
-                                 input, output, error)
-
-            # 处理后续节点
-            for next_node in next_step_nodes:
-                if next_node and next_node.id not in visited:
-                    queue.append((next_node, output))
-                    visited.add(next_node.id)
+        scheduler = AsyncDagScheduler(self, on_node_complete, self.stop_event,
+                                      checkpoint=self.checkpoint, replay=self.replay,
+                                      incremental=self.incremental, trace=self.trace, timeout=self.timeout)
+        try:
+            await scheduler.run()
+        finally:
+            self.status = scheduler.status
 
 
 @app.websocket("/workflow/runtime/{workflow_id}")
@@ -128,12 +139,96 @@ async def websocket_endpoint(websocket: WebSocket, workflow_id: str):
     # # 读取JSON文件
     # with open('workflow.json', 'r', encoding='utf-8') as f:
     #     workflow_data = json.load(f)
-    data = await websocket.receive_json()
-    workflow_data = json.loads(data)
+    # 前端把工作流 JSON 作为字符串再编码一次发送，直接发送的 JSON 对象同样接受
+    workflow_data = loads(await websocket.receive_text())
+    if isinstance(workflow_data, str):
+        workflow_data = loads(workflow_data)
 
     workflow = StoppableWorkflow(workflow_data)
-    loop = asyncio.get_event_loop()
+    workflow.metrics_label = workflow_id
+    first_messages = []
+    if websocket.query_params.get("checkpoint") == "1":
+        # 检查点模式：断线或服务重启后可以通过 runId 恢复
+        store = get_checkpoint_store()
+        run_id = store.start_run(workflow_data, workflow.plan.fingerprint)
+        workflow.checkpoint = RunCheckpoint(store, run_id)
+        first_messages.append({"event": "checkpoint", "runId": run_id})
+    if websocket.query_params.get("incremental") == "1":
+        # 增量模式：配置和输入都没有变化的节点直接复用上次（data.runtime 或服务端）的结果
+        workflow.incremental = IncrementalRun(workflow.plan, IncrementalRun.runtime_of(workflow_data))
+    if websocket.query_params.get("trace") == "1":
+        # 时间线与检查点共用 runId，未开启检查点时单独分配
+        run_id = workflow.checkpoint.run_id if workflow.checkpoint is not None else uuid.uuid4().hex
+        workflow.trace = RunTrace(run_id, workflow_id)
+        first_messages.append({"event": "trace", "runId": run_id})
+    workflow.timeout = query_timeout(websocket)
+
+    await run_over_websocket(websocket, workflow, first_messages)
+
+
+@app.websocket("/workflow/runtime/{workflow_id}/resume/{run_id}")
+async def resume_endpoint(websocket: WebSocket, workflow_id: str, run_id: str):
+    """从检查点恢复运行：已完成的节点结果重新推送，其余节点继续执行"""
+    await websocket.accept()
+
+    store = get_checkpoint_store()
+    loop = asyncio.get_running_loop()
+    run = await loop.run_in_executor(None, store.load_run, run_id)
+    if run is None:
+        await websocket.send_json({"event": "error", "error": f"检查点不存在: {run_id}"})
+        await websocket.close()
+        return
+    nodes = await loop.run_in_executor(None, store.load_nodes, run_id)
+
+    workflow = StoppableWorkflow(run['workflow'])
+    workflow.metrics_label = workflow_id
+    workflow.context.global_data = run['global_data']
+    workflow.replay = nodes
+    workflow.checkpoint = RunCheckpoint(store, run_id, nodes[-1]['seq'] + 1 if nodes else 0)
+    store.update_run(run_id, status="running")
+    if websocket.query_params.get("trace") == "1":
+        # 恢复后的时间线覆盖之前保存的
+        workflow.trace = RunTrace(run_id, workflow_id)
+    workflow.timeout = query_timeout(websocket)
+
+    await run_over_websocket(websocket, workflow,
+                             [{"event": "checkpoint", "runId": run_id, "resumed": True}])
+
+
+@app.get("/api/runs/{run_id}")
+async def get_run(run_id: str):
+    """查看检查点中的运行状态"""
+    store = get_checkpoint_store()
+    loop = asyncio.get_running_loop()
+    run = await loop.run_in_executor(None, store.load_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="检查点不存在")
+    nodes = await loop.run_in_executor(None, store.load_nodes, run_id)
+    run.pop('workflow')
+    run['nodes'] = [{'seq': node['seq'], 'nodeId': node['node_id'], 'status': node['status']}
+                    for node in nodes]
+    return run
+
+
+def query_timeout(websocket: WebSocket) -> Optional[float]:
+    """?timeout=秒 覆盖本次运行的超时时间，0 表示不限制，缺省或无效时使用 WORKFLOW_RUN_TIMEOUT"""
+    try:
+        return float(websocket.query_params["timeout"])
+    except (KeyError, ValueError):
+        return None
+
+
+async def run_over_websocket(websocket: WebSocket, workflow: StoppableWorkflow,
+                             first_messages: Optional[List[Dict[str, Any]]] = None):
+    """在当前事件循环上执行工作流，并把节点结果和运行中事件按顺序推送给前端"""
+    loop = asyncio.get_running_loop()
     queue = asyncio.Queue()
+    for message in first_messages or []:
+        queue.put_nowait(message)
+
+    def post(message):
+        # 流式文本等事件可能来自线程池中的同步节点，统一经事件循环入队以保持顺序
+        loop.call_soon_threadsafe(queue.put_nowait, message)
 
     def on_node_complete(node_id, is_success, input, output, error):
         message = {
@@ -144,29 +239,136 @@ async def websocket_endpoint(websocket: WebSocket, workflow_id: str):
         }
         if error:
             message["error"] = error
-        asyncio.run_coroutine_threadsafe(queue.put(message), loop)
+        if workflow.incremental is not None:
+            record = workflow.context.get_node_history(node_id)
+            fingerprint = workflow.incremental.fingerprint_of(node_id, record['status'] if record else None)
+            if fingerprint:
+                # 前端保存在 runtime 中，下次运行时回传
+                message["fingerprint"] = fingerprint
+            if node_id in workflow.incremental.reused:
+                message["reused"] = True
+        post(message)
 
-    # 在后台线程中执行工作流
-    def run_workflow():
+    workflow.context.event_sink = post
+
+    # API 响应默认只推送预览，?fullBody=1 时推送完整内容；
+    # 增量模式复用的完整结果保存在服务端 ResultStore 中，前端回传的预览不会被复用
+    full_body = websocket.query_params.get("fullBody") == "1"
+
+    # ?binary=1 时以二进制帧发送编码后的字节，省去字节到字符串的转换
+    binary = websocket.query_params.get("binary") == "1"
+
+    def encode(value):
+        return plain(value, full_body)
+
+    # 直接在当前事件循环上异步执行工作流
+    async def run_workflow():
+        status = "interrupted"
         try:
-            workflow.execute(on_node_complete)
+            await workflow.aexecute(on_node_complete)
+            if workflow.status == "timeout":
+                status = "timeout"
+                post({"event": "error", "error": "工作流运行超时"})
+            elif not workflow.stop_event.is_set():
+                status = "completed"
         finally:
-            asyncio.run_coroutine_threadsafe(queue.put(None), loop)  # 结束信号
+            if workflow.checkpoint is not None:
+                workflow.checkpoint.finish(status)
+            if workflow.trace is not None:
+                get_checkpoint_store().save_trace(workflow.trace.run_id, workflow.trace.to_chrome())
+            post(None)  # 结束信号
+
+    task = asyncio.create_task(run_workflow())
+    disconnected = False
+
+    async def watch_disconnect():
+        # 运行期间前端不再发送消息；断开后立即取消运行，进行中的请求随之中断，不必等到下一次推送失败
+        nonlocal disconnected
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        disconnected = True
+        workflow.stop_event.set()
+        task.cancel()
+        queue.put_nowait(None)
 
-    future = loop.run_in_executor(executor, run_workflow)
+    watcher = asyncio.create_task(watch_disconnect())
 
     try:
         while True:
             message = await queue.get()
             if message is None:
                 break
-            await websocket.send_json(message)
+            if binary:
+                await websocket.send_bytes(dumpb(message, encode))
+            else:
+                await websocket.send_text(dumps(message, encode))
     except Exception as e:
-        print(f"连接异常: {e}")
+        log.warning("ws.error", error=e)
     finally:
-        workflow.stop_event.set()
-        future.cancel()
-        await websocket.close()
+        watcher.cancel()
+        if disconnected:
+            log.info("ws.disconnected", cancelled=True, workflow=workflow.metrics_label)
+        else:
+            workflow.stop_event.set()
+            task.cancel()
+            try:
+                await websocket.close()
+            except RuntimeError:
+                # 推送失败时连接可能已经关闭
+                pass
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """大模型响应缓存的命中统计"""
+    return llm_cache.stats()
+
+
+@app.get("/api/http/stats")
+async def http_stats():
+    """各主机 HTTP 连接池的复用与排队情况"""
+    return http_sessions.stats()
+
+
+@app.get("/api/singleflight/stats")
+async def singleflight_stats():
+    """相同请求合并的统计"""
+    return single_flight.stats()
+
+
+@app.get("/api/limiter/stats")
+async def limiter_stats():
+    """各模型后端的并发窗口与排队情况"""
+    return endpoint_limiters.stats()
+
+
+@app.get("/api/runs/{run_id}/trace")
+async def get_run_trace(run_id: str):
+    """运行的时间线（Chrome Trace Event JSON，可直接导入 Perfetto）"""
+    store = get_checkpoint_store()
+    loop = asyncio.get_running_loop()
+    trace = await loop.run_in_executor(None, store.load_trace, run_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="时间线不存在")
+    return trace
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """节点耗时、排队时间、数据量、运行吞吐与并发等指标（Prometheus 文本格式）"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/templates/stats")
+async def templates_stats():
+    """${...} 模板编译缓存的命中统计"""
+    return template_cache.stats()
+
+
+@app.get("/api/results/stats")
+async def results_stats():
+    """增量执行结果复用的统计"""
+    return result_store.stats()
 
 
 @app.get("/")
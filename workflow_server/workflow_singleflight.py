@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import json
+from concurrent.futures import Future
+from threading import Lock
+from typing import Dict, Any, Callable, Awaitable, Tuple
+
+from multienv import multienv
+
+
+SINGLE_FLIGHT_ENABLED = multienv.get("SINGLE_FLIGHT_ENABLED", "1") == "1"
+
+# 默认合并的幂等请求方法
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+
+
+class RunCancelled(Exception):
+    """
+    调用方自己的运行已被停止（线程中的同步请求据此提前退出）
+
+    与 asyncio.CancelledError 一样只属于当前调用方：合并请求时不分享给其它等待者，
+    限流器也不把它当作后端拥塞。
+    """
+
+
+def flight_key(request: Any) -> str:
+    """请求参数的规范化哈希"""
+    canonical = json.dumps(request, sort_keys=True, ensure_ascii=False,
+                           separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """
+    相同请求合并
+
+    同一个键的请求正在进行时，后来的调用方不再单独发送，而是等待并共享
+    首个请求（leader）的结果或异常。请求结束后键立即释放，不做结果缓存。
+    leader 因自己的运行停止（RunCancelled）而中断时，等待者重新发起请求。
+    同步调用（线程）与异步调用（事件循环）各自维护在途表。
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Future] = {}
+        self._async_flights: Dict[str, list] = {}  # key -> [task, 等待者数量]
+        self._lock = Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        执行或加入一次请求
+        :return: (结果, 是否为共享的结果)
+        """
+        while True:
+            with self._lock:
+                future = self._flights.get(key)
+                leader = future is None
+                if leader:
+                    future = self._flights[key] = Future()
+                    self.leaders += 1
+                else:
+                    self.shared += 1
+            if leader:
+                break
+            try:
+                return future.result(), True
+            except RunCancelled:
+                # leader 的运行被停止，与本次调用无关，由自己（或其它等待者）重新发起
+                with self._lock:
+                    self.shared -= 1
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._release(key)
+            future.set_exception(e)
+            raise
+        self._release(key)
+        future.set_result(result)
+        return result, False
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        异步版本。请求在独立任务中执行，单个调用方被取消不影响其它等待者；
+        所有等待者都取消后才取消请求本身。
+        """
+        loop = asyncio.get_running_loop()
+        flight = self._async_flights.get(key)
+        leader = flight is None or flight[0].get_loop() is not loop
+        if leader:
+            task = loop.create_task(fn())
+            flight = self._async_flights[key] = [task, 0]
+            task.add_done_callback(lambda _: self._release_async(key, flight))
+        with self._lock:
+            if leader:
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        flight[1] += 1
+        try:
+            return await asyncio.shield(flight[0]), not leader
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not flight[0].done():
+                flight[0].cancel()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            in_flight = len(self._flights)
+        return {'leaders': self.leaders, 'shared': self.shared,
+                'in_flight': in_flight + len(self._async_flights)}
+
+    def _release(self, key: str):
+        with self._lock:
+            self._flights.pop(key, None)
+
+    def _release_async(self, key: str, flight: list):
+        if self._async_flights.get(key) is flight:
+            del self._async_flights[key]
+
+
+# 全局实例
+single_flight = SingleFlight()
@@ -0,0 +1,152 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Dict, Any, Optional, List, Tuple
+
+from multienv import multienv
+
+
+# 单次运行最多记录的事件数，超出后丢弃并在元数据中计数
+TRACE_MAX_EVENTS = int(multienv.get("WORKFLOW_TRACE_MAX_EVENTS", "100000"))
+
+# 当前正在执行的节点所属的 (RunTrace, 节点ID)，HTTP 子区间据此挂到节点下
+current_span: ContextVar[Optional[Tuple['RunTrace', str]]] = ContextVar('workflow_trace_span', default=None)
+
+
+class RunTrace:
+    """
+    单次运行的时间线，导出为 Chrome Trace Event JSON（可用 Perfetto / chrome://tracing 打开）
+
+    每个节点执行一个区间（cat=node），之前的排队时间一个区间（cat=wait），
+    节点内的 HTTP 请求作为子区间（cat=http）。时间取 time.monotonic()，
+    导出时换算成相对运行开始的微秒，并把互相重叠的节点分配到不同的行（tid）。
+    """
+
+    def __init__(self, run_id: str, name: str = "workflow", max_events: int = TRACE_MAX_EVENTS):
+        self.run_id = run_id
+        self.name = name
+        self.max_events = max_events
+        self.origin = time.monotonic()
+        self.wall_start = time.time()
+        self.finished: Optional[float] = None
+        self.status: Optional[str] = None
+        self.dropped = 0
+        self._spans: List[Dict[str, Any]] = []
+        self._lock = Lock()
+
+    def add_span(self, name: str, cat: str, start: float, end: float, node_id: Optional[str] = None,
+                 args: Optional[Dict[str, Any]] = None):
+        span = {'name': name, 'cat': cat, 'start': start, 'end': end, 'node': node_id, 'args': args or {}}
+        with self._lock:
+            if len(self._spans) >= self.max_events:
+                self.dropped += 1
+                return
+            self._spans.append(span)
+
+    def node_span(self, node, status: Optional[str], timing=None):
+        """调度器处理完节点结果后调用，timing 为 workflow_metrics.NodeTiming"""
+        args = {'node_id': node.id, 'type': node.type, 'status': status}
+        if timing is None or timing.started is None:
+            # 复用、取消等没有真正执行的节点只留一个瞬时标记
+            now = time.monotonic()
+            self.add_span(f"{node.label or node.id}", 'node', now, now, node.id, args)
+            return
+        finished = timing.finished if timing.finished is not None else time.monotonic()
+        if timing.queued_at is not None and timing.started > timing.queued_at:
+            self.add_span("wait", 'wait', timing.queued_at, timing.started, node.id, {'node_id': node.id})
+        self.add_span(f"{node.label or node.id}", 'node', timing.started, finished, node.id, args)
+
+    def finish(self, status: str):
+        self.finished = time.monotonic()
+        self.status = status
+
+    def to_chrome(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = list(self._spans)
+        end = self.finished if self.finished is not None else time.monotonic()
+        lanes = self._assign_lanes(spans)
+
+        def us(t: float) -> float:
+            return round((t - self.origin) * 1e6, 3)
+
+        events = [
+            {'ph': 'M', 'name': 'process_name', 'pid': 1, 'tid': 0, 'args': {'name': self.name}},
+            {'ph': 'M', 'name': 'thread_name', 'pid': 1, 'tid': 0, 'args': {'name': 'run'}},
+            {'ph': 'X', 'name': 'run', 'cat': 'run', 'pid': 1, 'tid': 0, 'ts': 0, 'dur': us(end),
+             'args': {'run_id': self.run_id, 'status': self.status}},
+        ]
+        for lane in sorted(set(lanes.values())):
+            events.append({'ph': 'M', 'name': 'thread_name', 'pid': 1, 'tid': lane,
+                           'args': {'name': f"lane {lane}"}})
+            events.append({'ph': 'M', 'name': 'thread_sort_index', 'pid': 1, 'tid': lane,
+                           'args': {'sort_index': lane}})
+        for span in spans:
+            event = {'ph': 'X', 'name': span['name'], 'cat': span['cat'], 'pid': 1,
+                     'tid': lanes.get(span['node'], 0), 'ts': us(span['start']),
+                     'dur': round((span['end'] - span['start']) * 1e6, 3), 'args': span['args']}
+            if span['end'] == span['start'] and span['cat'] == 'node':
+                event.update(ph='i', s='t')
+                del event['dur']
+            events.append(event)
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'metadata': {'run_id': self.run_id, 'workflow': self.name, 'status': self.status,
+                         'start_time': self.wall_start, 'dropped_events': self.dropped},
+        }
+
+    @staticmethod
+    def _assign_lanes(spans: List[Dict[str, Any]]) -> Dict[str, int]:
+        """按节点的 [开始排队, 结束] 区间贪心分配行号，同一节点的排队、执行和 HTTP 子区间在同一行"""
+        extents: Dict[str, List[float]] = {}
+        for span in spans:
+            if span['node'] is None:
+                continue
+            extent = extents.setdefault(span['node'], [span['start'], span['end']])
+            extent[0] = min(extent[0], span['start'])
+            extent[1] = max(extent[1], span['end'])
+
+        lanes: Dict[str, int] = {}
+        lane_ends: List[float] = []
+        for node_id, (start, end) in sorted(extents.items(), key=lambda item: item[1][0]):
+            for index, lane_end in enumerate(lane_ends):
+                if lane_end <= start:
+                    lane_ends[index] = end
+                    lanes[node_id] = index + 1
+                    break
+            else:
+                lane_ends.append(end)
+                lanes[node_id] = len(lane_ends)
+        return lanes
+
+
+@contextmanager
+def node_scope(trace: Optional[RunTrace], node_id: str):
+    """在节点执行期间设置 current_span，节点内的 HTTP 请求会记到该节点下"""
+    if trace is None:
+        yield
+        return
+    token = current_span.set((trace, node_id))
+    try:
+        yield
+    finally:
+        current_span.reset(token)
+
+
+@contextmanager
+def http_span(method: str, url: str):
+    """记录一次 HTTP 请求（流式请求包括读取响应的时间），不在追踪中的请求没有开销"""
+    scope = current_span.get()
+    if scope is None:
+        yield
+        return
+    trace, node_id = scope
+    started = time.monotonic()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        trace.add_span(f"{method} {url}", 'http', started, time.monotonic(), node_id,
+                       {'method': method, 'url': url, 'outcome': outcome})
@@ -1,6 +1,7 @@
-import json
 from typing import Union, Dict, List, Any
 
+from workflow_codec import JSONDecodeError, loads
+
 def parse_string_2_multi(input_str: str) -> Union[Dict, List, int, float, str]:
     """
     解析输入字符串，可能返回 JSON 结构、整数、浮点数或字符串
@@ -26,8 +27,8 @@ def parse_string_2_multi(input_str: str) -> Union[Dict, List, int, float, str]:
     """
     # 尝试解析为 JSON
     try:
-        return json.loads(input_str)
-    except json.JSONDecodeError:
+        return loads(input_str)
+    except JSONDecodeError:
         pass
     
     # 尝试解析为整数